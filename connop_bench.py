@@ -0,0 +1,74 @@
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from model.network import *
+from model.connop import *
+from model.operations import OpSequence
+from model.savenet import scatter, grid
+
+
+def make_positions(density, area=(2000, 2000), gnb_grid=(10, 10)):
+    net = NetworkData()
+    net.channel = Channel(-100, area, (24, 40))
+    net.mcst = MCSTable(15, -7.744, 1.938, 0.879)
+    net.conns = dict()
+
+    x, y = scatter(*area, density)
+    net.ues = pd.DataFrame({'x': x, 'y': y, 'gain': 0., 'max_power': 30.})
+
+    x, y = grid(*area, *gnb_grid)
+    net.gnbs = pd.DataFrame({'x': x, 'y': y, 'gain': 10.})
+    return net
+
+
+def run(net, fusion, outputs=None):
+    OpSequence.fusion = fusion
+    op = (
+        DistanceCalc() &
+        DistanceWeight(1) &
+        FreeSpacePathloss() &
+        CalcMaxSnr() &
+        MinSnrFilter()
+    )
+    if outputs is not None:
+        op.outputs(*outputs)
+
+    ## tracing slows down allocations, so time and memory come from separate runs
+    wall_time = np.inf
+    for _ in range(3):
+        net.conns = dict()
+        start_time = time.perf_counter()
+        op.execute(net)
+        wall_time = min(wall_time, time.perf_counter() - start_time)
+
+    net.conns = dict()
+    tracemalloc.start()
+    op.execute(net)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return wall_time, peak, dict(net.conns)
+
+
+if __name__ == '__main__':
+    np.random.seed(0)
+    modes = {
+        'unfused': (False, None),
+        'fused': (True, None),
+        'fused, filter and max_snr': (True, ('filter', 'max_snr')),
+    }
+
+    print(f'{"mode":>26} {"UEs":>7} {"entries":>9} {"time (s)":>9} {"peak (MB)":>10} {"same":>5}')
+    for density in [0.001, 0.005, 0.02]:
+        net = make_positions(density)
+        _, _, expected = run(net, False)
+
+        for name, (fusion, outputs) in modes.items():
+            wall_time, peak, conns = run(net, fusion, outputs)
+            same = all(np.array_equal(conns[col], expected[col]) for col in conns)
+            print(
+                f'{name:>26} {len(net.ues):>7} {expected["distance"].size:>9} '
+                f'{wall_time:>9.3f} {peak / 2**20:>10.1f} {str(same):>5}'
+            )
+
+    OpSequence.fusion = True
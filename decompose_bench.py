@@ -0,0 +1,55 @@
+import time
+import numpy as np
+import pandas as pd
+from model.network import *
+from model.connop import *
+from model.savenet import scatter, grid
+from model.optimize import Optimize, NoSolutionException
+from model.decompose import DecomposedOptimize
+from model.milp import HighsBackend
+
+
+def make_network(density, area, gnb_grid):
+    net = NetworkData()
+    net.channel = Channel(-100, area, (24, 40))
+    net.mcst = MCSTable(2, 0, 2, 0.9)
+    net.conns = dict()
+
+    x, y = scatter(*area, density)
+    net.ues = pd.DataFrame({'x': x, 'y': y, 'gain': 0., 'demand': 1.5, 'max_power': 30.})
+    x, y = grid(*area, *gnb_grid)
+    net.gnbs = pd.DataFrame({'x': x, 'y': y, 'gain': 10.})
+
+    (DistanceCalc(300) & DistanceWeight(1) & FreeSpacePathloss() & CalcMaxSnr() & MinSnrFilter()).execute(net)
+    return net
+
+
+def timed(op, net):
+    start_time = time.perf_counter()
+    try:
+        op.execute(net)
+    except NoSolutionException:
+        return None, time.perf_counter() - start_time
+    return op.objective_value, time.perf_counter() - start_time
+
+
+if __name__ == '__main__':
+    np.random.seed(0)
+    density = 0.0002
+    print(
+        f'{"area":>6} {"UEs":>6} {"edges":>7} {"tiles":>6} {"mono (s)":>9} '
+        f'{"decomp (s)":>11} {"speedup":>8} {"gap":>8}'
+    )
+    for side, gnbs, tiles in ((400, 4, 2), (800, 8, 2), (1200, 12, 3), (1600, 16, 4)):
+        net = make_network(density, (side, side), (gnbs, gnbs))
+        edges = len(ConnectionFilter.of(net))
+
+        mono, mono_time = timed(Optimize(backend=HighsBackend(log_output=False)), net)
+        decomp, decomp_time = timed(DecomposedOptimize(
+            tiles=(tiles, tiles), workers=tiles * tiles, backend=HighsBackend(log_output=False)), net)
+
+        gap = '-' if mono is None or decomp is None else f'{(decomp - mono) / mono:.2%}'
+        print(
+            f'{side:>6} {len(net.ues):>6} {edges:>7} {tiles * tiles:>6} {mono_time:>9.2f} '
+            f'{decomp_time:>11.2f} {mono_time / decomp_time:>8.1f} {gap:>8}'
+        )
@@ -1,3 +1,5 @@
+import os
+import contextlib
 import matplotlib.pyplot as plot
 from model.operations import *
 from model.savenet import *
@@ -5,6 +7,7 @@ from model.connop import *
 from model.optimize import *
 from model.network import NetworkData
 from model.interference import PlotInterferenceApprox
+from model.trace import Tracer
 
 class PrintSnr(Operation):
     @requires(Tables.CONN, Cols.MAX_POW, Cols.PL)
@@ -17,15 +20,20 @@ if __name__ == '__main__':
     net = NetworkData()
 
     op = (
-        Load('data/test', force_init=True) &
+        Load('data/test', force_init=True, seed=0) &
         DistanceCalc() &
         DistanceWeight(1) &
         FreeSpacePathloss() &
         CalcMaxSnr() &
         MinSnrFilter() &
-        Optimize()
+        Optimize().cached()
     )
-    op.execute(net)
+    ## TRACE=trace.json python main.py writes a chrome trace of the run there
+    trace_file = os.environ.get('TRACE')
+    with Tracer() if trace_file else contextlib.nullcontext() as tracer:
+        op.execute(net)
+    if trace_file:
+        tracer.save_chrome(trace_file)
 
     BW = net.channel.bandwidth[1] - net.channel.bandwidth[0]
     mcst = MCSTable()
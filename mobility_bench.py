@@ -0,0 +1,78 @@
+import time
+import numpy as np
+import pandas as pd
+from model.network import *
+from model.connop import *
+from model.mobility import Mobility
+from model.savenet import scatter, grid
+
+
+def make_network(density, area=(2000, 2000), gnb_grid=(10, 10)):
+    net = NetworkData()
+    net.channel = Channel(-100, area, (24, 40))
+    net.mcst = MCSTable(15, -7.744, 1.938, 0.879)
+    net.conns = dict()
+
+    x, y = scatter(*area, density)
+    net.ues = pd.DataFrame({'x': x, 'y': y, 'gain': 0., 'max_power': 30.})
+
+    x, y = grid(*area, *gnb_grid)
+    net.gnbs = pd.DataFrame({'x': x, 'y': y, 'gain': 10.})
+    return net
+
+
+def chain(radius):
+    return DistanceCalc(radius) & FreeSpacePathloss() & CalcMaxSnr() & MinSnrFilter()
+
+
+def move(net, fraction, rng, step=20):
+    ## a random walk of step metres for a fraction of the UEs
+    moved = rng.choice(len(net.ues), int(fraction * len(net.ues)), replace=False)
+    area = net.channel.area
+    for col, size in (('x', area[0]), ('y', area[1])):
+        values = net.ues[col].values.copy()
+        values[moved] = np.clip(values[moved] + rng.uniform(-step, step, len(moved)), 0, size)
+        net.ues[col] = values
+    return moved
+
+
+def run(net, radius, fraction, steps=5):
+    rng = np.random.default_rng(0)
+    full_time, update_time = 0, 0
+    for _ in range(steps):
+        moved = move(net, fraction, rng)
+
+        ## the filter is part of the step, the optimizer needs it
+        start_time = time.perf_counter()
+        Mobility(chain(radius), moved=moved).execute(net)
+        ConnectionFilter.of(net)
+        update_time += time.perf_counter() - start_time
+
+        full = NetworkData()
+        full.channel, full.mcst, full.conns = net.channel, net.mcst, dict()
+        full.ues, full.gnbs = net.ues, net.gnbs
+        start_time = time.perf_counter()
+        chain(radius).execute(full)
+        ConnectionFilter.of(full)
+        full_time += time.perf_counter() - start_time
+
+    same = all(np.array_equal(net.conns[col], full.conns[col]) for col in full.conns)
+    return full_time / steps, update_time / steps, same
+
+
+if __name__ == '__main__':
+    np.random.seed(0)
+    print(f'{"table":>7} {"UEs":>7} {"moving":>7} {"full (ms)":>10} {"update (ms)":>12} {"speedup":>8} {"same":>5}')
+    for density in [0.005, 0.02]:
+        for radius in (None, 300):
+            net = make_network(density)
+            chain(radius).execute(net)
+            ConnectionFilter.of(net)
+
+            for fraction in (0.01, 0.1, 0.5):
+                full_time, update_time, same = run(net, radius, fraction)
+                print(
+                    f'{"dense" if radius is None else "sparse":>7} {len(net.ues):>7} {fraction:>7.0%} '
+                    f'{full_time * 1e3:>10.1f} {update_time * 1e3:>12.1f} '
+                    f'{full_time / update_time:>8.1f} {str(same):>5}'
+                )
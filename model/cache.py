@@ -0,0 +1,229 @@
+import os
+import sys
+import types
+import inspect
+import hashlib
+import dataclasses
+import numpy as np
+from model.operations import *
+from model.network import Tables, Cols
+from model.trace import log
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def constructor_params(obj):
+    ## the values the constructor was called with, by the repo convention of self.name = name
+    try:
+        params = inspect.signature(type(obj).__init__).parameters
+    except (TypeError, ValueError):
+        return {}
+    return {name: getattr(obj, name) for name in params if name != 'self' and hasattr(obj, name)}
+
+
+def digest(value, h):
+    if isinstance(value, np.ndarray):
+        h.update(f'{value.dtype.str}{value.shape}'.encode())
+        h.update(np.ascontiguousarray(value).view(np.uint8).data if value.size else b'')
+    elif isinstance(value, (list, tuple)):
+        h.update(f'{type(value).__name__}{len(value)}'.encode())
+        for item in value:
+            digest(item, h)
+    elif isinstance(value, dict):
+        h.update(f'dict{len(value)}'.encode())
+        for key in sorted(value, key=repr):
+            digest(key, h)
+            digest(value[key], h)
+    elif dataclasses.is_dataclass(value) and not isinstance(value, type):
+        h.update(repr(value).encode())
+    elif isinstance(value, (type, types.FunctionType)):
+        h.update(f'{value.__module__}.{value.__qualname__}'.encode())
+    elif isinstance(value, (str, bytes, bool, int, float, complex, type(None), np.generic)):
+        h.update(repr(value).encode())
+    else:
+        h.update(f'{type(value).__module__}.{type(value).__qualname__}'.encode())
+        digest(constructor_params(value), h)
+
+
+def code_version(cls):
+    ## sources of the local modules the class can reach through module globals
+    stack = [c.__module__ for c in cls.__mro__]
+    seen = set()
+    files = []
+    while stack:
+        name = stack.pop()
+        module = sys.modules.get(name)
+        file = getattr(module, '__file__', None)
+        if name in seen or file is None or not os.path.abspath(file).startswith(ROOT):
+            continue
+        seen.add(name)
+        files.append(file)
+        for value in vars(module).values():
+            if isinstance(value, types.ModuleType):
+                stack.append(value.__name__)
+            elif getattr(value, '__module__', None):
+                stack.append(value.__module__)
+
+    h = hashlib.sha256()
+    for file in sorted(files):
+        with open(file, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def operations(value):
+    ## value and the operations it holds in its constructor params, like the ops
+    ## of an OpSequence or the one a CachedOperation wraps
+    if isinstance(value, Operation):
+        yield value
+        value = constructor_params(value)
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, (list, tuple)):
+        for item in value:
+            yield from operations(item)
+
+
+class ResultCache:
+    def __init__(self, path='./.opcache', max_bytes=2**30):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.versions = {}
+
+
+    def key(self, op, net):
+        h = hashlib.sha256()
+        ## the code of every operation inside, a sequence runs the code of its ops
+        classes = {type(o) for o in operations(op)}
+        for cls in sorted(classes, key=lambda c: (c.__module__, c.__qualname__)):
+            if cls not in self.versions:
+                self.versions[cls] = code_version(cls)
+            h.update(f'{cls.__module__}.{cls.__qualname__}:{self.versions[cls]}'.encode())
+        digest(constructor_params(op), h)
+        digest((net.channel, net.mcst, net.dtypes, len(net.ues), len(net.gnbs)), h)
+
+        ## declared inputs, and the layout of the connection table
+        inputs = op.requirements() | op.usages() | {(Tables.CONN, Cols.BID), (Tables.CONN, Cols.UEID)}
+        for table, column in sorted(inputs):
+            if column in table_columns(net, table):
+                digest((table, column, self._column(net, table, column)), h)
+        return h.hexdigest()
+
+
+    def load(self, key, net, op):
+        file = self._file(key)
+        if not os.path.exists(file):
+            return False
+
+        with np.load(file, allow_pickle=False) as data:
+            for name in data.files:
+                kind, column = name.split('/', 1)
+                if kind == 'attr':
+                    value = data[name]
+                    setattr(op, column, value.item() if value.ndim == 0 else value)
+                elif kind == 'none':
+                    setattr(op, column, None)
+                elif kind == Tables.CONN:
+                    net.conns[column] = data[name]
+                else:
+                    getattr(net, kind)[column] = data[name]
+
+        ## modification time is the last use
+        os.utime(file)
+        return True
+
+
+    def store(self, key, net, op):
+        arrays = {}
+        for table, column in op.products() or ():
+            if column in table_columns(net, table):
+                arrays[f'{table}/{column}'] = np.asarray(self._column(net, table, column))
+        for attr in getattr(op, 'cached_attributes', ()):
+            ## None would be an object array, which loads only with pickle
+            if getattr(op, attr, None) is not None:
+                arrays[f'attr/{attr}'] = np.asarray(getattr(op, attr))
+            elif hasattr(op, attr):
+                arrays[f'none/{attr}'] = np.zeros(0)
+
+        os.makedirs(self.path, exist_ok=True)
+        file = self._file(key)
+        tmp = f'{file}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, file)
+        self.evict(keep=file)
+
+
+    def evict(self, keep=None):
+        ## least recently used files go first, until the cache fits
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith('.npz'):
+                file = os.path.join(self.path, name)
+                stat = os.stat(file)
+                entries.append((stat.st_mtime, stat.st_size, file))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, file in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if file == keep:
+                continue
+            os.remove(file)
+            total -= size
+
+
+    def clear(self):
+        if os.path.isdir(self.path):
+            for name in os.listdir(self.path):
+                if name.endswith('.npz'):
+                    os.remove(os.path.join(self.path, name))
+
+
+    def _file(self, key):
+        return os.path.join(self.path, key + '.npz')
+
+
+    @staticmethod
+    def _column(net, table, column):
+        if table == Tables.CONN:
+            return np.asarray(net.conns[column])
+        return getattr(net, table)[column].values
+
+
+class CachedOperation(Operation):
+    def __init__(self, op, cache=None):
+        if op.products() is None:
+            raise TypeError(f'{type(op).__name__} does not declare its products, it cannot be cached')
+        self.op = op
+        self.cache = cache if cache is not None else ResultCache()
+        self.hit = None
+
+
+    @property
+    def barrier(self):
+        return self.op.barrier
+
+
+    def requirements(self):
+        return self.op.requirements()
+
+
+    def usages(self):
+        return self.op.usages()
+
+
+    def products(self):
+        return self.op.products()
+
+
+    def execute(self, net: NetworkData) -> None:
+        key = self.cache.key(self.op, net)
+        self.hit = self.cache.load(key, net, self.op)
+        if self.hit:
+            log(f'{type(self.op).__name__}: cache hit {key[:12]}')
+            return
+
+        self.op.execute(net)
+        self.cache.store(key, net, self.op)
@@ -1,55 +1,231 @@
 import numpy as np
 from model.operations import *
-from model.network import Tables
+from model.network import Tables, Cols
+from model.spatial import SpatialIndex
+from model.trace import log
+
+
+## connection tables are either dense (gNB, UE) matrices, or sparse edge lists
+## where every column is indexed like the gNB and UE index columns
+
+def is_sparse(conns):
+    return Cols.BID in conns
+
+
+def table_shape(net):
+    if is_sparse(net.conns):
+        return (len(net.conns[Cols.BID]),)
+    return (len(net.gnbs), len(net.ues))
+
+
+class ConnTile:
+    ## rows start:stop of the connection table, gNB rows when dense, edges when sparse
+    def __init__(self, net, start=0, stop=None):
+        self.rows = slice(start, stop)
+        self.sparse = is_sparse(net.conns)
+        if self.sparse:
+            self.b = net.conns[Cols.BID][self.rows]
+            self.u = net.conns[Cols.UEID][self.rows]
+
+
+    def gnb(self, values):
+        if self.sparse:
+            return values[self.b]
+        return values[self.rows, None]
+
+
+    def ue(self, values):
+        if self.sparse:
+            return values[self.u]
+        return values
+
+
+    def take(self, column):
+        return column[self.rows]
+
+
+class ElementwiseOperation(Operation):
+    ## computes one connection column entry by entry, so consecutive ones
+    ## can run tile by tile in a single fused pass, see OpSequence
+    column = None
+
+    def prepare(self, net: NetworkData) -> None:
+        pass
+
+
+    def kernel(self, net: NetworkData, cols: dict, tile: ConnTile):
+        raise NotImplementedError('kernel() must be implemented by elementwise operation')
+
+
+    def execute(self, net: NetworkData) -> None:
+        self.prepare(net)
+        net.conns[self.column] = net.dtypes.cast(self.column, self.kernel(net, net.conns, ConnTile(net)))
+
+
+    def products(self):
+        return {(Tables.CONN, self.column)}
+
+
+    @staticmethod
+    def fuse(ops, keep=None):
+        return FusedConnOperations(ops, keep)
+
+
+class FusedConnOperations(Operation):
+    def __init__(self, ops, keep=None, chunk_size=2**18):
+        self.ops = ops
+        self.keep = keep
+        self.chunk_size = chunk_size
+
+
+    def requirements(self):
+        required, produced = set(), set()
+        for op in self.ops:
+            required |= op.requirements() - produced
+            produced |= op.products()
+        return required
+
+
+    def products(self):
+        products = set().union(*(op.products() for op in self.ops))
+        return {(table, col) for table, col in products
+                if self.keep is None or col in self.keep or col in (Cols.BID, Cols.UEID)}
+
+
+    def execute(self, net: NetworkData) -> None:
+        produced = set()
+        inputs = set()
+        for op in self.ops:
+            for table, column in op.requirements():
+                check_columns(op, net, table, [column], produced)
+                if table == Tables.CONN and column not in produced:
+                    inputs.add(column)
+            op.prepare(net)
+            produced.add(op.column)
+
+        written = [c for c in dict.fromkeys(op.column for op in self.ops)
+                   if self.keep is None or c in self.keep]
+        for col in produced.difference(written):
+            net.conns.pop(col, None)
+
+        shape = table_shape(net)
+        rows = shape[0]
+        step = max(1, self.chunk_size // max(1, int(np.prod(shape[1:]))))
+
+        out = {}
+        for start in range(0, max(rows, 1), step):
+            tile = ConnTile(net, start, start + step)
+            cols = {col: tile.take(net.conns[col]) for col in inputs}
+            for op in self.ops:
+                cols[op.column] = net.dtypes.cast(op.column, op.kernel(net, cols, tile))
+
+            for col in written:
+                if col not in out:
+                    out[col] = np.empty(shape, dtype=cols[col].dtype)
+                out[col][tile.rows] = cols[col]
+
+        net.conns.update(out)
+
+
+class DistanceCalc(ElementwiseOperation):
+    column = 'distance'
+
+    def __init__(self, radius: float = None):
+        ## only pairs within radius are kept as a sparse table, None is dense
+        self.radius = radius
 
 
-class DistanceCalc(Operation):
     @requires(Tables.UE, 'x', 'y')
     @requires(Tables.B, 'x', 'y')
     def execute(self, net: NetworkData) -> None:
-        x2 = np.subtract.outer(net.gnbs['x'].values, net.ues['x'].values) ** 2
-        y2 = np.subtract.outer(net.gnbs['y'].values, net.ues['y'].values) ** 2
-        net.conns['distance'] = np.sqrt(x2 + y2)
-        print(net.conns['distance'].shape)
+        super().execute(net)
+        log(net.conns['distance'].shape)
 
 
-class FreeSpacePathloss(Operation):
+    def products(self):
+        ## a sparse table gets index columns, a dense one loses them
+        return super().products() | {(Tables.CONN, Cols.BID), (Tables.CONN, Cols.UEID)}
+
+
+    def prepare(self, net: NetworkData) -> None:
+        if self.radius is None:
+            net.conns.pop(Cols.BID, None)
+            net.conns.pop(Cols.UEID, None)
+            return
+
+        gx, gy = net.gnbs['x'].values, net.gnbs['y'].values
+        b, u = SpatialIndex.of(net, Tables.UE).pairs_within(gx, gy, self.radius)
+        order = np.lexsort((u, b))
+        net.conns[Cols.BID] = net.dtypes.cast(Cols.BID, b[order])
+        net.conns[Cols.UEID] = net.dtypes.cast(Cols.UEID, u[order])
+
+
+    def kernel(self, net, cols, tile):
+        ## positions in the precision of the column, so the whole pass runs in it
+        dtype = net.dtypes.dtype_for(self.column, float)
+        gx, gy = net.gnbs['x'].values.astype(dtype), net.gnbs['y'].values.astype(dtype)
+        ux, uy = net.ues['x'].values.astype(dtype), net.ues['y'].values.astype(dtype)
+
+        x2 = (tile.gnb(gx) - tile.ue(ux)) ** 2
+        y2 = (tile.gnb(gy) - tile.ue(uy)) ** 2
+        return np.sqrt(x2 + y2)
+
+
+class FreeSpacePathloss(ElementwiseOperation):
+    column = 'pathloss'
+
     def __init__(self, clip: float = 0.1):
         self.clip = clip
 
 
     @requires(Tables.CONN, 'distance')
     def execute(self, net: NetworkData) -> None:
+        super().execute(net)
+
+
+    def kernel(self, net, cols, tile):
         fr = (net.channel.bandwidth[0] + net.channel.bandwidth[1]) / 2
-        dst = np.maximum(net.conns['distance'], self.clip)
-        net.conns['pathloss'] = 20 * (
+        dst = np.maximum(cols['distance'], self.clip)
+        real = dst.dtype.type
+        return 20 * (
             np.log10(dst) +
-            np.log10(fr*10e9) +
-            np.log10(4 * np.pi / 3e8)
+            real(np.log10(fr*10e9)) +
+            real(np.log10(4 * np.pi / 3e8))
         )
 
 
-class DistanceWeight(Operation):
+class DistanceWeight(ElementwiseOperation):
+    column = 'weight'
+
     def __init__(self, constant: float):
         self.constant = constant
     
 
     @requires(Tables.CONN, 'distance')
     def execute(self, net: NetworkData) -> None:
-        net.conns['weight'] = net.conns['distance'] + self.constant
+        super().execute(net)
+
 
+    def kernel(self, net, cols, tile):
+        return cols['distance'] + self.constant
+
+
+class CalcMaxSnr(ElementwiseOperation):
+    column = 'max_snr'
 
-class CalcMaxSnr(Operation):
     @requires(Tables.UE, 'max_power', 'gain')
     @requires(Tables.B, 'gain')
     @requires(Tables.CONN, 'pathloss')
     def execute(self, net: NetworkData) -> None:
-        u_gain = net.ues['gain'].values
-        u_pow = net.ues['max_power'].values
-        print(u_gain.shape)
-        b_gain = net.gnbs['gain'].values[:, None]
-        print(b_gain.shape)
-        net.conns['max_snr'] = u_pow - net.conns['pathloss'] + u_gain + b_gain - net.channel.noise
+        super().execute(net)
+
+
+    def kernel(self, net, cols, tile):
+        dtype = cols['pathloss'].dtype
+        u_gain = tile.ue(net.ues['gain'].values.astype(dtype))
+        u_pow = tile.ue(net.ues['max_power'].values.astype(dtype))
+        b_gain = tile.gnb(net.gnbs['gain'].values.astype(dtype))
+        return u_pow - cols['pathloss'] + u_gain + b_gain - net.channel.noise
 
 
 '''
@@ -65,22 +241,247 @@ class SimpleConnectionFilter(Operation):
         net.conns = conns[filter]
 '''
 
-class MinSnrFilter(Operation):
+class MinSnrFilter(ElementwiseOperation):
+    column = 'filter'
+
     @requires(Tables.CONN, 'max_snr')
     def execute(self, net: NetworkData) -> None:
-        net.conns['filter'] = net.conns['max_snr'] > net.mcst[0].snr
+        super().execute(net)
+
+
+    def kernel(self, net, cols, tile):
+        return cols['max_snr'] > net.mcst[0].snr
+
+
+def _ranges(ptr, rows):
+    ## concatenated ptr[r]:ptr[r + 1] ranges of the rows
+    starts, stops = ptr[rows], ptr[np.asarray(rows) + 1]
+    lengths = stops - starts
+    return np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+
+def merge_slots(a, b):
+    ## merging the sorted, disjoint keys b into a: where b lands by bisection,
+    ## and the mask of the slots that a fills in order
+    pos_b = np.arange(len(b)) + np.searchsorted(a, b)
+    slot = np.ones(len(a) + len(b), dtype=bool)
+    slot[pos_b] = False
+    return slot, pos_b
 
 
 class ConnectionFilter():
+    __slots__ = (
+        'gnb_count', 'ue_count', 'sparse', 'mask', 'index', 'conn_idx', 'bidx', 'ueidx',
+        'keys', 'gnb_ptr', 'gnb_degree', 'ue_order', 'ue_ptr', 'ue_degree',
+    )
+
     def __init__(self, net):
+        self.gnb_count, self.ue_count = len(net.gnbs), len(net.ues)
+        self.sparse = is_sparse(net.conns)
+        self.mask = self._mask(net).astype(bool)
+        self.index = (net.conns[Cols.BID], net.conns[Cols.UEID]) if self.sparse else None
+
+        ## edges come in gNB major order, edge id is the position in bidx/ueidx,
+        ## conn_idx indexes the connection table columns of the edges
+        if self.sparse:
+            self.conn_idx = np.flatnonzero(self.mask)
+            self.bidx = net.conns[Cols.BID][self.conn_idx]
+            self.ueidx = net.conns[Cols.UEID][self.conn_idx]
+        else:
+            self.bidx, self.ueidx = np.where(self.mask)
+            self.conn_idx = (self.bidx, self.ueidx)
+
+        ## gNB major order makes the (b, u) keys sorted, edge ids are found by bisection
+        self.keys = self.bidx.astype(np.int64) * self.ue_count + self.ueidx
+
+        ## CSR style adjacency, edge ids grouped by gNB and by UE
+        self.gnb_ptr = self._offsets(self.bidx, self.gnb_count)
+        self.gnb_degree = np.diff(self.gnb_ptr)
+        self.ue_order = np.argsort(self.ueidx, kind='stable')
+        self.ue_ptr = self._offsets(self.ueidx, self.ue_count)
+        self.ue_degree = np.diff(self.ue_ptr)
+        self._freeze()
+
+
+    def _freeze(self):
+        ## shared through the cache, so nobody may write into it
+        for array in (
+                self.mask, self.bidx, self.ueidx, self.keys, self.gnb_ptr, self.gnb_degree,
+                self.ue_order, self.ue_ptr, self.ue_degree):
+            array.setflags(write=False)
+        if self.sparse:
+            self.conn_idx.setflags(write=False)
+
+
+    def updated(self, net, ue_map, ues):
+        ## the filter after the UEs were renumbered by ue_map, -1 for the departed ones,
+        ## and the connections of the UEs ues were recomputed; the edges of the others
+        ## are moved over, so only the recomputed UEs are searched and sorted
+        fconns = ConnectionFilter.__new__(ConnectionFilter)
+        fconns.gnb_count, fconns.ue_count = G, U = len(net.gnbs), len(net.ues)
+        fconns.sparse = is_sparse(net.conns)
+        fconns.mask = fconns._mask(net).astype(bool)
+        fconns.index = (net.conns[Cols.BID], net.conns[Cols.UEID]) if fconns.sparse else None
+
+        ues = np.sort(ues)
+        recomputed = np.zeros(U, dtype=bool)
+        recomputed[ues] = True
+        survivors = np.flatnonzero(ue_map >= 0)
+        survivors = survivors[~recomputed[ue_map[survivors]]]
+        renumbered = len(survivors) and not np.array_equal(ue_map, np.arange(len(ue_map)))
+
+        ## edges of the departed and recomputed UEs go, from their CSR rows
+        dropped = np.ones(len(ue_map), dtype=bool)
+        dropped[survivors] = False
+        removed = self.ue_order[_ranges(self.ue_ptr, np.flatnonzero(dropped))]
+        kept = np.ones(len(self.bidx), dtype=bool)
+        kept[removed] = False
+
+        if fconns.sparse:
+            table_b, table_u = fconns.index
+            rows = np.flatnonzero(recomputed[table_u])
+            rows = rows[fconns.mask[rows]]
+            new_b, new_u = table_b[rows], table_u[rows]
+        else:
+            ## row major, so already in (b, u) order
+            new_b, j = np.nonzero(fconns.mask[:, ues])
+            new_u = ues[j]
+        new_keys = new_b.astype(np.int64) * U + new_u
+
+        old_u = self.ueidx[kept]
+        if renumbered:
+            old_u = ue_map[old_u].astype(self.ueidx.dtype)
+        if U == self.ue_count and not renumbered:
+            old_keys = self.keys[kept]
+        else:
+            old_keys = self.bidx[kept].astype(np.int64) * U + old_u
+
+        slot, pos_new = merge_slots(old_keys, new_keys)
+        for name, old, new in (
+                ('bidx', self.bidx[kept], new_b), ('ueidx', old_u, new_u), ('keys', old_keys, new_keys)):
+            merged = np.empty(len(slot), dtype=np.result_type(old, new))
+            merged[slot], merged[pos_new] = old, new
+            setattr(fconns, name, merged)
+
+        if fconns.sparse:
+            fconns.conn_idx = np.flatnonzero(fconns.mask)
+        else:
+            fconns.conn_idx = (fconns.bidx, fconns.ueidx)
+
+        fconns.gnb_degree = (
+            self.gnb_degree - np.bincount(self.bidx[removed], minlength=G) +
+            np.bincount(new_b, minlength=G))
+        fconns.gnb_ptr = np.concatenate(([0], np.cumsum(fconns.gnb_degree)))
+        fconns.ue_degree = np.zeros(U, dtype=int)
+        fconns.ue_degree[ue_map[survivors]] = self.ue_degree[survivors]
+        new_degree = np.bincount(new_u, minlength=U)
+        fconns.ue_degree += new_degree
+        fconns.ue_ptr = np.concatenate(([0], np.cumsum(fconns.ue_degree)))
+
+        ## the surviving UEs keep their rows of ue_order with the edge ids moved,
+        ## the recomputed ones get theirs at their new offsets
+        edge_id = np.full(len(self.bidx), -1)
+        edge_id[kept] = np.flatnonzero(slot)
+        moved_order = edge_id[self.ue_order]
+        by_ue = np.argsort(new_u, kind='stable')
+        u = new_u[by_ue]
+        at = fconns.ue_ptr[u] + np.arange(len(u)) - (np.cumsum(new_degree) - new_degree)[u]
+        fconns.ue_order = np.empty(len(slot), dtype=int)
+        taken = np.zeros(len(slot), dtype=bool)
+        taken[at] = True
+        fconns.ue_order[~taken] = moved_order[moved_order >= 0]
+        fconns.ue_order[at] = pos_new[by_ue]
+        fconns._freeze()
+        return fconns
+
+
+    @staticmethod
+    def of(net):
+        ## one filter per network, rebuilt only when the filter or the table changes
+        fconns = net.__dict__.get('_fconns')
+        if fconns is None or not fconns.matches(net):
+            fconns = ConnectionFilter(net)
+            net.__dict__['_fconns'] = fconns
+        return fconns
+
+
+    def matches(self, net):
+        if (self.gnb_count, self.ue_count) != (len(net.gnbs), len(net.ues)):
+            return False
+        if self.sparse != is_sparse(net.conns):
+            return False
+        if self.sparse and (
+                self.index[0] is not net.conns[Cols.BID] or self.index[1] is not net.conns[Cols.UEID]):
+            return False
+        mask = self._mask(net)
+        return mask.shape == self.mask.shape and np.array_equal(mask, self.mask)
+
+
+    def _mask(self, net):
         if 'filter' in net.conns:
-            self.bidx, self.ueidx = np.where(net.conns['filter'])
+            return np.asarray(net.conns['filter'])
+        elif self.sparse:
+            return np.ones(len(net.conns[Cols.BID]), dtype=bool)
         else:
-            self.bidx, self.ueidx = np.where(net.conns)
+            return np.ones((self.gnb_count, self.ue_count), dtype=bool)
+
 
     def __iter__(self):
-        return zip(self.bidx, self.ueidx)
+        return zip(self.bidx.tolist(), self.ueidx.tolist())
     
 
     def __len__(self):
         return len(self.bidx)
+
+
+    def take(self, column):
+        ## per edge values of a connection table column
+        return column[self.conn_idx]
+
+
+    def scatter(self, values, shape, dtype=float):
+        ## per edge values back into a connection table column, zero elsewhere
+        column = np.zeros(shape, dtype=dtype)
+        column[self.conn_idx] = values
+        return column
+
+
+    def edge_id(self, b, u):
+        ## edge ids of (b, u) pairs, -1 where the pair is filtered out
+        key = np.asarray(b, dtype=np.int64) * self.ue_count + np.asarray(u)
+        if len(self.keys) == 0:
+            return np.full(np.shape(key), -1)
+        pos = np.minimum(np.searchsorted(self.keys, key), len(self.keys) - 1)
+        return np.where(self.keys[pos] == key, pos, -1)
+
+
+    def gnb_edges(self, b):
+        return np.arange(self.gnb_ptr[b], self.gnb_ptr[b + 1])
+
+
+    def ue_edges(self, u):
+        return self.ue_order[self.ue_ptr[u]:self.ue_ptr[u + 1]]
+
+
+    def ue_pairs(self):
+        p1, p2 = [], []
+        degree = self.ue_degree
+
+        ## UEs of the same degree share the same pair pattern
+        for d in np.unique(degree[degree > 1]):
+            starts = self.ue_ptr[:-1][degree == d]
+            edges = self.ue_order[starts[:, None] + np.arange(d)]
+            j1, j2 = np.triu_indices(d, 1)
+            p1.append(edges[:, j1].ravel())
+            p2.append(edges[:, j2].ravel())
+
+        if not p1:
+            return np.array([], dtype=int), np.array([], dtype=int)
+        return np.concatenate(p1), np.concatenate(p2)
+
+
+    @staticmethod
+    def _offsets(idx, count):
+        ptr = np.zeros(count + 1, dtype=int)
+        np.cumsum(np.bincount(idx, minlength=count), out=ptr[1:])
+        return ptr
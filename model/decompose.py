@@ -0,0 +1,179 @@
+import contextlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from model.operations import *
+from model.network import *
+from model.connop import ConnectionFilter, is_sparse
+from model.milp import Formulation
+from model.greedy import greedy_solution
+from model.optimize import Optimize, NoSolutionException
+from model.trace import log, span
+
+
+## connection columns a sub-MILP reads, and the ones it writes
+INPUTS = ('pathloss', 'weight', 'max_snr', 'filter')
+RESULTS = ('bandwidth', 'signal_power', 'x_traffic', 'y_traffic', 'mcs_idx')
+
+
+def tile_of(net, tiles):
+    ## the tile of every UE on a grid of tiles over the area, x major
+    nx, ny = tiles
+    w, h = net.channel.area
+    tx = np.clip((net.ues[Cols.X].values * nx // w).astype(int), 0, nx - 1)
+    ty = np.clip((net.ues[Cols.Y].values * ny // h).astype(int), 0, ny - 1)
+    return tx * ny + ty
+
+
+def subnetwork(net, ues, gnbs, share):
+    ## the UEs ues and gNBs gnbs, both sorted, renumbered from zero; the gNBs
+    ## may only use their share of the bandwidth
+    sub = NetworkData()
+    sub.channel, sub.mcst, sub.dtypes = net.channel, net.mcst, net.dtypes
+    sub.ues = net.ues.iloc[ues].reset_index(drop=True)
+    sub.gnbs = net.gnbs.iloc[gnbs].reset_index(drop=True)
+    sub.gnbs[Cols.MAX_BW] = share
+
+    columns = [col for col in INPUTS if col in net.conns]
+    if not is_sparse(net.conns):
+        sub.conns = {col: net.conns[col][np.ix_(gnbs, ues)] for col in columns}
+        return sub
+
+    b, u = net.conns[Cols.BID], net.conns[Cols.UEID]
+    b_map = np.full(len(net.gnbs), -1)
+    b_map[gnbs] = np.arange(len(gnbs))
+    u_map = np.full(len(net.ues), -1)
+    u_map[ues] = np.arange(len(ues))
+    rows = np.flatnonzero((b_map[b] >= 0) & (u_map[u] >= 0))
+    sub.conns = {col: net.conns[col][rows] for col in columns}
+    sub.conns[Cols.BID] = b_map[b[rows]].astype(b.dtype)
+    sub.conns[Cols.UEID] = u_map[u[rows]].astype(u.dtype)
+    return sub
+
+
+def _solve_tile(sub, options):
+    ## objective and per edge results of one tile, None if it has no solution
+    op = Optimize(**options)
+    try:
+        op.execute(sub)
+    except NoSolutionException:
+        return None
+    finally:
+        op.close()
+    fconns = ConnectionFilter.of(sub)
+    return op.objective_value, {col: fconns.take(sub.conns[col]) for col in RESULTS}
+
+
+class DecomposedOptimize(Optimize):
+    ## the MILP of Optimize cut into tiles of UEs over the area, the tiles are
+    ## solved in a process pool; a tile takes every gNB its UEs reach, so the
+    ## gNBs near the tile borders are shared and each tile gets a share of
+    ## their bandwidth; the shares start from the load of the greedy heuristic,
+    ## then in fixed boundary rounds the bandwidth a tile leaves unused goes to
+    ## the tiles whose share is full, which never makes a tile worse;
+    ## options are passed on to the Optimize of every tile
+    def __init__(self, tiles=(2, 2), workers=None, rounds=5, round_tol=1e-4, **options):
+        super().__init__(**options)
+        self.tiles = tiles
+        self.workers = workers
+        self.rounds = rounds
+        self.round_tol = round_tol
+        self.options = options
+        self.shared_tol = 1e-6
+
+
+    @requires(Tables.CONN, 'pathloss', 'weight')
+    @requires(Tables.UE, 'x', 'y', 'demand', 'gain', 'max_power')
+    @requires(Tables.B, 'gain')
+    @uses(Tables.CONN, 'filter', 'max_snr')
+    @uses(Tables.B, 'max_bandwidth')
+    @produces(Tables.CONN, 'bandwidth', 'signal_power', 'x_traffic', 'y_traffic', 'mcs_idx')
+    def execute(self, net: NetworkData) -> None:
+        fconns = ConnectionFilter.of(net)
+        self.form = Formulation(net, fconns, self.alpha, self.rho, self.prune_mcs)
+        G = fconns.gnb_count
+
+        ## tiles are numbered by their position on the grid, empty ones are dropped
+        ue_tile = tile_of(net, self.tiles)
+        tiles = np.unique(ue_tile)
+        edge_tile = np.searchsorted(tiles, ue_tile[fconns.ueidx])
+        ue_tile = np.searchsorted(tiles, ue_tile)
+        T = len(tiles)
+
+        ## a (tile, gNB) pair for every gNB a tile reaches, sorted by tile then gNB,
+        ## edges are in gNB major order so the ones of a tile keep the order of its filter
+        pair_key, pair_of_edge = np.unique(edge_tile * G + fconns.bidx, return_inverse=True)
+        pair_tile, pair_gnb = pair_key // G, pair_key % G
+        pair_ptr = ConnectionFilter._offsets(pair_tile, T)
+        tile_ues = [np.flatnonzero(ue_tile == t) for t in range(T)]
+        tile_edges = [np.flatnonzero(edge_tile == t) for t in range(T)]
+        shared = np.bincount(pair_gnb, minlength=G) > 1
+        log(f'Decomposition: {T} tiles, {np.count_nonzero(shared)} shared gNBs')
+
+        ## the first shares split the gNB by the load of the greedy solution on it,
+        ## by edge count where the greedy puts no load
+        with span('greedy'):
+            start, _ = greedy_solution(self.form)
+        cap = self.form.gnb_bw
+        load = np.bincount(pair_of_edge, weights=start.bandwidth, minlength=len(pair_key))
+        edges = np.bincount(pair_of_edge, minlength=len(pair_key)).astype(float)
+        weight = np.where(np.bincount(pair_gnb, weights=load, minlength=G)[pair_gnb] > 0, load, edges)
+        share = cap[pair_gnb] * weight / np.bincount(pair_gnb, weights=weight, minlength=G)[pair_gnb]
+
+        best = None
+        pool = ProcessPoolExecutor(self.workers) if self.workers else contextlib.nullcontext()
+        with pool:
+            mapper = pool.map if self.workers else map
+            for r in range(self.rounds):
+                subs = [
+                    subnetwork(net, tile_ues[t], pair_gnb[pair_ptr[t]:pair_ptr[t + 1]],
+                               share[pair_ptr[t]:pair_ptr[t + 1]])
+                    for t in range(T)
+                ]
+                with span('tiles', round=r, tiles=T) as args:
+                    results = list(mapper(_solve_tile, subs, [self.options] * T))
+                    failed = [t for t in range(T) if results[t] is None]
+                    args['failed'] = len(failed)
+
+                if not failed:
+                    objective = sum(result[0] for result in results)
+                    log(f'Decomposition round {r}: {objective}')
+                    if best is not None and objective > best[0] * (1 - self.round_tol):
+                        ## the round gave nothing, the shares have settled
+                        best = min(best, (objective, results), key=lambda b: b[0])
+                        break
+                    best = (objective, results)
+                else:
+                    log(f'Decomposition round {r}: {len(failed)} of {T} tiles have no solution')
+
+                ## a tile without a solution wants more of all its gNBs
+                usage = share.copy()
+                for t in range(T):
+                    if results[t] is not None:
+                        usage[pair_ptr[t]:pair_ptr[t + 1]] = np.bincount(
+                            pair_of_edge[tile_edges[t]] - pair_ptr[t],
+                            weights=results[t][1]['bandwidth'],
+                            minlength=pair_ptr[t + 1] - pair_ptr[t])
+
+                ## the tiles that do not use their whole share keep what they use,
+                ## the rest of the gNB goes evenly to the ones whose share is full
+                full = usage >= share - self.shared_tol
+                kept = np.where(full, share, usage)
+                free = cap - np.bincount(pair_gnb, weights=kept, minlength=G)
+                wanting = np.bincount(pair_gnb, weights=full, minlength=G)
+                give = full & shared[pair_gnb] & (free[pair_gnb] > self.shared_tol)
+                if not give.any():
+                    break
+                share = kept + np.where(give, free[pair_gnb] / np.maximum(wanting[pair_gnb], 1), 0)
+
+        if best is None:
+            raise NoSolutionException(f'{len(failed)} of {T} tiles have no solution')
+        self.objective_value, results = best
+
+        with span('extract'):
+            shape = net.conns['weight'].shape
+            for col in RESULTS:
+                values = np.zeros(len(fconns))
+                for t in range(T):
+                    values[tile_edges[t]] = results[t][1][col]
+                dtype = net.dtypes.dtype_for(col, int) if col == 'mcs_idx' else float
+                net.conns[col] = fconns.scatter(values, shape, dtype=dtype)
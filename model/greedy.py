@@ -0,0 +1,161 @@
+import numpy as np
+from model.milp import Formulation, Solution
+
+
+def group_cumsum(values, starts):
+    ## cumulative sums restarting at every group, values sorted by group
+    total = np.cumsum(values)
+    return total - np.concatenate([[0], total])[starts]
+
+
+def group_argmin(cost, group, ptr):
+    ## position of the smallest cost of every non-empty group, ties to the first
+    order = np.lexsort((cost, group))
+    return order[ptr[:-1][np.diff(ptr) > 0]]
+
+
+def level_signal(form):
+    ## signal power of every (edge, level), S has a lower bound of zero
+    return np.maximum(form.lvl_snr + form.e_loss[form.lvl_edge], 0)
+
+
+def edge_levels(form, price, traffic, high):
+    ## the level of every edge that costs least in signal power and in the price
+    ## of the bandwidth it needs for traffic, the lowest one while nothing is priced
+    le = form.lvl_edge
+    cost = form.rho * level_signal(form) + price[le] * traffic[le] / form.lvl_eff
+    cost[np.arange(form.K) > high[le]] = np.inf
+    return group_argmin(cost, le, form.lvl_ptr)
+
+
+def split(order, u, k, demand, chosen, spread):
+    ## x, y and the used links of every edge, from the links sorted by UE and cost,
+    ## for the number of links each UE takes and whether it spreads evenly over them
+    c = chosen[u]
+    d = demand[u]
+    used = k <= c
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ## spread: d / c on each, backup: d on the first and d / (c - 2) on the rest
+        x = np.where(spread[u], d / c, np.where(k == 1, d, 0))
+        y = np.where(spread[u], 2 * d / (c * (c - 2)), np.where(k == 1, 0, d / (c - 2)))
+    x = np.where(used, x, 0)
+    y = np.where(used & (c >= 3), y, 0)
+
+    E = len(order)
+    x_e, y_e, used_e = np.zeros(E), np.zeros(E), np.zeros(E, dtype=bool)
+    x_e[order], y_e[order], used_e[order] = x, y, used
+    return x_e, y_e, used_e
+
+
+def greedy_solution(form: Formulation, rounds=10):
+    ## a point of the formulation without solving it; every UE sorts its links by
+    ## cost and takes the cheaper of two ways to meet double protection over its
+    ## best k of them: all of x on the first and y on the next k - 1, or x and y
+    ## spread evenly; overloaded gNBs get a price on bandwidth that moves UEs away
+    ## and edges to higher levels, what is still over the caps after the last round
+    ## goes to the highest reachable level and is scaled down;
+    ## returns the solution and the UEs whose demand it meets
+    fconns = form.fconns
+    E, U, BW = form.E, fconns.ue_count, form.BW
+    ## a zero cap still gets a price
+    cap = np.maximum(form.gnb_bw, 1e-12)
+    demand = np.asarray(form.u_demand, dtype=float)
+    if E == 0:
+        empty = np.zeros(0)
+        return Solution(empty, empty, empty, empty, empty, 0.), demand <= 0
+
+    ## levels an edge can reach with its power, dead edges cannot reach any
+    ptr = form.lvl_ptr
+    feasible = form.lvl_snr + form.e_loss[form.lvl_edge] <= form.e_pow[form.lvl_edge] + 1e-9
+    low = ptr[:-1]
+    high = np.maximum.reduceat(np.where(feasible, np.arange(form.K), -1), low)
+    dead = high < low
+    high = np.where(dead, low, high)
+    signal = level_signal(form)
+
+    weight = form.weight
+    bidx, ueidx = fconns.bidx, fconns.ueidx
+    degree = fconns.ue_degree
+    starts = fconns.ue_ptr[:-1]
+    d_e = demand[ueidx]
+
+    price = np.zeros(fconns.gnb_count)
+    for _ in range(rounds):
+        level = edge_levels(form, price[bidx], d_e, high)
+        eff = form.lvl_eff[level]
+        premium = form.rho * (signal[level] - signal[low])
+
+        ## per unit of traffic, x pays its weight, y alpha times it, both the
+        ## price of the bandwidth at the gNB
+        unit = price[bidx] / eff
+        cx = weight + unit
+        cy = form.alpha * weight + unit
+        key = np.where(dead, np.inf, cx + premium / np.where(d_e > 0, d_e, 1))
+
+        ## sorted by UE and key, k is the rank of the link at its UE
+        order = np.lexsort((key, ueidx))
+        u = ueidx[order]
+        s = starts[u]
+        k = np.arange(E) - s + 1
+        d = demand[u]
+
+        first_x, first_y = cx[order][s], cy[order][s]
+        sum_x = group_cumsum(cx[order], s)
+        sum_y = group_cumsum(cy[order], s)
+        sum_p = group_cumsum(premium[order], s)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ## the first link carries x, the other k - 1 lose at most one of them
+            backup = d * first_x + d / (k - 2) * (sum_y - first_y) + sum_p
+            ## any two of k failing leave k - 2 to carry 2 / k of the demand
+            even = d / k * sum_x + 2 * d / (k * (k - 2)) * sum_y + sum_p
+        cost = np.where(k >= 3, np.minimum(backup, even), np.inf)
+        ## a UE with one link has no pairs to protect
+        cost = np.where((k == 1) & (degree[u] == 1), d * sum_x + sum_p, cost)
+        cost[~np.isfinite(cost)] = np.inf
+
+        ## the cheapest choice of every UE, nothing for the ones without demand
+        has = degree > 0
+        pick = group_argmin(cost, u, fconns.ue_ptr)
+        chosen = np.zeros(U, dtype=int)
+        chosen[has] = np.where(np.isfinite(cost[pick]), k[pick], 0)
+        spread = np.zeros(U, dtype=bool)
+        spread[has] = (k[pick] >= 3) & (even[pick] < backup[pick])
+        served = (demand <= 0) | (chosen > 0)
+        chosen[demand <= 0] = 0
+
+        x, y, used = split(order, u, k, demand, chosen, spread)
+        B = (x + y) / eff
+
+        load = np.bincount(bidx, weights=B, minlength=fconns.gnb_count)
+        if not np.any(load > cap * (1 + 1e-9)):
+            break
+        ## in steps of the cheapest edge cost per unit of bandwidth
+        step = np.min((cx * eff)[~dead], initial=1.)
+        price = np.maximum(0, price + step * (load / cap - 1))
+
+    ## gNBs still full after the last round go to the highest levels,
+    ## then what is over the caps is scaled down
+    raised = used & (load > cap * (1 + 1e-9))[bidx]
+    level = np.where(raised, high, level)
+    B = np.where(raised, (x + y) / form.lvl_eff[level], B)
+    load = np.bincount(bidx, weights=B, minlength=fconns.gnb_count)
+
+    ue_load = np.bincount(ueidx, weights=B, minlength=U)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fit = np.minimum(
+            np.where(load > form.gnb_bw, form.gnb_bw / load, 1)[bidx],
+            np.where(ue_load > BW, BW / ue_load, 1)[ueidx])
+    ## a UE is scaled as a whole so its protection still holds
+    ue_scale = np.ones(U)
+    np.minimum.at(ue_scale, ueidx[used], fit[used])
+    served &= ue_scale >= 1
+    scale = ue_scale[ueidx]
+    B, x, y = B * scale, x * scale, y * scale
+
+    level = np.where(used, level, low)
+    bm = np.zeros(form.K)
+    bm[level] = 1
+    S = signal[level]
+
+    objective = weight @ x + form.alpha * (weight @ y) + form.rho * np.sum(S)
+    return Solution(B, S, x, y, bm, float(objective)), served
@@ -1,9 +1,13 @@
 import numpy as np
+import pandas as pd
 import matplotlib.pyplot as plot
 import matplotlib.ticker as mtick
 from dataclasses import dataclass
-from model.connop import ConnectionFilter
+from concurrent.futures import ProcessPoolExecutor
+from model.connop import ConnectionFilter, is_sparse
 from model.operations import *
+from model.network import Tables, Cols
+from model.spatial import SpatialIndex
 
 
 @dataclass
@@ -17,6 +21,9 @@ class InterfApproxData:
     _I: np.ndarray
     _sort_idx: np.ndarray
     _aprx_idx: np.ndarray
+    ## position of the own UE in a _I shared by the connections of a gNB, it
+    ## does not interfere; -1 when _I has only the interferers
+    own: int = -1
 
 
     def __post_init__(self):
@@ -26,14 +33,18 @@ class InterfApproxData:
     def error_for(self, variations):
         randI = self._I * variations
         sum_randI = np.sum(randI)
+        if self.own >= 0:
+            sum_randI -= randI[self.own]
         sum_I_aprx = np.sum(randI[self._aprx_idx] * self.weights)
         return np.abs(sum_randI - sum_I_aprx) / sum_randI
     
 
 class InterfApproxProvider:
-    def __init__(self, net, fconns) -> None:
+    def __init__(self, net, fconns, rng=None) -> None:
         self.net = net
         self.fconns = fconns
+        ## a numpy Generator, None keeps drawing from the global np.random state
+        self.rng = rng
 
 
     def __iter__(self):
@@ -57,21 +68,33 @@ class InterfApproxProvider:
         delta_idx = 10
         aprx_idx = 2 ** np.arange(0, exp_range) - 1
         aprx_idx = np.concatenate(([0, 1, 2, 3], np.arange(4, len(dst), delta_idx)))
-        np.random.randint(-delta_idx // 2 + 1, delta_idx // 2, len(aprx_idx) - 5)
-        aprx_idx[5:] += np.random.randint(-delta_idx // 2, delta_idx // 2, len(aprx_idx) - 5)
+        self._randint(-delta_idx // 2 + 1, delta_idx // 2, len(aprx_idx) - 5)
+        aprx_idx[5:] += self._randint(-delta_idx // 2, delta_idx // 2, len(aprx_idx) - 5)
 
         aprx_sort_idx = sort_idx[aprx_idx]
         weights = np.zeros_like(aprx_idx, dtype=float)
         weights[0] = 1
 
-        for i in range(1, len(aprx_sort_idx)):
-            curr = sum_I[aprx_idx[i]]
-            next = sum_I[-1] if i + 1 == len(aprx_idx) else sum_I[aprx_idx[i+1]-1]
-            weights[i] = 1 + (next - curr) / (I[aprx_sort_idx[i]])
+        ## a selected interferer stands for everyone up to the next selected one
+        curr = sum_I[aprx_idx[1:]]
+        next = np.append(sum_I[aprx_idx[2:] - 1], sum_I[-1])
+        weights[1:] = 1 + (next - curr) / I[aprx_sort_idx[1:]]
 
         return aprx_sort_idx, weights
 
 
+    def _randint(self, low, high, size):
+        if self.rng is None:
+            return np.random.randint(low, high, size)
+        return self.rng.integers(low, high, size)
+
+
+    def _rand(self, size):
+        if self.rng is None:
+            return np.random.rand(size)
+        return self.rng.random(size)
+
+
     def _calc_interferences(self, net, b, u):
         u_pow = net.ues['max_power'].values
         u_gain = net.ues['gain'].values
@@ -99,46 +122,280 @@ class InterfApproxProvider:
         return np.cumsum(I_to_sum)
 
 
+class BatchedInterfApproxProvider(InterfApproxProvider):
+    ## the connections of a gNB in blocks, each block holds a few arrays of its
+    ## connections times the UEs, memory bytes of them at most; dense tables only
+    def __init__(self, net, fconns, rng=None, memory=2**28) -> None:
+        super().__init__(net, fconns, rng)
+        self.memory = memory
+
+
+    def __iter__(self):
+        net = self.net
+        fconns = self.fconns
+        if is_sparse(net.conns):
+            raise ValueError(
+                'BatchedInterfApproxProvider needs a dense connection table, '
+                'SpatialInterfApproxProvider reads sparse ones')
+        ues = np.arange(len(net.ues))
+
+        u_pow = net.ues['max_power'].values
+        u_gain = net.ues['gain'].values
+        b_gain = net.gnbs['gain'].values
+
+        ## ups, I, sorted_ues, sort_idx and sum_I of 8 bytes, the mask of 1
+        rows = max(1, self.memory // (41 * max(len(ues), 1)))
+
+        for b in np.flatnonzero(fconns.gnb_degree):
+            ## interference of every UE at gNB b, sorted by distance once
+            I_row = 10 ** ((u_pow - net.conns['pathloss'][b] + u_gain + b_gain[b]) / 10)
+            dst_row = net.conns['distance'][b]
+            order = np.argsort(dst_row)
+
+            gnb_edges = fconns.gnb_edges(b)
+            for start in range(0, len(gnb_edges), rows):
+                edges = gnb_edges[start:start + rows]
+                u = fconns.ueidx[edges]
+
+                ## each connection drops its own UE, ids above it shift down by one
+                others = (ues[None, :] != u[:, None])
+                ups = np.broadcast_to(ues, others.shape)[others].reshape(len(u), -1)
+                I = I_row[ups]
+                sorted_ues = np.broadcast_to(order, others.shape)[others[:, order]].reshape(len(u), -1)
+                sort_idx = sorted_ues - (sorted_ues > u[:, None])
+                sum_I = np.cumsum(I_row[sorted_ues], axis=1)
+
+                for j, e in enumerate(zip(fconns.bidx[edges].tolist(), u.tolist())):
+                    aprx_idx, weights = self._calc_approx_weights(
+                        dst_row[ups[j]], I[j], sum_I[j], sort_idx[j])
+
+                    yield InterfApproxData(
+                        e, len(ups[j]), len(weights), ups[j][aprx_idx], weights,
+                        I[j], sort_idx[j], aprx_idx
+                    )
+
+
+class SpatialInterfApproxProvider(InterfApproxProvider):
+    ## the exact nearest interferers, then shells of delta interferers by
+    ## distance with one random member standing for each; the UEs past the
+    ## first shells shells are one more shell, None has no limit
+    def __init__(self, net, fconns, exact=4, delta=10, shells=64, rng=None) -> None:
+        super().__init__(net, fconns, rng)
+        self.exact = exact
+        self.delta = delta
+        self.shells = shells
+
+
+    def __iter__(self):
+        net = self.net
+        fconns = self.fconns
+        index = SpatialIndex.of(net, Tables.UE)
+        gnb_xy = np.column_stack((net.gnbs['x'].values, net.gnbs['y'].values))
+
+        u_pow = net.ues['max_power'].values
+        u_gain = net.ues['gain'].values
+        b_gain = net.gnbs['gain'].values
+
+        for b, ids, pathloss in self._rows(net):
+            edges = fconns.gnb_edges(b)
+            if len(edges) == 0:
+                continue
+            n = len(ids)
+
+            ## the interference of every UE in the row, shared by the connections of b
+            I = 10 ** ((u_pow[ids] - pathloss + u_gain[ids] + b_gain[b]) / 10)
+
+            ## the UEs of the shells come from the index nearest first, so they are
+            ## grouped by shell already, the rest is the tail shell; the index has
+            ## every UE, the ones outside a sparse row are dropped
+            k = n if self.shells is None else self.exact + self.shells * self.delta
+            _, near = index.nearest(gnb_xy[b], k)
+            pos = np.minimum(np.searchsorted(ids, near), n - 1)
+            near = pos[ids[pos] == near]
+            rank = np.full(n, -1)
+            rank[near] = np.arange(len(near))
+            tail = np.flatnonzero(rank < 0)
+            grouped = np.concatenate((near, tail))
+
+            ## shell starts in grouped: the exact ones, shells of delta, the tail
+            ptr = np.concatenate(([0], np.arange(self.exact, len(near), self.delta), [len(near), n]))
+            counts = np.diff(ptr)
+            cumsum = np.concatenate(([0.], np.cumsum(I[near])))
+            sums = np.diff(np.append(cumsum[ptr[:-1]], I.sum()))
+
+            for e in zip(fconns.bidx[edges].tolist(), fconns.ueidx[edges].tolist()):
+                u = e[1]
+                own = np.searchsorted(ids, u)
+                exact = near[:self.exact + 1]
+                exact = exact[exact != own][:self.exact]
+
+                ## the own UE and the exact ones leave their shells
+                out = np.append(exact, own)
+                at = np.where(rank[out] >= 0, rank[out], len(near) + np.searchsorted(tail, out))
+                shell = np.searchsorted(ptr, at, side='right') - 1
+                slot = at - ptr[shell]
+                out_counts = counts.copy()
+                out_sums = sums.copy()
+                np.subtract.at(out_counts, shell, 1)
+                np.subtract.at(out_sums, shell, I[out])
+
+                ## one random member stands for the rest of its shell, the draw
+                ## steps over the members that left
+                used = np.flatnonzero(out_counts)
+                pick = (self._rand(len(used)) * out_counts[used]).astype(int)
+                for i in np.lexsort((slot, shell)):
+                    j = np.searchsorted(used, shell[i])
+                    if j < len(used) and used[j] == shell[i] and slot[i] <= pick[j]:
+                        pick[j] += 1
+                reps = grouped[ptr[used] + pick]
+
+                selected = np.concatenate((exact, reps))
+                weights = np.concatenate((np.ones(len(exact)), out_sums[used] / I[reps]))
+
+                yield InterfApproxData(
+                    e, n - 1, len(weights), ids[selected], weights,
+                    I, grouped, selected, own
+                )
+
+
+    def _rows(self, net):
+        ## (b, UE ids, pathloss) of every gNB, ids sorted; in a sparse
+        ## table only the UEs in the table of b interfere there
+        conns = net.conns
+        if not is_sparse(conns):
+            ids = np.arange(len(net.ues))
+            for b in range(len(net.gnbs)):
+                yield b, ids, conns['pathloss'][b]
+            return
+
+        bid, ueid = conns[Cols.BID], conns[Cols.UEID]
+        rows = np.lexsort((ueid, bid))
+        ptr = ConnectionFilter._offsets(bid, len(net.gnbs))
+        for b in range(len(net.gnbs)):
+            r = rows[ptr[b]:ptr[b + 1]]
+            yield b, ueid[r].astype(int), conns['pathloss'][r]
+
+
+def _mc_chunk(I, D, seed, trials):
+    ## sums of the drawn variations weighted by the exact and the error terms
+    R = np.random.default_rng(seed).random((trials,) + I.shape)
+    return np.einsum('ten,en->te', R, D), np.einsum('ten,en->te', R, I)
+
+
+class InterfMonteCarlo:
+    def __init__(self, variations, trials=1, seed=None, workers=None, chunk_size=2**22):
+        self.variations = np.asarray(variations, dtype=float)
+        self.trials = trials
+        self.seed = seed
+        self.workers = workers
+        self.chunk_size = chunk_size
+
+
+    @staticmethod
+    def stack(data):
+        ## interferences and error terms of every connection, zero padded to one width
+        n = max(len(d._I) for d in data)
+        I = np.zeros((len(data), n), dtype=float)
+        W = np.zeros((len(data), n), dtype=float)
+        for i, d in enumerate(data):
+            I[i, :len(d._I)] = d._I
+            if d.own >= 0:
+                I[i, d.own] = 0
+            np.add.at(W[i], d._aprx_idx, d.weights)
+        return I, I * (1 - W)
+
+
+    def errors(self, data):
+        ## the powers are 1 + r * var, with one r drawn per trial and shared by every
+        ## variation both the exact and the approximated sum are linear in var:
+        ##   sum(I * (1 + r * var)) = sum(I) + var * sum(I * r)
+        I, D = self.stack(data)
+        S0, A0 = I.sum(axis=1), D.sum(axis=1)
+
+        per_chunk = max(1, self.chunk_size // max(I.size, 1))
+        counts = [min(per_chunk, self.trials - t) for t in range(0, self.trials, per_chunk)]
+        seq = self.seed
+        if not isinstance(seq, np.random.SeedSequence):
+            seq = np.random.SeedSequence(seq)
+        seeds = seq.spawn(len(counts))
+        args = ([I] * len(counts), [D] * len(counts), seeds, counts)
+
+        if self.workers is None:
+            sums = list(map(_mc_chunk, *args))
+        else:
+            with ProcessPoolExecutor(self.workers) as pool:
+                sums = list(pool.map(_mc_chunk, *args))
+
+        A1 = np.concatenate([a for a, _ in sums])
+        S1 = np.concatenate([s for _, s in sums])
+        var = self.variations[None, :, None]
+        return np.abs(A0 + var * A1[:, None, :]) / (S0 + var * S1[:, None, :])
+
+
+    def run(self, data):
+        data = list(data)
+        errs = self.errors(data)
+        T, V, E = errs.shape
+        return pd.DataFrame({
+            'trial': np.repeat(np.arange(T), V * E),
+            'variation': np.tile(np.repeat(self.variations, E), T),
+            'b': np.tile([d.b for d in data], T * V),
+            'u': np.tile([d.u for d in data], T * V),
+            'error': errs.ravel(),
+        })
+
+
 class PlotInterferenceApprox(Operation):
+    ## pyplot state is global
+    barrier = True
+
+    def __init__(
+            self, provider=SpatialInterfApproxProvider, trials=1, seed=None, workers=None,
+            variations=np.linspace(0.1, 1, 10), filename='interference_approx.pgf'):
+        self.provider = provider
+        self.trials = trials
+        self.seed = seed
+        self.workers = workers
+        self.variations = variations
+        self.filename = filename
+        self.results = None
+
+
     @requires('conns', 'distance', 'pathloss')
     @requires('ues', 'max_power', 'gain')
     @requires('gnbs', 'gain')
+    @uses('conns', 'filter')
+    @produces('conns')
     def execute(self, net):
+        fconns = ConnectionFilter.of(net)
+
+        ## separate streams for the shell picks and the power variations
+        provider_seed, mc_seed = np.random.SeedSequence(self.seed).spawn(2)
+        data = self.provider(net, fconns, rng=np.random.default_rng(provider_seed))
+        mc = InterfMonteCarlo(self.variations, self.trials, mc_seed, self.workers)
+
+        self.results = mc.run(data)
+        self.plot(self.results, self.filename)
+
+
+    @staticmethod
+    def plot(results, filename):
         import utils.plotutils as pu
-        
-        fconns = ConnectionFilter(net)
-        variations = np.linspace(0.1, 1, 10)
-        errs = np.zeros((len(variations), len(fconns)), dtype=float)
-        
-        for i, data in enumerate(InterfApproxProvider(net, fconns)):
-            '''if i == 0:
-                plot.scatter(net.ues['x'], net.ues['y'], label='UEs')
-                plot.scatter(net.ues['x'][data.ues], net.ues['y'][data.ues], label='Selected UEs')
-                plot.scatter(net.gnbs['x'], net.gnbs['y'], label='gNBs', marker='^')
-                plot.scatter(net.gnbs['x'][data.b], net.gnbs['y'][data.b], label='the gNB', marker='^')
-                plot.xlim(0, net.channel.area[0])
-                plot.ylim(0, net.channel.area[1])
-                plot.gca().set_aspect('equal', adjustable='box')
-                plot.legend()
-                plot.show()'''
-
-            for j, var in enumerate(variations):
-                pow_mul = 1 + np.random.rand(data.total_interferer_count) * var
-                errs[j, i] = data.error_for(pow_mul)
-        
-        errs *= 100
+
+        groups = results.groupby('variation')['error']
+        variations = list(groups.groups.keys())
+        errs = [g.values * 100 for _, g in groups]
 
         plot.rcParams.update({'font.size': 9})
 
         fig, ax = plot.subplots()
-        ax.boxplot(errs.T, flierprops={'marker': '.', 'markerfacecolor': 'black', 'markeredgewidth': 0}, whis=2.75)
+        ax.boxplot(errs, flierprops={'marker': '.', 'markerfacecolor': 'black', 'markeredgewidth': 0}, whis=2.75)
         ax.grid(axis='y')
-        ax.set_xticks(range(1, len(variations) + 1), [f'{int(v*100)}%' for v in variations], rotation=45)
+        ax.set_xticks(range(1, len(variations) + 1), [f'{int(round(v*100))}%' for v in variations], rotation=45)
         ax.set_yticks(range(0, 19, 2))
         ax.yaxis.set_major_formatter(mtick.PercentFormatter(decimals=0))
 
         ax.set_xlabel('Adóteljesítményének maximális eltérése')
         ax.set_ylabel('Interferencia becslés hibája (%)')
-        
-        pu.export_plot(fig, 'interference_approx.pgf', 2.8)
 
+        pu.export_plot(fig, filename, 2.8)
@@ -0,0 +1,684 @@
+import numpy as np
+from dataclasses import dataclass
+from scipy import sparse
+from scipy.optimize import milp, Bounds, LinearConstraint
+from model.network import Cols
+from model.connop import ConnectionFilter
+from model.trace import log
+
+
+def ragged_range(starts, lens):
+    ends = np.cumsum(lens)
+    total = ends[-1] if len(ends) else 0
+    return np.repeat(starts - ends + lens, lens) + np.arange(total)
+
+
+class Formulation:
+    def __init__(self, net, fconns, alpha, rho, prune_mcs=True):
+        self.fconns = fconns
+        self.alpha = alpha
+        self.rho = rho
+
+        # constants
+        BW = net.channel.bandwidth
+        self.BW = BW[1] - BW[0]
+
+        self.E = len(fconns)
+        levels = range(net.mcst.levels)
+        mcs_snr = np.array([net.mcst[m].snr for m in levels])
+        mcs_eff = np.array([net.mcst[m].efficiency for m in levels])
+
+        ## (edge, mcs) pairs that get variables, in edge major order
+        reachable = self.reachable_levels(net, fconns, mcs_snr, prune_mcs)
+        self.lvl_edge, self.lvl_m = np.nonzero(reachable)
+        self.lvl_ptr = ConnectionFilter._offsets(self.lvl_edge, self.E)
+        self.K = len(self.lvl_m)
+        self.lvl_snr = mcs_snr[self.lvl_m]
+        self.lvl_eff = mcs_eff[self.lvl_m]
+
+        self.pruned_vars = 2 * (reachable.size - self.K)
+        self.pruned_constraints = reachable.size - self.K
+        log(f'MCS presolve: removed {self.pruned_vars} variables, {self.pruned_constraints} constraints')
+
+        # per connection constants
+
+        u_gain = net.ues[Cols.GAIN].values
+        u_pow = net.ues[Cols.MAX_POW].values
+        b_gain = net.gnbs[Cols.GAIN].values
+        self.u_demand = net.ues[Cols.DEMAND].values
+        ## gNBs may have less than the channel, e.g. a share of it in a decomposed model
+        self.gnb_bw = np.full(fconns.gnb_count, self.BW)
+        if Cols.MAX_BW in net.gnbs:
+            self.gnb_bw = np.minimum(self.gnb_bw, net.gnbs[Cols.MAX_BW].values)
+
+        bidx, ueidx = fconns.bidx, fconns.ueidx
+        ## the model is built in double precision whatever the table stores
+        self.weight = fconns.take(net.conns['weight']).astype(float)
+        self.e_pow = u_pow[ueidx]
+        ## noise and interference + pathloss - gain of UE - gain of gNB
+        self.e_loss = (
+            net.channel.noise + fconns.take(net.conns['pathloss']).astype(float)
+            - u_gain[ueidx] - b_gain[bidx]
+        )
+
+
+    @staticmethod
+    def reachable_levels(net, fconns, mcs_snr, prune_mcs):
+        reachable = np.ones((len(fconns), len(mcs_snr)), dtype=bool)
+        if not prune_mcs or 'max_snr' not in net.conns:
+            return reachable
+
+        ## an mcs needs S <= max_power, which is snr <= max_snr
+        max_snr = fconns.take(net.conns['max_snr']).astype(float)
+        reachable = mcs_snr[None, :] <= max_snr[:, None] + 1e-9
+
+        ## keep a level on dead links, so they stay as infeasible as without presolve
+        reachable[~reachable.any(axis=1), 0] = True
+        return reachable
+
+
+@dataclass
+class Solution:
+    bandwidth: np.ndarray
+    signal_power: np.ndarray
+    x: np.ndarray
+    y: np.ndarray
+    bm: np.ndarray
+    objective: float
+
+
+class SolverBackend:
+    ## whether the backend can limit its threads to threads
+    limits_threads = True
+
+    def __init__(self, log_output=True, mip_gap=None, time_limit=None, threads=None):
+        self.log_output = log_output
+        self.mip_gap = mip_gap
+        self.time_limit = time_limit
+        self.threads = threads
+
+
+    def build(self, form: Formulation, lazy_protection=False) -> None:
+        raise NotImplementedError('build() must be implemented by backend')
+
+
+    def add_protection(self, p1, p2) -> None:
+        raise NotImplementedError('add_protection() must be implemented by backend')
+
+
+    def add_mip_start(self, solution: Solution) -> None:
+        ## backends without warm starts ignore it
+        pass
+
+
+    def solve(self) -> Solution:
+        raise NotImplementedError('solve() must be implemented by backend')
+
+
+    def end(self) -> None:
+        pass
+
+
+    def close(self) -> None:
+        ## releases what the backend keeps between solves, end() is per solve
+        pass
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class DocplexBackend(SolverBackend):
+    def build(self, form, lazy_protection=False):
+        self.form = form
+        self.model = mdl = self.new_model()
+
+        E, K, BW = form.E, form.K, form.BW
+        fconns = form.fconns
+
+        # decision variables, indexed by the edge ids of fconns
+        self.Bm = Bm = mdl.continuous_var_list(K, 0, BW)
+        self.B = B = mdl.continuous_var_list(E, 0, BW)
+        self.S = S = mdl.continuous_var_list(E)
+        self.bm = bm = mdl.binary_var_list(K)
+        self.x = x = mdl.continuous_var_list(E, 0)
+        self.y = y = mdl.continuous_var_list(E, 0)
+
+        ptr = form.lvl_ptr.tolist()
+        Bm_e = [Bm[ptr[i]:ptr[i+1]] for i in range(E)]
+        bm_e = [bm[ptr[i]:ptr[i+1]] for i in range(E)]
+        snr_e = [form.lvl_snr[ptr[i]:ptr[i+1]].tolist() for i in range(E)]
+        eff_e = [form.lvl_eff[ptr[i]:ptr[i+1]].tolist() for i in range(E)]
+
+        weight = form.weight.tolist()
+        e_pow = form.e_pow.tolist()
+        e_loss = form.e_loss.tolist()
+
+        # constraints
+
+        mdl.add_constraints(B[i] == mdl.sum_vars(Bm_e[i]) for i in range(E))
+
+        ## constraint on calculating signal power
+        mdl.add_constraints(
+            S[i] >= mdl.scal_prod(bm_e[i], snr_e[i]) + e_loss[i]
+            for i in range(E)
+        )
+
+        ## power is less than maximum
+        mdl.add_constraints(S[i] <= e_pow[i] for i in range(E))
+
+        ## only one mcs is selected per connection
+        mdl.add_constraints(mdl.sum_vars(bm_e[i]) == 1 for i in range(E))
+
+        ## only selected mcs is used
+        mdl.add_constraints(Bm[k] <= BW * bm[k] for k in range(K))
+
+        ## total traffic is less than capacity
+        mdl.add_constraints(
+            x[i] + y[i] <= mdl.scal_prod(Bm_e[i], eff_e[i])
+            for i in range(E)
+        )
+
+        for u in range(fconns.ue_count):
+            u_conns = fconns.ue_edges(u).tolist()
+
+            ## total bandwidth of a UE is less than BW
+            mdl.add_constraint(mdl.sum_vars(B[i] for i in u_conns) <= BW)
+
+            ## traffic demand of UE is satisfied
+            mdl.add_constraint(mdl.sum_vars(x[i] for i in u_conns) >= form.u_demand[u])
+
+            ## single protection, implied by double protection,
+            ## the lazy mode starts from it and separates the pairs
+            if lazy_protection:
+                y_u = [y[i] for i in u_conns]
+                mdl.add_constraints(
+                    mdl.sum_vars(y_u[:j1] + y_u[j1+1:]) >= x[e1]
+                    for j1, e1 in enumerate(u_conns)
+                )
+
+        ## double protection
+        if not lazy_protection:
+            self.add_protection(*fconns.ue_pairs())
+
+        ## total bandwidth of a gNB is less than its cap
+        gnb_bw = form.gnb_bw.tolist()
+        mdl.add_constraints(
+            mdl.sum_vars(B[i] for i in fconns.gnb_edges(b).tolist()) <= gnb_bw[b]
+            for b in range(fconns.gnb_count)
+        )
+
+        # objective
+
+        mdl.minimize(
+            mdl.scal_prod(x, weight) + form.alpha * mdl.scal_prod(y, weight)
+            + form.rho * mdl.sum_vars(S)
+        )
+
+
+    def new_model(self):
+        from docplex.mp.model import Model
+
+        mdl = Model('5g_network', log_output=self.log_output)
+        if self.mip_gap is not None:
+            mdl.parameters.mip.tolerances.mipgap = self.mip_gap
+        if self.time_limit is not None:
+            mdl.parameters.timelimit = self.time_limit
+        if self.threads is not None:
+            mdl.parameters.threads = self.threads
+        return mdl
+
+
+    def add_protection(self, p1, p2):
+        fconns = self.form.fconns
+        x, y = self.x, self.y
+
+        ## e1 and e2 both fail, the rest of the UE's links carry their traffic
+        def others(e1, e2):
+            return (
+                y[i] for i in fconns.ue_edges(fconns.ueidx[e1]).tolist()
+                if i != e1 and i != e2
+            )
+
+        self.model.add_constraints(
+            self.model.sum_vars(others(e1, e2)) >= x[e1] + x[e2]
+            for e1, e2 in zip(p1.tolist(), p2.tolist())
+        )
+
+
+    def add_mip_start(self, solution):
+        from docplex.mp.constants import EffortLevel
+
+        ## Bm is the bandwidth on the selected level
+        Bm = solution.bm * solution.bandwidth[self.form.lvl_edge]
+        values = np.concatenate([
+            solution.bandwidth, solution.signal_power, solution.x, solution.y, Bm, solution.bm])
+        variables = self.B + self.S + self.x + self.y + self.Bm + self.bm
+        self.model.add_mip_start(
+            self.model.new_solution(dict(zip(variables, values.tolist()))),
+            effort_level=EffortLevel.Repair)
+
+
+    def solve(self):
+        solution = self.model.solve()
+        if solution is None:
+            return None
+
+        return Solution(
+            np.array(solution.get_values(self.B)),
+            np.array(solution.get_values(self.S)),
+            np.array(solution.get_values(self.x)),
+            np.array(solution.get_values(self.y)),
+            np.round(solution.get_values(self.bm)),
+            solution.objective_value
+        )
+
+
+    @property
+    def status(self):
+        return self.model.get_solve_status()
+
+
+    @property
+    def num_vars(self):
+        return self.model.number_of_variables
+
+
+    @property
+    def num_constraints(self):
+        return self.model.number_of_constraints
+
+
+    def end(self):
+        self.model.end()
+
+
+@dataclass
+class EdgeVars:
+    levels: tuple
+    B: object
+    S: object
+    x: object
+    y: object
+    Bm: list
+    bm: list
+    constraints: list
+    signal: object
+    power: object
+    e_loss: float
+    e_pow: float
+
+
+class PersistentDocplexBackend(DocplexBackend):
+    ## keeps the model between builds: a new formulation only adds the
+    ## connections that appeared, retires the ones that went, and moves the
+    ## right hand sides that changed, the last solution is the next MIP start;
+    ## docplex cannot delete variables, retired ones are fixed to zero until
+    ## they outnumber compact_ratio of the model and it is built again
+    def __init__(self, log_output=True, mip_gap=None, time_limit=None, threads=None, compact_ratio=0.5):
+        super().__init__(log_output, mip_gap, time_limit, threads)
+        self.compact_ratio = compact_ratio
+        self.model = None
+        self.retired = 0
+        self.values = {}
+
+
+    def build(self, form, lazy_protection=False):
+        if lazy_protection:
+            raise ValueError('The persistent model keeps every protection pair, it has no lazy mode')
+        if self.model is None or self.retired > self.compact_ratio * self.model.number_of_variables:
+            self._new_model()
+        self.form = form
+        self._update(form)
+
+
+    def _new_model(self):
+        self.close()
+        self.model = self.new_model()
+
+        self.edges = {}
+        self.ue_constraints = {}
+        self.gnb_constraints = {}
+        self.retired = 0
+        self.values = {}
+
+
+    def _update(self, form):
+        mdl = self.model
+        fconns = form.fconns
+        ptr = form.lvl_ptr.tolist()
+        keys = list(zip(fconns.bidx.tolist(), fconns.ueidx.tolist()))
+        levels = [tuple(form.lvl_m[ptr[i]:ptr[i+1]].tolist()) for i in range(form.E)]
+
+        current = dict(zip(keys, levels))
+        for key in [key for key, edge in self.edges.items() if current.get(key) != edge.levels]:
+            self._retire(self.edges.pop(key))
+
+        e_pow = form.e_pow.tolist()
+        e_loss = form.e_loss.tolist()
+        for i, key in enumerate(keys):
+            edge = self.edges.get(key)
+            if edge is None:
+                self.edges[key] = self._add_edge(form, i, levels[i], e_pow[i], e_loss[i])
+                continue
+            if edge.e_loss != e_loss[i]:
+                edge.signal.rhs = edge.e_loss = e_loss[i]
+            if edge.e_pow != e_pow[i]:
+                edge.power.rhs = edge.e_pow = e_pow[i]
+
+        ## UE and gNB rows are only made again when their connections changed,
+        ## they are told apart by the variable indices, which are never reused
+        edges = [self.edges[key] for key in keys]
+        row_ids = [edge.B.index for edge in edges]
+        for u in range(fconns.ue_count):
+            u_edges = fconns.ue_edges(u).tolist()
+            u_keys = tuple(row_ids[i] for i in u_edges)
+            demand = float(form.u_demand[u])
+            stored = self.ue_constraints.get(u)
+            if stored is not None and stored[0] == u_keys:
+                if stored[1] != demand:
+                    stored[2].rhs = demand
+                    self.ue_constraints[u] = (u_keys, demand) + stored[2:]
+                continue
+            if stored is not None:
+                mdl.remove_constraints([stored[2]] + stored[3])
+            self.ue_constraints[u] = self._add_ue(form, [edges[i] for i in u_edges], u_keys, demand)
+        for u in [u for u in self.ue_constraints if u >= fconns.ue_count]:
+            _, _, demand, others = self.ue_constraints.pop(u)
+            mdl.remove_constraints([demand] + others)
+
+        gnb_bw = form.gnb_bw.tolist()
+        for b in range(fconns.gnb_count):
+            b_edges = fconns.gnb_edges(b).tolist()
+            b_keys = tuple(row_ids[i] for i in b_edges)
+            stored = self.gnb_constraints.get(b)
+            if stored is not None and stored[0] == b_keys:
+                if stored[1].rhs.constant != gnb_bw[b]:
+                    stored[1].rhs = gnb_bw[b]
+                continue
+            if stored is not None:
+                mdl.remove_constraint(stored[1])
+            self.gnb_constraints[b] = (b_keys, mdl.add_constraint(
+                mdl.sum_vars(edges[i].B for i in b_edges) <= gnb_bw[b]))
+        for b in [b for b in self.gnb_constraints if b >= fconns.gnb_count]:
+            mdl.remove_constraint(self.gnb_constraints.pop(b)[1])
+
+        # variables in the order of the formulation, as solve() reads them
+        self.B = [edge.B for edge in edges]
+        self.S = [edge.S for edge in edges]
+        self.x = [edge.x for edge in edges]
+        self.y = [edge.y for edge in edges]
+        self.Bm = [v for edge in edges for v in edge.Bm]
+        self.bm = [v for edge in edges for v in edge.bm]
+
+        weight = form.weight.tolist()
+        mdl.minimize(
+            mdl.scal_prod(self.x, weight) + form.alpha * mdl.scal_prod(self.y, weight)
+            + form.rho * mdl.sum_vars(self.S)
+        )
+
+        ## the previous solution of the variables that are still there
+        mdl.clear_mip_starts()
+        start = {v: self.values[v.index] for v in self.B + self.S + self.x + self.y + self.Bm + self.bm
+                 if v.index in self.values}
+        if start:
+            mdl.add_mip_start(mdl.new_solution(start))
+
+
+    def _add_edge(self, form, i, levels, e_pow, e_loss):
+        mdl = self.model
+        BW = form.BW
+        lvl = slice(form.lvl_ptr[i], form.lvl_ptr[i + 1])
+        snr = form.lvl_snr[lvl].tolist()
+        eff = form.lvl_eff[lvl].tolist()
+
+        Bm = mdl.continuous_var_list(len(levels), 0, BW)
+        bm = mdl.binary_var_list(len(levels))
+        B = mdl.continuous_var(0, BW)
+        S = mdl.continuous_var()
+        x = mdl.continuous_var(0)
+        y = mdl.continuous_var(0)
+
+        ## the same rows as DocplexBackend, constants on the right so they can move
+        signal = mdl.add_constraint(S - mdl.scal_prod(bm, snr) >= e_loss)
+        power = mdl.add_constraint(S <= e_pow)
+        constraints = [
+            mdl.add_constraint(B == mdl.sum_vars(Bm)),
+            mdl.add_constraint(mdl.sum_vars(bm) == 1),
+            mdl.add_constraint(x + y <= mdl.scal_prod(Bm, eff)),
+            *mdl.add_constraints(Bm[k] <= BW * bm[k] for k in range(len(levels))),
+        ]
+        return EdgeVars(levels, B, S, x, y, Bm, bm, constraints, signal, power, e_loss, e_pow)
+
+
+    def _add_ue(self, form, edges, keys, demand):
+        mdl = self.model
+        B = [edge.B for edge in edges]
+        x = [edge.x for edge in edges]
+        y = [edge.y for edge in edges]
+
+        demand_ct = mdl.add_constraint(mdl.sum_vars(x) >= demand)
+        others = [mdl.add_constraint(mdl.sum_vars(B) <= form.BW)]
+
+        ## double protection, the pairs of the UE's links
+        for j1 in range(len(edges)):
+            for j2 in range(j1 + 1, len(edges)):
+                rest = [y[j] for j in range(len(edges)) if j != j1 and j != j2]
+                others.append(mdl.add_constraint(mdl.sum_vars(rest) >= x[j1] + x[j2]))
+        return keys, demand, demand_ct, others
+
+
+    def _retire(self, edge):
+        self.model.remove_constraints(edge.constraints + [edge.signal, edge.power])
+        for v in [edge.B, edge.S, edge.x, edge.y] + edge.Bm + edge.bm:
+            v.lb = 0
+            v.ub = 0
+            self.values.pop(v.index, None)
+        self.retired += 4 + 2 * len(edge.levels)
+
+
+    def add_protection(self, p1, p2):
+        raise NotImplementedError('The persistent model keeps every protection pair')
+
+
+    def solve(self):
+        solution = super().solve()
+        if solution is not None:
+            active = self.B + self.S + self.x + self.y + self.Bm + self.bm
+            self.values = dict(zip((v.index for v in active), self.model.solution.get_values(active)))
+        return solution
+
+
+    def end(self):
+        ## the model outlives the solve, close() releases it
+        pass
+
+
+    def close(self):
+        if self.model is not None:
+            self.model.end()
+            self.model = None
+
+
+    def __del__(self):
+        self.close()
+
+
+class HighsBackend(SolverBackend):
+    ## scipy does not expose the thread count of HiGHS
+    limits_threads = False
+
+    def build(self, form, lazy_protection=False):
+        self.form = form
+        self.status = None
+
+        E, K, BW = form.E, form.K, form.BW
+        fconns = form.fconns
+        inf = np.inf
+
+        ## column offsets of the variable blocks
+        self.oBm, self.obm, self.oB, self.oS, self.ox, self.oy, self.n = np.cumsum(
+            [0, K, K, E, E, E, E])
+        self.rows, self.cols, self.vals = [], [], []
+        self.row_lb, self.row_ub = [], []
+        self.row_count = 0
+
+        e = np.arange(E)
+        k = np.arange(K)
+        le = form.lvl_edge
+        ones_E = np.ones(E)
+        ones_K = np.ones(K)
+
+        # variable bounds, S <= max_power is a bound here
+
+        self.lb = np.zeros(self.n)
+        self.ub = np.full(self.n, inf)
+        self.ub[self.oBm:self.oBm + K] = BW
+        self.ub[self.obm:self.obm + K] = 1
+        self.ub[self.oB:self.oB + E] = BW
+        self.ub[self.oS:self.oS + E] = form.e_pow
+
+        self.integrality = np.zeros(self.n)
+        self.integrality[self.obm:self.obm + K] = 1
+
+        # constraints
+
+        ## B is the sum of Bm
+        self._add_rows(
+            E, (e, le), (self.oB + e, self.oBm + k), (ones_E, -ones_K), 0, 0)
+
+        ## constraint on calculating signal power
+        self._add_rows(
+            E, (e, le), (self.oS + e, self.obm + k), (ones_E, -form.lvl_snr),
+            form.e_loss, inf)
+
+        ## only one mcs is selected per connection
+        self._add_rows(E, (le,), (self.obm + k,), (ones_K,), 1, 1)
+
+        ## only selected mcs is used
+        self._add_rows(
+            K, (k, k), (self.oBm + k, self.obm + k), (ones_K, -BW * ones_K), -inf, 0)
+
+        ## total traffic is less than capacity
+        self._add_rows(
+            E, (e, e, le), (self.ox + e, self.oy + e, self.oBm + k),
+            (ones_E, ones_E, -form.lvl_eff), -inf, 0)
+
+        ## total bandwidth of a UE is less than BW
+        self._add_rows(
+            fconns.ue_count, (fconns.ueidx,), (self.oB + e,), (ones_E,), -inf, BW)
+
+        ## traffic demand of UE is satisfied
+        self._add_rows(
+            fconns.ue_count, (fconns.ueidx,), (self.ox + e,), (ones_E,), form.u_demand, inf)
+
+        ## total bandwidth of a gNB is less than its cap
+        self._add_rows(
+            fconns.gnb_count, (fconns.bidx,), (self.oB + e,), (ones_E,), -inf, form.gnb_bw)
+
+        ## single protection for the lazy mode, double protection otherwise
+        if lazy_protection:
+            self._add_protection_rows(fconns.ueidx, (e,))
+        else:
+            self.add_protection(*fconns.ue_pairs())
+
+        # objective
+
+        self.c = np.zeros(self.n)
+        self.c[self.oS:self.oS + E] = form.rho
+        self.c[self.ox:self.ox + E] = form.weight
+        self.c[self.oy:self.oy + E] = form.alpha * form.weight
+
+
+    def add_protection(self, p1, p2):
+        self._add_protection_rows(self.form.fconns.ueidx[p1], (p1, p2))
+
+
+    def _add_protection_rows(self, ues, excluded):
+        fconns = self.form.fconns
+        count = len(ues)
+        r = np.arange(count)
+
+        ## y of every link of the UE, then take the excluded links back out
+        degree = fconns.ue_degree[ues]
+        edges = fconns.ue_order[ragged_range(fconns.ue_ptr[ues], degree)]
+        rows = [np.repeat(r, degree)]
+        cols = [self.oy + edges]
+        vals = [np.ones(len(edges))]
+        for ex in excluded:
+            rows += [r, r]
+            cols += [self.oy + ex, self.ox + ex]
+            vals += [-np.ones(count), -np.ones(count)]
+
+        self._add_rows(count, rows, cols, vals, 0, np.inf)
+
+
+    def _add_rows(self, count, rows, cols, vals, lb, ub):
+        self.rows.append(np.concatenate(rows) + self.row_count)
+        self.cols.append(np.concatenate(cols))
+        self.vals.append(np.concatenate(vals))
+        self.row_lb.append(np.broadcast_to(lb, count))
+        self.row_ub.append(np.broadcast_to(ub, count))
+        self.row_count += count
+
+
+    def matrix(self):
+        A = sparse.coo_array(
+            (np.concatenate(self.vals), (np.concatenate(self.rows), np.concatenate(self.cols))),
+            shape=(self.row_count, self.n)
+        ).tocsr()
+        A.sum_duplicates()
+        A.eliminate_zeros()
+        return A
+
+
+    def solve(self):
+        options = {'disp': self.log_output}
+        if self.mip_gap is not None:
+            options['mip_rel_gap'] = self.mip_gap
+        if self.time_limit is not None:
+            options['time_limit'] = self.time_limit
+
+        res = milp(
+            self.c,
+            integrality=self.integrality,
+            bounds=Bounds(self.lb, self.ub),
+            constraints=LinearConstraint(
+                self.matrix(), np.concatenate(self.row_lb), np.concatenate(self.row_ub)),
+            options=options
+        )
+        self.status = res.message
+        if res.x is None:
+            return None
+
+        v = res.x
+        E, K = self.form.E, self.form.K
+        return Solution(
+            v[self.oB:self.oB + E],
+            v[self.oS:self.oS + E],
+            v[self.ox:self.ox + E],
+            v[self.oy:self.oy + E],
+            np.round(v[self.obm:self.obm + K]),
+            res.fun
+        )
+
+
+    @property
+    def num_vars(self):
+        return int(self.n)
+
+
+    @property
+    def num_constraints(self):
+        return self.row_count
+
+
+BACKENDS = {
+    'docplex': DocplexBackend,
+    'persistent': PersistentDocplexBackend,
+    'highs': HighsBackend,
+}
@@ -0,0 +1,190 @@
+import numpy as np
+from model.operations import *
+from model.network import Tables, Cols
+from model.connop import ConnectionFilter, ElementwiseOperation, DistanceCalc, is_sparse, merge_slots
+from model.spatial import SpatialIndex
+from model.trace import log
+
+
+class UeTile:
+    ## the connections of some UEs, their (gNB, UE) columns when dense,
+    ## the edges b, u when sparse
+    def __init__(self, ues=None, b=None, u=None):
+        self.sparse = b is not None
+        self.ues, self.b, self.u = ues, b, u
+
+
+    def gnb(self, values):
+        if self.sparse:
+            return values[self.b]
+        return values[:, None]
+
+
+    def ue(self, values):
+        if self.sparse:
+            return values[self.u]
+        return values[self.ues]
+
+
+class Mobility(Operation):
+    ## one step of UE movement, recomputing the connection columns of the chain
+    ## that built them only for the UEs that changed;
+    ## ids are rows of net.ues as it is when executed: moved rows already hold
+    ## their new values, joined rows were appended after the UEs of the connection
+    ## table, departed rows are removed here and the rows after them shift down
+    barrier = True
+
+    def __init__(self, ops, moved=(), joined=(), departed=(), chunk_size=2**18):
+        self.ops = list(ops.ops if isinstance(ops, OpSequence) else [ops])
+        for op in self.ops:
+            if not isinstance(op, ElementwiseOperation):
+                raise TypeError(f'{type(op).__name__} is not elementwise, it cannot be updated per UE')
+        self.moved = np.unique(np.asarray(moved, dtype=int))
+        self.joined = np.unique(np.asarray(joined, dtype=int))
+        self.departed = np.unique(np.asarray(departed, dtype=int))
+        self.chunk_size = chunk_size
+
+
+    def requirements(self):
+        required, produced = set(), set()
+        for op in self.ops:
+            required |= op.requirements() - produced
+            produced |= op.products()
+        return required
+
+
+    def products(self):
+        return set().union(*(op.products() for op in self.ops))
+
+
+    def execute(self, net: NetworkData) -> None:
+        columns = [op.column for op in self.ops]
+        required = {col for table, col in self.requirements() if table == Tables.CONN}
+        if required:
+            raise ValueError(f'The chain needs {sorted(required)} from outside, it cannot be updated per UE')
+        check_columns(self, net, Tables.CONN, columns)
+
+        sparse = is_sparse(net.conns)
+        distance = next((op for op in self.ops if isinstance(op, DistanceCalc)), None)
+        if sparse and distance is None:
+            raise ValueError('A sparse table needs DistanceCalc in the chain to find the new pairs')
+
+        count = len(net.ues)
+        old_count = count - len(self.joined)
+        if not np.array_equal(self.joined, np.arange(old_count, count)):
+            raise ValueError('Joined UEs have to be the rows after the UEs of the connection table')
+
+        ## the filter of the old table, if it was built for it
+        fconns = net.__dict__.get('_fconns')
+        if fconns is not None and (fconns.ue_count != old_count or not self._matches(fconns, net, old_count)):
+            fconns = None
+
+        alive = np.ones(count, dtype=bool)
+        alive[self.departed] = False
+        ue_map = np.where(alive, np.cumsum(alive) - 1, -1)
+        ues = ue_map[np.union1d(self.moved, self.joined)]
+        ues = ues[ues >= 0]
+
+        if not alive.all():
+            net.ues = net.ues[alive].reset_index(drop=True)
+            if Cols.ID in net.ues:
+                net.ues[Cols.ID] = np.arange(len(net.ues))
+
+        ## columns the chain does not make are stale for the changed UEs
+        for col in [col for col in net.conns if col not in columns and col not in (Cols.BID, Cols.UEID)]:
+            log(f'Mobility: dropping stale column {col}')
+            del net.conns[col]
+
+        if sparse:
+            self._update_sparse(net, ue_map, ues, distance.radius)
+        else:
+            self._update_dense(net, ue_map, ues)
+
+        if fconns is not None:
+            net.__dict__['_fconns'] = fconns.updated(net, ue_map[:old_count], ues)
+        net.__dict__.get('_spatial', {}).pop(Tables.UE, None)
+
+
+    def _update_dense(self, net, ue_map, ues):
+        old_count = len(ue_map) - len(self.joined)
+        survivors = np.flatnonzero(ue_map[:old_count] >= 0)
+        resized = len(survivors) != old_count or len(self.joined)
+
+        G, U = len(net.gnbs), len(net.ues)
+        for op in self.ops:
+            if resized:
+                old = net.conns[op.column]
+                column = np.zeros((G, U), dtype=old.dtype)
+                column[:, ue_map[survivors]] = old[:, survivors]
+                net.conns[op.column] = column
+            self._prepare(op, net)
+
+        step = max(1, self.chunk_size // max(1, G))
+        for start in range(0, len(ues), step):
+            chunk = ues[start:start + step]
+            cols = self._kernels(net, UeTile(ues=chunk))
+            for col, values in cols.items():
+                net.conns[col][:, chunk] = values
+
+
+    def _update_sparse(self, net, ue_map, ues, radius):
+        ## edges of unchanged UEs keep their rows, the changed UEs get the
+        ## gNBs within radius of their new position merged in
+        b, u = net.conns[Cols.BID], ue_map[net.conns[Cols.UEID]]
+        recomputed = np.zeros(len(net.ues), dtype=bool)
+        recomputed[ues] = True
+        kept = u >= 0
+        kept[kept] = ~recomputed[u[kept]]
+
+        ux, uy = net.ues['x'].values[ues], net.ues['y'].values[ues]
+        i, new_b = SpatialIndex.of(net, Tables.B).pairs_within(ux, uy, radius)
+        new_u = ues[i]
+        order = np.lexsort((new_u, new_b))
+        new_b, new_u = new_b[order], new_u[order]
+
+        U = len(net.ues)
+        slot, pos_new = merge_slots(
+            b[kept].astype(np.int64) * U + u[kept], new_b.astype(np.int64) * U + new_u)
+
+        for col, values in ((Cols.BID, new_b), (Cols.UEID, new_u)):
+            old = b if col == Cols.BID else u
+            column = np.empty(len(slot), dtype=net.dtypes.dtype_for(col, old.dtype))
+            column[slot], column[pos_new] = old[kept], values
+            net.conns[col] = column
+
+        for op in self.ops:
+            old = net.conns[op.column]
+            column = np.empty(len(slot), dtype=old.dtype)
+            column[slot] = old[kept]
+            net.conns[op.column] = column
+            self._prepare(op, net)
+
+        for start in range(0, len(pos_new), self.chunk_size):
+            chunk = slice(start, start + self.chunk_size)
+            cols = self._kernels(net, UeTile(b=new_b[chunk], u=new_u[chunk]))
+            for col, values in cols.items():
+                net.conns[col][pos_new[chunk]] = values
+
+
+    @staticmethod
+    def _matches(fconns, net, old_count):
+        ## the joined rows are not in the table yet
+        ues = net.ues
+        net.ues = ues.iloc[:old_count]
+        try:
+            return fconns.matches(net)
+        finally:
+            net.ues = ues
+
+
+    def _prepare(self, op, net):
+        ## DistanceCalc would index the whole table again, the pairs are found here
+        if not isinstance(op, DistanceCalc):
+            op.prepare(net)
+
+
+    def _kernels(self, net, tile):
+        cols = {}
+        for op in self.ops:
+            cols[op.column] = net.dtypes.cast(op.column, op.kernel(net, cols, tile))
+        return cols
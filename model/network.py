@@ -2,6 +2,7 @@ import pandas as pd
 import numpy as np
 from dataclasses import dataclass
 from collections import namedtuple
+from typing import ClassVar
 
 
 class Tables:
@@ -26,6 +27,7 @@ class Cols:
     DEMAND = 'demand'
     WEIGHT = 'weight'
     GAIN = 'gain'
+    MAX_BW = 'max_bandwidth'
 
 
 @dataclass
@@ -55,6 +57,45 @@ class Channel:
     bandwidth: tuple[float, float] = (0, 1)
 
 
+@dataclass
+class DtypePolicy:
+    link: str = 'float64'
+    mask: str = 'bool'
+    mcs: str = 'int64'
+    index: str = 'int64'
+    packed: bool = False ## masks are saved as bitmaps
+
+    ## connection columns under the policy, the rest keep their dtype
+    COLUMNS: ClassVar[dict] = {
+        'distance': 'link',
+        'pathloss': 'link',
+        'weight': 'link',
+        'max_snr': 'link',
+        'filter': 'mask',
+        'mcs_idx': 'mcs',
+        Cols.BID: 'index',
+        Cols.UEID: 'index',
+    }
+
+    @staticmethod
+    def compact():
+        return DtypePolicy('float32', 'bool', 'int8', 'int32', True)
+
+
+    def dtype_for(self, column, default=None):
+        kind = self.COLUMNS.get(column)
+        if kind is None:
+            return None if default is None else np.dtype(default)
+        return np.dtype(getattr(self, kind))
+
+
+    def cast(self, column, values):
+        dtype = self.dtype_for(column)
+        if dtype is None:
+            return values
+        return np.asarray(values).astype(dtype, copy=False)
+
+
 @dataclass
 class NetworkData:
     ues = pd.DataFrame()
@@ -62,3 +103,6 @@ class NetworkData:
     conns = dict()
     channel = Channel()
     mcst = MCSTable()
+    dtypes = DtypePolicy()
+    ## key of the .5gn.ini and seed the tables were generated from, see Load
+    scenario = None
@@ -1,30 +1,97 @@
+import os
+import functools
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from model.network import NetworkData
+from model import trace
 
 
 class RequiredColumnMissingException(Exception):
-    def __init__(self, table, column, classname) -> None:
-        super().__init__(
-            f'Table "{table}" has no column "{column}", but operation "{classname}" requires it.') 
+    def __init__(self, table, column, classname, more=()) -> None:
+        ## more are (classname, table, column) of other missing columns, a dry run reports all
+        message = f'Table "{table}" has no column "{column}", but operation "{classname}" requires it.'
+        if more:
+            message += ' Also missing: ' + ', '.join(
+                f'"{column}" of "{table}" for "{classname}"' for classname, table, column in more) + '.'
+        super().__init__(message)
+        self.missing = [(classname, table, column), *more]
 
 
+def table_columns(net, table):
+    real_cols = getattr(net, table)
+    if table != 'conns':
+        real_cols = real_cols.columns
+    return real_cols
+
+
+def check_columns(op, net, table, columns, provided=()):
+    real_cols = table_columns(net, table)
+    for column in columns:
+        if column not in real_cols and column not in provided:
+            raise RequiredColumnMissingException(table, column, op.__class__.__name__)
+
+
+## the decorators leave (table, columns) pairs on execute, outermost first,
+## so the operations can be inspected without running them
+
 def requires(table: str, *columns: str):
     def requires_dec(func):
+        @functools.wraps(func)
         def check_colums(self, net):
-            real_cols = getattr(net, table)
-            if table != 'conns':
-                real_cols = real_cols.columns
-            for column in columns:
-                if column not in real_cols:
-                    raise RequiredColumnMissingException(table, column, self.__class__.__name__)
+            check_columns(self, net, table, columns)
             func(self, net)
+        check_colums.required = [(table, columns)] + getattr(func, 'required', [])
         return check_colums
     return requires_dec
 
 
+def uses(table: str, *columns: str):
+    ## optional inputs, they order the operation after their writers but are not checked
+    def uses_dec(func):
+        func.used = [(table, columns)] + getattr(func, 'used', [])
+        return func
+    return uses_dec
+
+
+def produces(table: str, *columns: str):
+    def produces_dec(func):
+        func.produced = [(table, columns)] + getattr(func, 'produced', [])
+        return func
+    return produces_dec
+
+
+def declared(func, attr, unknown=False):
+    pairs = getattr(func, attr, None)
+    if pairs is None:
+        return None if unknown else set()
+    return {(table, column) for table, columns in pairs for column in columns}
+
+
 class Operation:
+    ## operations with effects beyond their declared columns never run alongside others
+    barrier = False
+
     def execute(self, net: NetworkData) -> None:
         raise NotImplementedError('execute() must be implemented by operation')
-    
+
+
+    def requirements(self):
+        return declared(self.execute, 'required')
+
+
+    def usages(self):
+        return declared(self.execute, 'used')
+
+
+    def products(self):
+        ## None if the operation does not declare what it writes
+        return declared(self.execute, 'produced', unknown=True)
+
+
+    def cached(self, cache=None):
+        ## memoized on disk, keyed on the inputs, parameters and code, see model/cache.py
+        from model.cache import CachedOperation
+        return CachedOperation(self, cache)
+
 
     def __and__(self, other):
         if issubclass(type(other), Operation):
@@ -33,13 +100,31 @@ class Operation:
             return other & self
         else:
             raise TypeError('Operation can only be combined with Operation or OpSequence')
-    
+
 
 class OpSequence(Operation):
+    ## run chains of elementwise connection operations as one tiled pass
+    fusion = True
+
     def __init__(self, *ops):
         self.ops = ops
+        self.keep = None
+        self.workers = None
+
+
+    def outputs(self, *columns):
+        ## connection columns to leave in the table, the fused passes skip
+        ## writing the others unless a later operation requires them
+        self.keep = set(columns)
+        return self
+
+
+    def parallel(self, workers=None):
+        ## run independent operations on a thread pool, numpy releases the GIL
+        self.workers = workers or os.cpu_count()
+        return self
+
 
-    
     def __and__(self, other):
         if issubclass(type(other), Operation):
             return OpSequence(*self.ops, other)
@@ -47,7 +132,7 @@ class OpSequence(Operation):
             return OpSequence(*self.ops, *other.ops)
         else:
             raise TypeError('OpSequence can only be combined with Operation or OpSequence')
-        
+
 
     def __iand__(self, other):
         if issubclass(type(other), Operation):
@@ -58,9 +143,148 @@ class OpSequence(Operation):
             return self
         else:
             raise TypeError('OpSequence can only be combined with Operation or OpSequence')
-        
 
-    def execute(self, net: NetworkData) -> None:
+
+    @property
+    def barrier(self):
+        return any(is_barrier(op) for op in self.ops)
+
+
+    def requirements(self):
+        ## what the sequence needs from outside, not what it makes for itself
+        required, produced = set(), set()
         for op in self.ops:
+            required |= op.requirements() - produced
+            produced |= op.products() or set()
+        return required
+
+
+    def usages(self):
+        return set().union(*(op.usages() for op in self.ops))
+
+
+    def products(self):
+        products = [op.products() for op in self.ops]
+        if any(p is None for p in products):
+            return None
+        return set().union(*products)
+
+
+    def execute(self, net: NetworkData) -> None:
+        plan = self.plan()
+
+        ## fail before the expensive stages start
+        missing = self.dry_run(net, plan)
+        if missing:
+            (op, table, column), *more = missing
+            raise RequiredColumnMissingException(
+                table, column, op.__class__.__name__,
+                [(op.__class__.__name__, table, column) for op, table, column in more])
+
+        if self.workers is None:
+            for op in plan:
+                self._execute_step(op, net)
+        else:
+            self._execute_parallel(net, plan)
+
+
+    @staticmethod
+    def _execute_step(op, net):
+        with trace.operation(op, net):
             op.execute(net)
 
+
+    def plan(self):
+        if not self.fusion:
+            return list(self.ops)
+
+        plan = []
+        i = 0
+        while i < len(self.ops):
+            j = i
+            while j < len(self.ops) and getattr(self.ops[j], 'fuse', None):
+                j += 1
+
+            if j - i < 2:
+                plan.append(self.ops[i])
+                i += 1
+                continue
+
+            keep = None
+            if self.keep is not None:
+                keep = self.keep.union(
+                    *({c for t, c in op.requirements() if t == 'conns'} for op in self.ops[j:]))
+            plan.append(self.ops[i].fuse(self.ops[i:j], keep))
+            i = j
+        return plan
+
+
+    def dry_run(self, net, plan=None):
+        ## (operation, table, column) for every requirement nothing provides,
+        ## checking stops at the first operation that does not declare its products
+        plan = self.plan() if plan is None else plan
+        available = {(table, column) for table in ('ues', 'gnbs', 'conns')
+                     for column in table_columns(net, table)}
+
+        missing = []
+        for op in plan:
+            missing += [(op, table, column) for table, column in sorted(op.requirements() - available)]
+            products = op.products()
+            if products is None:
+                break
+            available |= products
+        return missing
+
+
+    def dependencies(self, plan=None):
+        ## for every step the earlier steps it has to wait for
+        plan = self.plan() if plan is None else plan
+        return [
+            {i for i in range(j) if conflicts(plan[i], plan[j])}
+            for j in range(len(plan))
+        ]
+
+
+    def _execute_parallel(self, net, plan):
+        deps = self.dependencies(plan)
+        pending = list(range(len(plan)))
+        running = {}
+        done = set()
+
+        with ThreadPoolExecutor(self.workers) as pool:
+            while pending or running:
+                for j in [j for j in pending if deps[j] <= done]:
+                    running[pool.submit(self._execute_step, plan[j], net)] = j
+                    pending.remove(j)
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    j = running.pop(future)
+                    if future.exception() is not None:
+                        for other in running:
+                            other.cancel()
+                        raise future.exception()
+                    done.add(j)
+
+
+def is_barrier(op):
+    return op.barrier or op.products() is None
+
+
+def conflicts(a, b):
+    if is_barrier(a) or is_barrier(b):
+        return True
+
+    reads_a = a.requirements() | a.usages()
+    reads_b = b.requirements() | b.usages()
+    writes_a, writes_b = a.products(), b.products()
+    if writes_a & reads_b or reads_a & writes_b or writes_a & writes_b:
+        return True
+
+    ## new DataFrame columns are not safe to add while the frame is read,
+    ## connection columns are separate arrays in a dict
+    tables_a = {table for table, _ in reads_a | writes_a}
+    tables_b = {table for table, _ in reads_b | writes_b}
+    frames_a = {table for table, _ in writes_a if table != 'conns'}
+    frames_b = {table for table, _ in writes_b if table != 'conns'}
+    return bool(frames_a & tables_b or frames_b & tables_a)
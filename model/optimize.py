@@ -1,202 +1,163 @@
 
-from docplex.mp.model import Model
+import time
 import numpy as np
 import utils.approx as approx
-import time
 from model.operations import *
 from model.network import *
 from model.interference import InterfApproxProvider, InterfApproxData
-from model.connop import ConnectionFilter
+from model.connop import ConnectionFilter, is_sparse
+from model.milp import Formulation, SolverBackend, BACKENDS
+from model.greedy import greedy_solution
+from model.trace import log, span
+
+
+class NoSolutionException(Exception): pass
 
 
 class Optimize(Operation):
-    def __init__(self, safety_level:int=0, ensure_safety:bool=True):
+    ## restored with the columns on a cache hit
+    cached_attributes = ('objective_value', 'greedy_objective')
+
+    def __init__(
+        self, safety_level:int=0, ensure_safety:bool=True,
+        lazy_protection:bool=False, prune_mcs:bool=True,
+        alpha:float=0.1, rho:float=1, backend='docplex',
+        greedy_start:bool=True
+    ):
         self.safety_level = safety_level
         self.ensure_safety = ensure_safety
+        self.lazy_protection = lazy_protection
+        self.prune_mcs = prune_mcs
+        self.protection_tol = 1e-5
+        self.alpha = alpha
+        self.rho = rho # energy factor
+        self.backend = backend
+        self.greedy_start = greedy_start
+        self.greedy_objective = None
 
 
     @requires(Tables.CONN, 'pathloss', 'weight')
     @requires(Tables.UE, 'demand', 'gain', 'max_power')
     @requires(Tables.B, 'gain')
+    @uses(Tables.CONN, 'filter', 'max_snr')
+    @uses(Tables.B, 'max_bandwidth')
+    @produces(Tables.CONN, 'bandwidth', 'signal_power', 'x_traffic', 'y_traffic', 'mcs_idx')
     def execute(self, net: NetworkData) -> None:
-        # TODO MODEL PARAMETERS MOVE TO CTOR
-        alpha = 0.1 # 
-        rho = 1 # energy factor
-
         # tables
-        conns = net.conns
-        fconns = ConnectionFilter(net)
+        fconns = ConnectionFilter.of(net)
 
-        self.model = Model('5g_network', log_output=True)
-
-        # constants
-        BW = net.channel.bandwidth
-        BW = BW[1] - BW[0]
-
-        self.calc_max_interference(net, fconns)
+        with span('max_interference'):
+            self.calc_max_interference(net, fconns)
         #self.create_approximations(BW)
 
-        # decision variables
-        Bm = self.model.continuous_var_matrix(fconns, net.mcst.levels, 0, BW)
-        B = self.model.continuous_var_dict(fconns, 0, BW)
-        S = self.model.continuous_var_dict(fconns)
-        bm = self.model.binary_var_matrix(fconns, net.mcst.levels)
-        x = self.model.continuous_var_dict(fconns, 0)
-        y = self.model.continuous_var_dict(fconns, 0)
-
-        # derived variables
-
-        '''
-        ## bandwidth of connections
-        B = {
-            i: self.model.sum([Bm[i, j] for j in range(net.mcst.levels) ])
-            for i in fconns.index
-        }
-        '''
-
-        ## signal to noise
-        snr = {
-            e: self.model.sum([
-                bm[e, m] * net.mcst[m][0]
-                for m in range(net.mcst.levels)
-            ]) for e in fconns
-        }
-
-        ## capacity of connections
-        c = {
-            e: self.model.sum([
-                Bm[e, m] * net.mcst[m][1]
-                for m in range(net.mcst.levels)
-            ]) for e in fconns
-        }
-
-        ## noise and interference
-        NI = {
-            e: net.channel.noise
-            #i: self.interference_for(i, row, B, S, fconns, net)
-            for e in fconns
-        }
-
-        '''
-        ## Signal power
-        S = {
-            i: snr[i] + NI[i] + row[Cols.PL]
-            - net.ues.loc[row[Cols.UEID]][Cols.GAIN]
-            - net.gnbs.loc[row[Cols.BID]][Cols.GAIN]
-            for i, row in fconns.iterrows()
-        }
-        '''
-
-        # constraints
-
-        u_gain = net.ues[Cols.GAIN].values
-        u_pow = net.ues[Cols.MAX_POW].values
-        u_demand = net.ues[Cols.DEMAND].values
-        b_gain = net.gnbs[Cols.GAIN].values
-
-        for b, u in fconns:
-            e = (b, u)
-
-            self.model.add_constraint(B[e] == self.model.sum([
-                Bm[e, m] for m in range(net.mcst.levels)
-            ]))
-
-            ## constraint on calculating signal power
-            self.model.add_constraint(
-                S[e] >= snr[e] + NI[e] + net.conns['pathloss'][e]
-                - u_gain[u] # gain of UE
-                - b_gain[b] # gain of gNB
-            )
-
-            ## power is less than maximum
-            self.model.add_constraint(S[e] <= u_pow[u])
-
-            ## only one mcs is selected per connection
-            self.model.add_constraint(self.model.sum([
-                bm[e, m] for m in range(net.mcst.levels)
-            ]) == 1)
-
-            ## only selected mcs is used
-            for m in range(net.mcst.levels):
-                self.model.add_constraint(Bm[e, m] <= BW * bm[e, m])
-
-            ## total traffic is less than capacity
-            self.model.add_constraint(x[e] + y[e] <= c[e])
-
-        for u in net.ues.index:
-            u_conns = [e for e in fconns if e[1] == u]
-
-            ## total bandwidth of a UE is less than BW
-            self.model.add_constraint(self.model.sum([
-                B[e] for e in u_conns
-            ]) <= BW)
-
-            ## traffic demand of UE is satisfied
-            self.model.add_constraint(self.model.sum([
-                x[e] for e in u_conns
-            ]) >= u_demand[u])
-
-            ## TODO lazy constraints
-            ## single protection
-            '''
-            for e1 in u_conns.index:
-                self.model.add_constraint([
-                    self.model.sum([
-                        y[e] for e in u_conns if e != e1
-                    ]) >= x[e1]
-                ])
-            '''
-
-            ## double protection
-            for e1 in u_conns:
-                for e2 in u_conns:
-                    if e1 == e2: continue
-                    self.model.add_constraint(
-                        self.model.sum([
-                            y[e] for e in u_conns if e != e1 and e != e2
-                        ]) >= x[e1] + x[e2]
-                    )
-
-        for b in net.gnbs.index:
-            b_conns = [e for e in fconns if e[0] == b]
-
-            ## total bandwidth of a gNB is less than BW
-            self.model.add_constraint(self.model.sum([
-                B[e] for e in b_conns
-            ]) <= BW)
-            
-        # objective
-            
-        self.model.minimize(
-            self.model.sum([
-                net.conns['weight'][e] * (x[e] + alpha * y[e]) + rho * S[e]
-                for e in fconns
-            ])
-        )
-
-        self.model.solve()
-
-        # Access the solution
-
-        shape = conns['weight'].shape
-        net.conns['bandwidth'] = np.zeros(shape, dtype=float)
-        net.conns['signal_power'] = np.zeros(shape, dtype=float)
-        net.conns['x_traffic'] = np.zeros(shape, dtype=float)
-        net.conns['y_traffic'] = np.zeros(shape, dtype=float)
-        net.conns['mcs_idx'] = np.zeros(shape, dtype=int)
-
-        for e in fconns:
-            net.conns['bandwidth'][e] = B[e].solution_value
-            net.conns['signal_power'][e] = S[e].solution_value
-            net.conns['x_traffic'][e] = x[e].solution_value
-            net.conns['y_traffic'][e] = y[e].solution_value
-            net.conns['mcs_idx'][e] = np.argmax([bm[e, m].solution_value for m in range(net.mcst.levels)])
-            if np.sum([bm[e, m].solution_value for m in range(net.mcst.levels)]) != 1:
-                print(f'Error: multiple MCS selected for {e}')
-
-        print(self.model.get_solve_status())
-
-        self.model.end()
+        with span('build', edges=len(fconns)) as args:
+            self.build_model(net, fconns)
+            args['variables'] = self.num_vars = self.solver.num_vars
+            args['constraints'] = self.num_constraints = self.solver.num_constraints
+
+        if self.greedy_start:
+            with span('greedy') as args:
+                start, served = greedy_solution(self.form)
+                args['served'] = int(np.count_nonzero(served))
+            ## an infeasible start is still passed, the solver repairs it
+            self.greedy_objective = start.objective if served.all() else None
+            self.solver.add_mip_start(start)
+
+        start_time = time.perf_counter()
+        with span('solve') as args:
+            if self.lazy_protection:
+                solution = self.solve_lazy(fconns)
+            else:
+                solution = self.solver.solve()
+            status = self.solver.status
+            args['status'] = str(status)
+            args['constraints'] = self.num_constraints = self.solver.num_constraints
+        self.solve_time = time.perf_counter() - start_time
+
+        log(status)
+        self.solver.end()
+        if solution is None:
+            raise NoSolutionException(str(status))
+        self.objective_value = solution.objective
+        if self.greedy_objective is not None:
+            log(f'Greedy start gap: {self.start_gap:.2%}')
+
+        with span('extract'):
+            self.write_solution(net, fconns, solution)
+
+
+    @property
+    def start_gap(self):
+        ## how far the greedy start was from the solution, relative to it
+        if self.greedy_objective is None:
+            return None
+        return (self.greedy_objective - self.objective_value) / max(abs(self.objective_value), 1e-12)
+
+
+    def write_solution(self, net, fconns, solution):
+        form = self.form
+        shape = net.conns['weight'].shape
+
+        for col, values in (
+            ('bandwidth', solution.bandwidth),
+            ('signal_power', solution.signal_power),
+            ('x_traffic', solution.x),
+            ('y_traffic', solution.y),
+        ):
+            net.conns[col] = fconns.scatter(values, shape)
+
+        ## (E, levels) selection matrix, pruned levels stay unselected
+        bm = np.zeros((form.E, net.mcst.levels))
+        bm[form.lvl_edge, form.lvl_m] = solution.bm
+        net.conns['mcs_idx'] = fconns.scatter(
+            np.argmax(bm, axis=1), shape, dtype=net.dtypes.dtype_for('mcs_idx', int))
+
+        bad = np.flatnonzero(np.sum(bm, axis=1) != 1)
+        if len(bad):
+            raise ValueError(
+                f'Not exactly one MCS selected for {list(zip(fconns.bidx[bad].tolist(), fconns.ueidx[bad].tolist()))}')
+
+
+    def build_model(self, net, fconns):
+        ## a backend named by a string is made once and reused by every execute,
+        ## whichever backend it is, so a persistent one keeps its model; close()
+        ## releases it, a backend instance is the caller's to close
+        self.form = Formulation(net, fconns, self.alpha, self.rho, self.prune_mcs)
+        if isinstance(self.backend, SolverBackend):
+            self.solver = self.backend
+        elif not isinstance(getattr(self, 'solver', None), BACKENDS[self.backend]):
+            self.solver = BACKENDS[self.backend]()
+        self.solver.build(self.form, self.lazy_protection)
+        return self.solver
+
+
+    def close(self):
+        ## releases the solver this made from a backend name
+        solver = self.__dict__.pop('solver', None)
+        if solver is not None and solver is not self.backend:
+            solver.close()
+
+
+    def solve_lazy(self, fconns):
+        p1, p2 = fconns.ue_pairs()
+        added = np.zeros(len(p1), dtype=bool)
+
+        while True:
+            solution = self.solver.solve()
+            if solution is None:
+                return None
+
+            ## pair (e1, e2) holds iff x1 + y1 + x2 + y2 <= sum of y of the UE
+            t = solution.x + solution.y
+            Y = np.bincount(fconns.ueidx, weights=solution.y, minlength=fconns.ue_count)
+
+            violated = ~added & (t[p1] + t[p2] > Y[fconns.ueidx[p1]] + self.protection_tol)
+            if not violated.any():
+                return solution
+
+            log(f'Lazy protection: adding {np.count_nonzero(violated)} of {len(p1)} pair constraints')
+            added |= violated
+            self.solver.add_protection(p1[violated], p2[violated])
 
 
     def interference_for(self, e, row, B, S, fconns, net):
@@ -231,56 +192,120 @@ class Optimize(Operation):
         Hz2dB_pre, Hz2dB, Hz2dB_post = approx.lin2db(0.1, BW, err=0.5)
         self.Hz2dB = self.model.piecewise(Hz2dB_pre, Hz2dB, Hz2dB_post, name='Hz2dB')
 
-        print(f'Piece count: mW2dBm={len(mW2dbm)}, dBm2mW={len(dBm2mW)}, Hz2dB={len(Hz2dB)}')
+        log(f'Piece count: mW2dBm={len(mW2dbm)}, dBm2mW={len(dBm2mW)}, Hz2dB={len(Hz2dB)}')
 
 
-    def calc_max_interference(self, net, fconns):
+    def calc_max_interference(self, net, fconns, chunk_size=2**22):
         maxIdb = -np.inf
         maxImW = 0
         count = 0
 
-        print(len(fconns))
+        log(len(fconns))
 
         u_pow = net.ues['max_power'].values
         u_gain = net.ues['gain'].values
         b_gain = net.gnbs['gain'].values
 
-        start_time = time.time()
-
-        for e in fconns:
-            b, u = e
-            I = 0
-            for ep in fconns:
-                bp, up = ep
-                eI = (b, up)
-                if u == up or b == bp:
-                    continue
-                Idb = u_pow[up] - net.conns['pathloss'][eI] + u_gain[up] + b_gain[b]
-                count += 1
-                if Idb > maxIdb:
-                    maxIdb = Idb
-                I += 10 ** (Idb / 10)
-            if I > maxImW:
-                maxImW = I
-
-        end_time = time.time()
-        execution_time = end_time - start_time
-        print(f"INTERFERENCE FOR LOOP execution time: {execution_time} seconds")
-        '''
-        for e, u, b, xb, yb in zip(fconns.index, fconns['id_ue'], fconns['id_gnb'], fconns['x_gnb'], fconns['y_gnb']):
-            I = 0
-            for ep, up, bp, xup, yup, s in zip(fconns.index, fconns['id_ue'], fconns['id_gnb'], fconns['x_ue'], fconns['y_ue'], fconns['max_power']):
-                if u == up or b == bp:
-                    continue
-                dst = np.sqrt((xup - xb) ** 2 + (yup - yb) ** 2)
-                L = 20 * (np.log10(dst) + np.log10(fr*10e9) + np.log10(4 * np.pi / 3e8))
-                Idb = s - L #+ net.ues.loc[up][Cols.GAIN] + net.gnbs.loc[b][Cols.GAIN]
-                count += 1
-                if Idb > maxIdb:
-                    maxIdb = Idb
-                I += 10 ** (Idb / 10)
-            if I > maxImW:
-                maxImW = I
-        '''
-
-        print(f'Max dbm2mW: {maxIdb}, mW2dBm: {maxImW}, count: {count}')
+        if is_sparse(net.conns):
+            return self._max_interference_sparse(net, fconns, u_pow, u_gain, b_gain)
+
+        ## interferer edges (bp, up) of edge (b, u) need up != u and bp != b,
+        ## so UE up interferes at gNB b once for each of its edges not at b
+        filtered = fconns.mask
+        degree = fconns.ue_degree
+
+        ## blocks of gNB rows, edges are in gNB order so they are chunked too
+        rows = max(1, chunk_size // max(1, fconns.ue_count))
+        for b0 in range(0, fconns.gnb_count, rows):
+            b1 = min(b0 + rows, fconns.gnb_count)
+            e0, e1 = fconns.gnb_ptr[b0], fconns.gnb_ptr[b1]
+            if e0 == e1:
+                continue
+
+            mult = degree[None, :] - filtered[b0:b1]
+            Idb = u_pow - net.conns['pathloss'][b0:b1] + u_gain + b_gain[b0:b1, None]
+            I = mult * 10 ** (Idb / 10)
+            Idb[mult == 0] = -np.inf
+
+            ## every edge of the block drops its own UE from the row
+            eb = fconns.bidx[e0:e1] - b0
+            eu = fconns.ueidx[e0:e1]
+            count += int(np.sum(mult.sum(axis=1)[eb] - mult[eb, eu]))
+            maxImW = max(maxImW, np.max(I.sum(axis=1)[eb] - I[eb, eu]))
+
+            ## the strongest interferer, or the second if it is the UE itself
+            r = np.arange(b1 - b0)
+            first = np.argmax(Idb, axis=1)
+            top1 = Idb[r, first]
+            Idb[r, first] = -np.inf
+            top2 = np.max(Idb, axis=1)
+            maxIdb = max(maxIdb, np.max(np.where(first[eb] == eu, top2[eb], top1[eb])))
+
+        log(f'Max dbm2mW: {maxIdb}, mW2dBm: {maxImW}, count: {count}')
+        return maxIdb, maxImW, count
+
+
+    def _max_interference_sparse(self, net, fconns, u_pow, u_gain, b_gain):
+        ## same as the dense rows, but only UEs in the table of gNB b interfere there,
+        ## pairs beyond the cutoff radius are neglected
+        b = net.conns[Cols.BID]
+        up = net.conns[Cols.UEID]
+        filtered = fconns.mask
+        degree = fconns.ue_degree
+
+        mult = degree[up] - filtered
+        Idb = u_pow[up] - net.conns['pathloss'] + u_gain[up] + b_gain[b]
+        I = mult * 10 ** (Idb / 10)
+        Idb[mult == 0] = -np.inf
+
+        own = fconns.conn_idx
+        eb = fconns.bidx
+        rowM = np.bincount(b, weights=mult, minlength=fconns.gnb_count)
+        rowI = np.bincount(b, weights=I, minlength=fconns.gnb_count)
+        count = int(np.sum(rowM[eb] - mult[own]))
+        maxImW = np.max(rowI[eb] - I[own], initial=0)
+
+        ## the strongest interferer, or the second if it is the UE itself;
+        ## pairs sorted by gNB and Idb, so both close the row of their gNB
+        order = np.lexsort((Idb, b))
+        ptr = ConnectionFilter._offsets(b, fconns.gnb_count)
+        end = ptr[1:][eb] - 1
+        first = order[end]
+        top1 = Idb[first]
+        top2 = np.where(np.diff(ptr)[eb] > 1, Idb[order[end - 1]], -np.inf)
+        maxIdb = np.max(np.where(first == own, top2, top1), initial=-np.inf)
+
+        log(f'Max dbm2mW: {maxIdb}, mW2dBm: {maxImW}, count: {count}')
+        return maxIdb, maxImW, count
+
+
+class GreedyOptimize(Optimize):
+    ## the greedy start of Optimize as the result, for networks the MILP
+    ## cannot finish on; same columns, no optimality guarantee
+    def __init__(self, prune_mcs:bool=True, alpha:float=0.1, rho:float=1, rounds:int=10):
+        super().__init__(prune_mcs=prune_mcs, alpha=alpha, rho=rho, greedy_start=False)
+        self.rounds = rounds
+
+
+    @requires(Tables.CONN, 'pathloss', 'weight')
+    @requires(Tables.UE, 'demand', 'gain', 'max_power')
+    @requires(Tables.B, 'gain')
+    @uses(Tables.CONN, 'filter', 'max_snr')
+    @uses(Tables.B, 'max_bandwidth')
+    @produces(Tables.CONN, 'bandwidth', 'signal_power', 'x_traffic', 'y_traffic', 'mcs_idx')
+    def execute(self, net: NetworkData) -> None:
+        fconns = ConnectionFilter.of(net)
+        self.form = Formulation(net, fconns, self.alpha, self.rho, self.prune_mcs)
+
+        with span('greedy', edges=len(fconns)) as args:
+            solution, served = greedy_solution(self.form, self.rounds)
+            args['served'] = int(np.count_nonzero(served))
+
+        if not served.all():
+            raise NoSolutionException(
+                f'The greedy heuristic cannot serve {np.count_nonzero(~served)} of {len(served)} UEs')
+        self.objective_value = self.greedy_objective = solution.objective
+        log(f'Greedy objective: {solution.objective}')
+
+        with span('extract'):
+            self.write_solution(net, fconns, solution)
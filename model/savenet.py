@@ -3,13 +3,17 @@ from model.network import *
 import numpy as np
 import zipfile
 import os
+import hashlib
+import shutil
+import zlib
 import configparser
+from model.trace import log
 from io import StringIO
 
 
-def scatter(width, height, density):
-    x = np.random.uniform(0, width, int(density * width * height))
-    y = np.random.uniform(0, height, int(density * width * height))
+def scatter(width, height, density, rng=np.random):
+    x = rng.uniform(0, width, int(density * width * height))
+    y = rng.uniform(0, height, int(density * width * height))
     return x, y
 
 
@@ -21,38 +25,356 @@ def grid(width, height, rows, cols):
     return x, y
 
 
+## generators for pos = method:args in the .5gn.ini, called with the area, the
+## args split on 'x', the Draws of the table and a chunk size, they yield column
+## dicts of at most chunk_size rows, so a table never has to be in memory at once
+POSITIONS = {}
+
+## per row values for the table properties, like demand = lognormal:1.5x0.5
+DISTRIBUTIONS = {}
+
+
+def position(method):
+    def position_dec(func):
+        POSITIONS[method] = func
+        return func
+    return position_dec
+
+
+def distribution(name):
+    def distribution_dec(func):
+        DISTRIBUTIONS[name] = func
+        return func
+    return distribution_dec
+
+
+class BlockRng:
+    ## draws made in blocks of block values and handed out in any sizes, so the
+    ## values do not depend on the sizes asked for; a buffer per kind of draw
+    ## and its arguments
+    def __init__(self, seed, block):
+        self.rng = np.random.default_rng(seed)
+        self.block = block
+        self.buffers = {}
+
+
+    def __getattr__(self, method):
+        def draw(*args):
+            *params, n = args
+            key = (method, *params)
+            buffer = self.buffers.get(key, np.empty(0))
+            if len(buffer) < n:
+                ## the missing whole blocks in one call, the same values as block by block
+                blocks = -(-(n - len(buffer)) // self.block)
+                values = getattr(self.rng, method)(*params, (blocks, self.block)).ravel()
+                buffer = np.concatenate((buffer, values))
+            values, self.buffers[key] = buffer[:n], buffer[n:]
+            return values
+        return draw
+
+
+class Draws:
+    ## the random columns of a generated table, each column from its own child
+    ## of seed, so the rows are the same in whatever chunks the table comes;
+    ## without a seed the children come from the global numpy state
+    def __init__(self, seed=None, block=2**12):
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(np.random.randint(0, 2**32, 4) if seed is None else seed)
+        self.seed = seed
+        self.block = block
+        self.columns = {}
+
+
+    def column(self, name):
+        ## keyed by the name, so the order the columns are first drawn in does not matter
+        if name not in self.columns:
+            child = np.random.SeedSequence(
+                self.seed.entropy, spawn_key=self.seed.spawn_key + (zlib.crc32(name.encode()),))
+            self.columns[name] = BlockRng(child, self.block)
+        return self.columns[name]
+
+
+def chunk_bounds(n, chunk_size=None):
+    ## (start, stop) of the chunks of n rows, a single chunk without a chunk size
+    step = max(chunk_size or n, 1)
+    for start in range(0, max(n, 1), step):
+        yield start, min(start + step, n)
+
+
+@position('scatter')
+def scatter_positions(area, args, draws, chunk_size=None):
+    ## scatter:density, uniform with density points per square metre
+    width, height = area
+    density, = args
+    for start, stop in chunk_bounds(int(density * width * height), chunk_size):
+        yield {
+            'x': draws.column('x').uniform(0, width, stop - start),
+            'y': draws.column('y').uniform(0, height, stop - start),
+        }
+
+
+@position('grid')
+def grid_positions(area, args, draws, chunk_size=None):
+    ## grid:rowsxcols, cell centres
+    x, y = grid(*area, *(int(d) for d in args))
+    for start, stop in chunk_bounds(len(x), chunk_size):
+        yield {'x': x[start:stop], 'y': y[start:stop]}
+
+
+@position('cluster')
+def cluster_positions(area, args, draws, chunk_size=None):
+    ## cluster:parentsxmeanxradius, Thomas process, a Poisson number of points
+    ## around uniform hotspots with gaussian spread, wrapped around the area
+    width, height = area
+    parents, mean, radius = args
+    px = draws.column('parent_x').uniform(0, width, int(parents))
+    py = draws.column('parent_y').uniform(0, height, int(parents))
+    ends = np.cumsum(draws.column('parent_size').poisson(mean, int(parents))).astype(int)
+    total = int(ends[-1]) if len(ends) else 0
+    for start, stop in chunk_bounds(total, chunk_size):
+        owner = np.searchsorted(ends, np.arange(start, stop), side='right')
+        yield {
+            'x': np.mod(px[owner] + draws.column('x').normal(0, radius, stop - start), width),
+            'y': np.mod(py[owner] + draws.column('y').normal(0, radius, stop - start), height),
+        }
+
+
+@position('hex')
+def hex_positions(area, args, draws, chunk_size=None):
+    ## hex:spacing[xsectors], hexagonal sites spacing apart, a row per sector
+    ## with its azimuth in degrees
+    width, height = area
+    spacing = args[0]
+    sectors = int(args[1]) if len(args) > 1 else 1
+    dy = spacing * np.sqrt(3) / 2
+    rows = np.arange(dy / 2, height, dy)
+    cols = np.arange(spacing / 2, width + spacing / 2, spacing)
+    x = (cols[None, :] + (np.arange(len(rows)) % 2)[:, None] * spacing / 2).ravel()
+    y = np.repeat(rows, len(cols))
+    inside = x < width
+    x, y = np.repeat(x[inside], sectors), np.repeat(y[inside], sectors)
+    sector = np.tile(np.arange(sectors), len(x) // sectors)
+    for start, stop in chunk_bounds(len(x), chunk_size):
+        columns = {'x': x[start:stop], 'y': y[start:stop]}
+        if sectors > 1:
+            columns['sector'] = sector[start:stop]
+            columns['azimuth'] = sector[start:stop] * (360. / sectors)
+        yield columns
+
+
+@distribution('uniform')
+def uniform_values(args, n, rng):
+    low, high = args
+    return rng.uniform(low, high, n)
+
+
+@distribution('normal')
+def normal_values(args, n, rng):
+    mean, std = args
+    return rng.normal(mean, std, n)
+
+
+@distribution('lognormal')
+def lognormal_values(args, n, rng):
+    ## lognormal:medianxsigma
+    median, sigma = args
+    return rng.lognormal(np.log(median), sigma, n)
+
+
+@distribution('exponential')
+def exponential_values(args, n, rng):
+    mean, = args
+    return rng.exponential(mean, n)
+
+
+def split_args(args):
+    return [float(d) for d in args.split('x')] if args else []
+
+
+def values(spec, n, rng=np.random):
+    ## a constant, or n draws of name:args from DISTRIBUTIONS
+    if ':' not in spec:
+        return float(spec)
+    name, args = spec.split(':')
+    return DISTRIBUTIONS[name](split_args(args), n, rng)
+
+
+def save_chunks(chunks, file, compression=None):
+    ## writes streamed tables without holding them, parquet or csv by extension
+    if file.endswith('.parquet'):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer = None
+        try:
+            for chunk in chunks:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(file, table.schema, compression=compression or 'none')
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        with open(file, 'w') as f:
+            for i, chunk in enumerate(chunks):
+                chunk.to_csv(f, index=False, header=i == 0)
+
+
 class InvalidPathException(Exception): pass
 
 
+## version of the directory format, a manifest.ini and one .npy file per connection column
+FORMAT_VERSION = 3
+
+## extensions of the ue and gnb table files, picked by what the directory holds
+TABLE_FORMATS = ('parquet', 'csv')
+
+
+def table_file(path, table):
+    for ext in TABLE_FORMATS:
+        file = os.path.join(path, f'{table}.{ext}')
+        if os.path.exists(file):
+            return file
+    raise InvalidPathException(f'{path} has no {table} table')
+
+
+def table_header(file):
+    ## column names without reading the rows
+    if file.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        return pq.read_schema(file).names
+    with open(file) as f:
+        return f.readline().strip().split(',')
+
+
+def read_table(file, columns=None):
+    ## parquet keeps the column types and reads only the projected columns
+    if columns is not None:
+        columns = [col for col in table_header(file) if col in columns]
+    if file.endswith('.parquet'):
+        return pd.read_parquet(file, columns=columns)
+    return pd.read_csv(file, usecols=columns)
+
+
 class Load(Operation):
-    def __init__(self, name, appendix=None, path='./', force_init=False):
+    ## replaces whole tables and the channel
+    barrier = True
+
+    def __init__(self, name, appendix=None, path='./', force_init=False, columns=None, seed=None):
+        ## columns projects the stored tables, {'ues': ('x', 'y', 'gain')} reads only those,
+        ## seed seeds the generated positions, None draws from the global numpy state
         super().__init__()
         self.name = name
         self.appendix = appendix
         self.path = path if path[-1] == '/' else path + '/'
         self.force_init = force_init
+        self.columns = columns
+        self.seed = seed
+        self.hit = None
 
 
     def to_save(self):
         return Save(self.name, self.appendix, self.path)
 
     
-    def execute(self, net: NetworkData) -> None:
+    def _base_path(self):
         appendix = '-' + self.appendix if self.appendix else ''
-        path = self.path + self.name + appendix + '.5gn'
-        if not self.force_init:
-            zipname = path + '.zip'
-            if os.path.exists(zipname):
-                print(f'Reading from {zipname}...')
-                self._load_zip(zipname, net)
-        
+        return self.path + self.name + appendix + '.5gn'
+
+
+    def products(self):
+        ## columns the files will give, read from the headers without loading them
+        path = self._base_path()
+        stored = self._stored()
+        products = set()
+        if stored == path:
+            manifest = configparser.ConfigParser()
+            manifest.optionxform = str
+            manifest.read(os.path.join(path, 'manifest.ini'))
+            for table in (Tables.UE, Tables.B):
+                header = table_header(table_file(path, table))
+                products |= {(table, col) for col in header if self._projected(table, col)}
+            products |= {(Tables.CONN, col) for col in manifest['conns']}
+        elif stored == path + '.zip':
+            with zipfile.ZipFile(path + '.zip', 'r') as zip_file:
+                for table in (Tables.UE, Tables.B):
+                    header = zip_file.open(f'{table}.csv').readline().decode('utf-8')
+                    products |= {(table, col) for col in header.strip().split(',')
+                                 if self._projected(table, col)}
+                for name in zip_file.namelist():
+                    if name.startswith('conns/'):
+                        products.add((Tables.CONN, name[6:name.rindex('.')]))
+
+        elif os.path.exists(path + '.ini'):
+            config = configparser.ConfigParser()
+            config.read(path + '.ini')
+            for table, props in ((Tables.UE, ('gain', 'demand', 'max_power')), (Tables.B, ('gain',))):
+                products |= {(table, col) for col in ('x', 'y', 'id')}
+                if table in config:
+                    products |= {(table, col) for col in props if col in config[table]}
+        return products
+
+
+    def scenario_key(self):
+        ## the ini and the seed decide the generated tables, None without an ini
+        ininame = self._base_path() + '.ini'
+        if not os.path.exists(ininame):
+            return None
+        h = hashlib.sha256()
+        with open(ininame, 'rb') as file:
+            h.update(file.read())
+        h.update(repr(self.seed).encode())
+        return h.hexdigest()
+
+
+    def _stored(self):
+        ## the saved scenario to reuse, None if there is none or the ini has changed since
+        if self.force_init:
+            return None
+        path = self._base_path()
+        config = configparser.ConfigParser()
+        if os.path.isdir(path):
+            stored = path
+            config.read(os.path.join(path, 'manifest.ini'))
+        elif os.path.exists(path + '.zip'):
+            stored = path + '.zip'
+            with zipfile.ZipFile(stored, 'r') as zip_file:
+                config.read_string(zip_file.read('channel.ini').decode('utf-8'))
+        else:
+            return None
+
+        key = self.scenario_key()
+        if key is not None and key != config.get('scenario', 'key', fallback=None):
+            return None
+        return stored
+
+
+    def execute(self, net: NetworkData) -> None:
+        path = self._base_path()
         ininame = path + '.ini'
-        if os.path.exists(ininame):
-            print(f'Reading from {ininame}...')
+        stored = self._stored()
+        self.hit = stored is not None
+
+        if stored is not None:
+            net.conns = dict()
+        if stored == path:
+            log(f'Reading from {path}...')
+            self._load_dir(path, net)
+        elif stored is not None:
+            log(f'Reading from {stored}...')
+            self._load_zip(stored, net)
+            ## the archive does not keep the mcs table
+            if os.path.exists(ininame):
+                config = configparser.ConfigParser()
+                config.read(ininame)
+                net.mcst = self._load_mcs_table(config['mcs_table'])
+        elif os.path.exists(ininame):
+            log(f'Reading from {ininame}...')
             self._load_ini(ininame, net)
         else:
             raise InvalidPathException()
-        
+        net.scenario = self.scenario_key()
+
 
     def _load_ini(self, name, net):
         config = configparser.ConfigParser()
@@ -60,41 +382,131 @@ class Load(Operation):
 
         # Print all fields of config
         for section in config.sections():
-            print(f"Section: {section}")
+            log(f"Section: {section}")
             for key, value in config.items(section):
-                print(f"{key}: {value}")
+                log(f"{key}: {value}")
 
         net.channel = self._load_channel_info(config['channel'])
         net.mcst = self._load_mcs_table(config['mcs_table'])
+        if 'dtypes' in config:
+            net.dtypes = self._load_dtypes(config['dtypes'])
+
+        ## new positions, nothing derived from the old ones is valid
+        net.ues = pd.concat(self._generate(net.channel, config[Tables.UE], Tables.UE), ignore_index=True)
+        net.gnbs = pd.concat(self._generate(net.channel, config[Tables.B], Tables.B), ignore_index=True)
+        net.conns = dict()
 
-        ues = config['ues']
-        net.ues['x'], net.ues['y'] = self._gen_positions(net.channel, ues['pos'])
-        net.ues['id'] = net.ues.index
-        self.read_ue_props(net, ues)
 
-        gnbs = config['gnbs']
-        net.gnbs['x'], net.gnbs['y'] = self._gen_positions(net.channel, gnbs['pos'])
-        net.gnbs['id'] = net.gnbs.index
-        self.read_gnb_props(net, gnbs)
+    def stream(self, table=Tables.UE, chunk_size=2**16):
+        ## the generated table in chunks of chunk_size rows, the same seed gives
+        ## the same rows in any chunk size, see save_chunks to write them out
+        config = configparser.ConfigParser()
+        config.read(self._base_path() + '.ini')
+        channel = self._load_channel_info(config['channel'])
+        return self._generate(channel, config[table], table, chunk_size)
+
+
+    def _draws(self, table):
+        ## one stream per table with a seed, so a table can be streamed on its own
+        if self.seed is None:
+            return Draws()
+        key = (Tables.UE, Tables.B).index(table)
+        return Draws(np.random.SeedSequence(self.seed, spawn_key=(key,)))
+
+
+    def _generate(self, channel, section, table, chunk_size=None):
+        draws = self._draws(table)
+        method, args = section['pos'].split(':')
+        props = self.read_ue_props if table == Tables.UE else self.read_gnb_props
+        start = 0
+        for columns in POSITIONS[method](channel.area, split_args(args), draws, chunk_size):
+            chunk = pd.DataFrame({'x': columns.pop('x'), 'y': columns.pop('y')})
+            chunk['id'] = np.arange(start, start + len(chunk))
+            for col, values in columns.items():
+                chunk[col] = values
+            props(chunk, section, draws)
+            chunk.index = chunk['id'].values
+            start += len(chunk)
+            yield chunk
+
+
+    def _load_dir(self, name, net):
+        manifest = configparser.ConfigParser()
+        manifest.optionxform = str
+        manifest.read(os.path.join(name, 'manifest.ini'))
+        version = manifest.getint('format', 'version')
+        if version > FORMAT_VERSION:
+            raise InvalidPathException(f'{name} has format version {version}, '
+                                       f'this reader knows up to {FORMAT_VERSION}')
+
+        net.channel = self._load_channel_info(manifest['channel'])
+        net.mcst = self._load_mcs_table(manifest['mcs_table'])
+        net.dtypes = self._load_dtypes(manifest['dtypes'])
+        net.ues = read_table(table_file(name, Tables.UE), self._projection(Tables.UE))
+        net.gnbs = read_table(table_file(name, Tables.B), self._projection(Tables.B))
+
+        ## columns are mapped, not read, pages come in when an operation touches them,
+        ## copy on write keeps in place edits out of the file
+        for col_name, layout in manifest['conns'].items():
+            kind, shape = layout.split(':')
+            shape = tuple(int(d) for d in shape.split('x')) if shape else ()
+            if kind == 'bits':
+                bits = np.fromfile(os.path.join(name, 'conns', col_name + '.bits'), dtype=np.uint8)
+                mask = np.unpackbits(bits, count=int(np.prod(shape))).reshape(shape)
+                net.conns[col_name] = mask.astype(bool)
+            else:
+                net.conns[col_name] = np.load(
+                    os.path.join(name, 'conns', col_name + '.npy'), mmap_mode='c')
+        return net
 
 
     def _load_zip(self, name, net):
         with zipfile.ZipFile(name, 'r') as zip_file:
-            net.ues = pd.read_csv(zip_file.open('ues.csv'))
-            net.gnbs = pd.read_csv(zip_file.open('gnbs.csv'))
-            file_names = [name for name in zip_file.namelist() if name.startswith('conns/')]
-            for file_name in file_names:
-                col_name = file_name[6:-4]
-                with zip_file.open(file_name) as file:
-                    net.conns[col_name] = np.loadtxt(file)
-
             parser = configparser.ConfigParser()
             inistr = zip_file.read('channel.ini').decode('utf-8')
             parser.read_string(inistr)
             net.channel = self._load_channel_info(parser['channel'])
+            if 'dtypes' in parser:
+                net.dtypes = self._load_dtypes(parser['dtypes'])
+
+            net.ues = pd.read_csv(zip_file.open('ues.csv'), usecols=self._csv_projection(Tables.UE))
+            net.gnbs = pd.read_csv(zip_file.open('gnbs.csv'), usecols=self._csv_projection(Tables.B))
+            file_names = [name for name in zip_file.namelist() if name.startswith('conns/')]
+            for file_name in file_names:
+                if file_name.endswith('.txt'):
+                    col_name = file_name[6:-4]
+                    with zip_file.open(file_name) as file:
+                        net.conns[col_name] = net.dtypes.cast(col_name, np.loadtxt(file))
+
+            ## bitmaps need the table shape, which the sparse index columns give
+            if Cols.BID in net.conns:
+                shape = (len(net.conns[Cols.BID]),)
+            else:
+                shape = (len(net.gnbs), len(net.ues))
+            for file_name in file_names:
+                if file_name.endswith('.bits'):
+                    bits = np.frombuffer(zip_file.read(file_name), dtype=np.uint8)
+                    mask = np.unpackbits(bits, count=int(np.prod(shape))).reshape(shape)
+                    net.conns[file_name[6:-5]] = mask.astype(bool)
             return net
 
 
+    def _projection(self, table):
+        if self.columns is None or table not in self.columns:
+            return None
+        return set(self.columns[table])
+
+
+    def _csv_projection(self, table):
+        columns = self._projection(table)
+        return None if columns is None else (lambda col: col in columns)
+
+
+    def _projected(self, table, column):
+        columns = self._projection(table)
+        return columns is None or column in columns
+
+
     def _load_channel_info(self, data):
         area = tuple(int(d) for d in data['area'].split('x'))
         bandwidth = tuple(float(d) for d in data['bandwidth'].split('-'))
@@ -102,6 +514,16 @@ class Load(Operation):
             float(data['noise']), area, bandwidth)
     
 
+    def _load_dtypes(self, data):
+        return DtypePolicy(
+            data.get('link', 'float64'),
+            data.get('mask', 'bool'),
+            data.get('mcs', 'int64'),
+            data.get('index', 'int64'),
+            data.getboolean('packed', False)
+        )
+
+
     def _load_mcs_table(self, data):
         return MCSTable(
             int(data['levels']),
@@ -111,43 +533,109 @@ class Load(Operation):
         )
     
 
-    def _gen_positions(self, channel, pos):
-        method, args = pos.split(':')
-        if method == 'grid':
-            rows, cols = tuple(int(d) for d in args.split('x'))
-            return grid(*channel.area, rows, cols)
-        elif method == 'scatter':
-            return scatter(*channel.area, float(args))
-
-
-    def read_ue_props(self, net, ues):
-        if 'gain' in ues: net.ues['gain'] = float(ues['gain'])
-        if 'demand' in ues: net.ues['demand'] = float(ues['demand'])
-        if 'max_power' in ues: net.ues['max_power'] = float(ues['max_power'])
+    def read_ue_props(self, df, ues, draws=None):
+        draws = draws or Draws()
+        for col in ('gain', 'demand', 'max_power'):
+            if col in ues: df[col] = values(ues[col], len(df), draws.column(col))
 
 
-    def read_gnb_props(self, net, gnbs):
-        if 'gain' in gnbs: net.gnbs['gain'] = float(gnbs['gain'])
+    def read_gnb_props(self, df, gnbs, draws=None):
+        draws = draws or Draws()
+        if 'gain' in gnbs: df['gain'] = values(gnbs['gain'], len(df), draws.column('gain'))
 
 
 class Save(Operation):
-    def __init__(self, name, appendix=None, path='./'):
+    ## reads every table
+    barrier = True
+
+    def __init__(self, name, appendix=None, path='./', format='npy', tables='csv', compression=None):
+        ## format is 'npy' for the binary directory, 'zip' for the old text archive,
+        ## tables is 'csv' or 'parquet' for the ue and gnb tables of the directory,
+        ## compression is a parquet codec, like 'snappy' or 'zstd'
+        if format not in ('npy', 'zip'):
+            raise ValueError(f'Unknown scenario format "{format}"')
+        if tables not in TABLE_FORMATS:
+            raise ValueError(f'Unknown table format "{tables}"')
         self.name = name
         self.appendix = appendix
         self.path = path
+        self.format = format
+        self.tables = tables
+        self.compression = compression
 
 
     def to_load(self, force_init=False):
         return Load(self.name, self.appendix, self.path, force_init)
+
+
+    def products(self):
+        return set()
     
 
     def execute(self, net):
         appendix = '-' + self.appendix if self.appendix else ''
-        path = self.path + self.name + appendix + '.5gn.zip'
+        path = self.path + self.name + appendix + '.5gn'
+        if self.format == 'zip':
+            self._save_zip(path + '.zip', net)
+        else:
+            self._save_dir(path, net)
 
+
+    def _save_dir(self, path, net):
+        config = configparser.ConfigParser()
+        config.optionxform = str
+        config['format'] = {'version': str(FORMAT_VERSION)}
+        self.channel_to_ini(net.channel, config)
+        self.mcs_to_ini(net.mcst, config)
+        self.dtypes_to_ini(net.dtypes, config)
+        self.scenario_to_ini(net.scenario, config)
+        config['conns'] = {}
+
+        ## written next to the old one and swapped in, the loaded columns
+        ## may still be mapped from the files being replaced
+        tmp = f'{path}.{os.getpid()}.tmp'
+        if os.path.exists(tmp):
+            shutil.rmtree(tmp)
+        os.makedirs(os.path.join(tmp, 'conns'))
+
+        ## a failed write leaves neither a half written directory nor the old one changed
+        try:
+            for table in (Tables.UE, Tables.B):
+                self._save_table(getattr(net, table), os.path.join(tmp, f'{table}.{self.tables}'))
+            for col_name, col_data in net.conns.items():
+                col_data = np.asarray(col_data)
+                shape = 'x'.join(str(d) for d in col_data.shape)
+                if net.dtypes.packed and col_data.dtype == bool:
+                    np.packbits(col_data).tofile(os.path.join(tmp, 'conns', col_name + '.bits'))
+                    config['conns'][col_name] = f'bits:{shape}'
+                else:
+                    np.save(os.path.join(tmp, 'conns', col_name + '.npy'), col_data)
+                    config['conns'][col_name] = f'{col_data.dtype.str}:{shape}'
+
+            with open(os.path.join(tmp, 'manifest.ini'), 'w') as file:
+                config.write(file)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.rename(tmp, path)
+
+
+    def _save_table(self, df, file):
+        if self.tables == 'parquet':
+            df.to_parquet(file, index=False, compression=self.compression)
+        else:
+            df.to_csv(file, index=False)
+
+
+    def _save_zip(self, path, net):
         config = configparser.ConfigParser()
         self.channel_to_ini(net.channel, config)
         self.mcs_to_ini(net.mcst, config)
+        self.dtypes_to_ini(net.dtypes, config)
+        self.scenario_to_ini(net.scenario, config)
 
         config_str = ''
         with StringIO() as strio:
@@ -160,12 +648,27 @@ class Save(Operation):
             zip_file.writestr('gnbs.csv', net.gnbs.to_csv(index=False))
             zip_file.writestr('channel.ini', config_str)
             for col_name, col_data in net.conns.items():
+                col_data = np.asarray(col_data)
+                if net.dtypes.packed and col_data.dtype == bool:
+                    zip_file.writestr(f'conns/{col_name}.bits', np.packbits(col_data).tobytes())
+                    continue
+
                 with StringIO() as strio:
-                    np.savetxt(strio, col_data)
+                    np.savetxt(strio, col_data, fmt=self.text_format(col_data.dtype))
                     strio.seek(0)
                     zip_file.writestr(f'conns/{col_name}.txt', strio.read())
 
 
+    @staticmethod
+    def text_format(dtype):
+        ## shortest formats that read back to the same value
+        if dtype.kind in 'biu':
+            return '%d'
+        if dtype == np.float32:
+            return '%.9g'
+        return '%.18e'
+
+
     def channel_to_ini(self, channel, config):
         config['channel'] = {
             'noise': str(channel.noise),
@@ -174,6 +677,22 @@ class Save(Operation):
         }
 
 
+    def dtypes_to_ini(self, dtypes, config):
+        config['dtypes'] = {
+            'link': dtypes.link,
+            'mask': dtypes.mask,
+            'mcs': dtypes.mcs,
+            'index': dtypes.index,
+            'packed': str(dtypes.packed)
+        }
+
+
+    def scenario_to_ini(self, key, config):
+        ## what Load compares against the current ini before reusing the tables
+        if key is not None:
+            config['scenario'] = {'key': key}
+
+
     def mcs_to_ini(self, mcs, config):
         config['mcs_table'] = {
             'levels': str(mcs.levels),
@@ -0,0 +1,55 @@
+import numpy as np
+from scipy.spatial import cKDTree
+from model.network import Tables
+
+
+class SpatialIndex:
+    def __init__(self, x, y):
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.tree = cKDTree(np.column_stack((self.x, self.y)))
+
+
+    def __len__(self):
+        return len(self.x)
+
+
+    @staticmethod
+    def of(net, table=Tables.UE):
+        ## one index per table, rebuilt only when the positions change
+        cache = net.__dict__.setdefault('_spatial', {})
+        x = getattr(net, table)['x'].values
+        y = getattr(net, table)['y'].values
+
+        index = cache.get(table)
+        if index is None or not (np.array_equal(index.x, x) and np.array_equal(index.y, y)):
+            index = SpatialIndex(x, y)
+            cache[table] = index
+        return index
+
+
+    def nearest(self, points, k):
+        ## indices of the k nearest points, closest first
+        k = min(k, len(self))
+        dst, idx = self.tree.query(points, k=k)
+        if k == 1:
+            dst, idx = dst[..., None], idx[..., None]
+        return dst, idx
+
+
+    def within(self, point, radius):
+        return np.sort(np.asarray(self.tree.query_ball_point(point, radius), dtype=int))
+
+
+    def shell(self, point, r_in, r_out):
+        ## points with r_in <= distance < r_out
+        idx = self.within(point, r_out)
+        dst = np.hypot(self.x[idx] - point[0], self.y[idx] - point[1])
+        return idx[(dst >= r_in) & (dst < r_out)]
+
+
+    def pairs_within(self, x, y, radius):
+        ## (i, j) pairs of query point i and indexed point j within radius
+        other = cKDTree(np.column_stack((x, y)))
+        pairs = other.sparse_distance_matrix(self.tree, radius, output_type='ndarray')
+        return pairs['i'].astype(int), pairs['j'].astype(int)
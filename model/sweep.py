@@ -0,0 +1,223 @@
+import os
+import time
+import itertools
+import tempfile
+import configparser
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from model.network import NetworkData, Tables
+from model.savenet import Load
+from model.connop import *
+from model.optimize import Optimize, NoSolutionException
+from model.milp import BACKENDS
+from model.trace import log
+
+
+## the grid of a sweep, every combination of the values is a run
+GRID = ('scenario', 'seed', 'alpha', 'rho', 'density')
+GRID_TYPES = {'scenario': str, 'seed': int, 'alpha': float, 'rho': float, 'density': float}
+
+## metrics of a run, after its grid values
+METRICS = (
+    'status', 'objective', 'solve_time', 'wall_time', 'ues', 'edges',
+    'variables', 'constraints', 'mcs_hist',
+)
+
+
+def parse_values(text, kind):
+    ## comma separated values, a-b is a range of integers, an empty value keeps the ini's
+    values = []
+    for item in (item.strip() for item in text.split(',')):
+        if not item:
+            values.append(None)
+        elif kind is int and '-' in item[1:]:
+            low, high = item.split('-', 1)
+            values.extend(range(int(low), int(high) + 1))
+        else:
+            values.append(kind(item))
+    return values
+
+
+def with_density(config, density):
+    ## the UE positions of a .5gn.ini at another density, in UEs per square metre
+    section = config[Tables.UE]
+    method, args = section['pos'].split(':')
+    if method == 'scatter':
+        section['pos'] = f'scatter:{density}'
+    elif method == 'cluster':
+        ## as many hotspots as the density needs at the same cluster size
+        _, mean, radius = args.split('x')
+        width, height = (int(d) for d in config['channel']['area'].split('x'))
+        parents = max(1, round(density * width * height / float(mean)))
+        section['pos'] = f'cluster:{parents}x{mean}x{radius}'
+    else:
+        raise ValueError(f'The density of "{method}" positions cannot be changed')
+
+
+def chain():
+    return DistanceCalc() & DistanceWeight(1) & FreeSpacePathloss() & CalcMaxSnr() & MinSnrFilter()
+
+
+def _limit_memory(memory):
+    ## address space of a worker, in MB, a run over it fails with MemoryError
+    if memory is None:
+        return
+    import resource
+    limit = int(memory) * 2**20
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def run_scenario(run, name, path, backend, threads):
+    ## one pass of the main.py pipeline, the grid values and the metrics of the run
+    row = dict(run, status='', objective=np.nan, solve_time=np.nan, wall_time=np.nan,
+               ues=0, edges=0, variables=0, constraints=0, mcs_hist='')
+    net = NetworkData()
+    net.conns = dict()
+    solver = BACKENDS[backend](log_output=False, threads=threads)
+    op = Optimize(alpha=run['alpha'], rho=run['rho'], backend=solver)
+
+    start_time = time.perf_counter()
+    try:
+        with solver:
+            (Load(name, path=path, seed=run['seed']) & chain() & op).execute(net)
+            row['status'] = str(solver.status)
+        row['objective'] = op.objective_value
+    except NoSolutionException as e:
+        row['status'] = f'no solution: {e}'
+    except MemoryError:
+        row['status'] = 'out of memory'
+    except Exception as e:
+        ## a broken run is a row of the results, the sweep goes on
+        row['status'] = f'error: {type(e).__name__}: {e}'
+    row['wall_time'] = time.perf_counter() - start_time
+
+    row['ues'] = len(net.ues)
+    if 'filter' in net.conns:
+        fconns = ConnectionFilter.of(net)
+        row['edges'] = len(fconns)
+        if 'mcs_idx' in net.conns:
+            hist = np.bincount(fconns.take(net.conns['mcs_idx']), minlength=net.mcst.levels)
+            row['mcs_hist'] = ' '.join(str(count) for count in hist)
+    for col, attr in (('solve_time', 'solve_time'), ('variables', 'num_vars'), ('constraints', 'num_constraints')):
+        if hasattr(op, attr):
+            row[col] = getattr(op, attr)
+    return row
+
+
+class Sweep:
+    ## runs the main.py pipeline over a grid of scenarios, seeds and Optimize
+    ## parameters in a process pool; every solve gets threads solver threads,
+    ## the cores split between the workers by default, a backend that cannot
+    ## limit its threads takes none; every worker gets memory MB
+    ## of address space; the rows go to output as the runs finish, a run that
+    ## fails gets its error as the status
+    def __init__(
+        self, scenarios, seeds=(None,), alphas=(0.1,), rhos=(1,),
+        densities=(None,), backend='docplex', workers=None, threads=None, memory=None,
+        output='sweep.csv', workdir=None
+    ):
+        self.grid = {
+            'scenario': list(scenarios), 'seed': list(seeds),
+            'alpha': list(alphas), 'rho': list(rhos), 'density': list(densities),
+        }
+        self.backend = backend
+        self.workers = workers
+        cores = os.cpu_count() or 1
+        if not BACKENDS[backend].limits_threads:
+            if threads is not None:
+                raise ValueError(f'The {backend} backend cannot limit its threads')
+        elif threads is None:
+            threads = max(1, cores // (workers or 1))
+        self.threads = threads
+        self.memory = memory
+        self.output = output
+        self.workdir = workdir
+
+
+    @staticmethod
+    def read(path):
+        ## a .sweep.ini, [grid] has the values of GRID, [runner] the rest
+        config = configparser.ConfigParser()
+        if not config.read(path):
+            raise FileNotFoundError(path)
+        grid = config['grid']
+        runner = config['runner'] if 'runner' in config else {}
+        values = {
+            key: parse_values(grid[key], GRID_TYPES[key]) for key in GRID if key in grid
+        }
+        return Sweep(
+            values['scenario'],
+            values.get('seed', (None,)),
+            values.get('alpha', (0.1,)),
+            values.get('rho', (1,)),
+            values.get('density', (None,)),
+            backend=runner.get('backend', 'docplex'),
+            workers=int(runner['workers']) if 'workers' in runner else None,
+            threads=int(runner['threads']) if 'threads' in runner else None,
+            memory=int(runner['memory']) if 'memory' in runner else None,
+            output=runner.get('output', 'sweep.csv'),
+            workdir=runner.get('workdir'),
+        )
+
+
+    def runs(self):
+        return [dict(zip(GRID, values)) for values in itertools.product(*(self.grid[key] for key in GRID))]
+
+
+    def scenarios(self):
+        ## the (name, path) Load reads every (scenario, density) from, other
+        ## densities are copies of the ini in the work directory
+        if self.workdir is None:
+            self.workdir = tempfile.mkdtemp(prefix='sweep-')
+        paths = {}
+        for scenario, density in itertools.product(self.grid['scenario'], self.grid['density']):
+            path, name = os.path.split(scenario)
+            path = (path or '.') + '/'
+            if density is None:
+                paths[scenario, density] = (name, path)
+                continue
+
+            config = configparser.ConfigParser()
+            config.read(path + name + '.5gn.ini')
+            with_density(config, density)
+
+            variant = f'{name}-d{density}'
+            with open(os.path.join(self.workdir, variant + '.5gn.ini'), 'w') as file:
+                config.write(file)
+            paths[scenario, density] = (variant, self.workdir)
+        return paths
+
+
+    def run(self):
+        ## the results table, also streamed to output one row per finished run
+        paths = self.scenarios()
+        runs = self.runs()
+        tasks = [
+            (run, *paths[run['scenario'], run['density']], self.backend, self.threads)
+            for run in runs
+        ]
+        if self.output is not None and os.path.exists(self.output):
+            os.remove(self.output)
+
+        rows = []
+        if self.workers is None and self.memory is None:
+            for task in tasks:
+                rows.append(self._write(run_scenario(*task)))
+        else:
+            ## the memory limit goes on worker processes, never on this one,
+            ## so without workers the runs go one by one through a single worker
+            workers = self.workers or 1
+            with ProcessPoolExecutor(workers, initializer=_limit_memory, initargs=(self.memory,)) as pool:
+                futures = [pool.submit(run_scenario, *task) for task in tasks]
+                for future in as_completed(futures):
+                    rows.append(self._write(future.result()))
+        return pd.DataFrame(rows, columns=GRID + METRICS)
+
+
+    def _write(self, row):
+        if self.output is not None:
+            pd.DataFrame([row], columns=GRID + METRICS).to_csv(
+                self.output, mode='a', header=not os.path.exists(self.output), index=False)
+        log(' '.join(f'{key}={row[key]}' for key in GRID + ('status', 'objective', 'wall_time')))
+        return row
@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+
+## the tracer of the running `with Tracer()` block, None when tracing is off
+active = None
+
+
+def log(*args):
+    ## diagnostics, only printed while tracing
+    if active is not None:
+        print(*args)
+        active.instant(' '.join(str(a) for a in args))
+
+
+@contextmanager
+def span(name, cat='phase', **args):
+    if active is None:
+        yield args
+        return
+    with active.span(name, cat, **args) as span_args:
+        yield span_args
+
+
+def column_sizes(net, columns):
+    sizes = {}
+    for table, column in sorted(columns):
+        cols = getattr(net, table)
+        if column in cols:
+            sizes[f'{table}.{column}'] = int(getattr(cols[column], 'nbytes', 0))
+    return sizes
+
+
+@contextmanager
+def operation(op, net):
+    ## an operation of a sequence, with the sizes of what it reads and writes
+    if active is None:
+        yield
+        return
+    name = type(op).__name__
+    inputs = column_sizes(net, op.requirements() | op.usages())
+    with active.span(name, 'operation', inputs=inputs) as args:
+        yield
+        args['outputs'] = column_sizes(net, op.products() or ())
+
+
+class Tracer:
+    def __init__(self, memory=True):
+        self.memory = memory
+        self.events = []
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.t0 = None
+
+
+    def __enter__(self):
+        global active
+        self.previous = active
+        self.started_tracemalloc = self.memory and not tracemalloc.is_tracing()
+        if self.started_tracemalloc:
+            tracemalloc.start()
+        self.t0 = time.perf_counter()
+        active = self
+        return self
+
+
+    def __exit__(self, *exc):
+        global active
+        active = self.previous
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+        return False
+
+
+    def _stack(self):
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+
+    def _now(self):
+        return (time.perf_counter() - self.t0) * 1e6
+
+
+    @contextmanager
+    def span(self, name, cat='phase', **args):
+        stack = self._stack()
+        frame = {'peak': 0, 'mem': 0}
+        if self.memory:
+            ## peaks are global, so a child reports its peak to the parent before resetting
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+            tracemalloc.reset_peak()
+            frame['mem'] = current
+        stack.append(frame)
+
+        start, cpu = self._now(), time.process_time()
+        try:
+            yield args
+        finally:
+            wall = self._now() - start
+            cpu = time.process_time() - cpu
+            stack.pop()
+            if self.memory:
+                frame['peak'] = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+                if stack:
+                    stack[-1]['peak'] = max(stack[-1]['peak'], frame['peak'])
+                args['peak_memory'] = frame['peak'] - frame['mem']
+
+            with self.lock:
+                self.events.append({
+                    'name': name, 'cat': cat, 'ts': start, 'dur': wall,
+                    'cpu': cpu * 1e6, 'depth': len(stack),
+                    'tid': threading.get_ident(), 'args': args,
+                })
+
+
+    def instant(self, name):
+        with self.lock:
+            self.events.append({
+                'name': name, 'cat': 'log', 'ts': self._now(), 'dur': 0, 'cpu': 0,
+                'depth': len(self._stack()), 'tid': threading.get_ident(), 'args': {},
+            })
+
+
+    def spans(self, cat=None):
+        return [e for e in sorted(self.events, key=lambda e: e['ts'])
+                if e['cat'] != 'log' and (cat is None or e['cat'] == cat)]
+
+
+    def to_json(self):
+        ## times in microseconds from the start of the trace
+        return sorted(self.events, key=lambda e: e['ts'])
+
+
+    def to_chrome(self):
+        ## trace event format, opens in chrome://tracing and Perfetto
+        pid = os.getpid()
+        events = []
+        for e in self.to_json():
+            event = {'name': e['name'], 'cat': e['cat'], 'ts': e['ts'], 'pid': pid, 'tid': e['tid']}
+            if e['cat'] == 'log':
+                event.update(ph='i', s='t')
+            else:
+                event.update(ph='X', dur=e['dur'], args=dict(e['args'], cpu_us=e['cpu']))
+            events.append(event)
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+    def save_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_json(), f, indent=1, default=str)
+
+
+    def save_chrome(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_chrome(), f, default=str)
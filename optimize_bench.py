@@ -0,0 +1,97 @@
+import time
+import numpy as np
+import pandas as pd
+from model.network import *
+from model.connop import *
+from model.savenet import scatter, grid
+from model.optimize import Optimize, GreedyOptimize, NoSolutionException
+from model.milp import BACKENDS, HighsBackend
+
+
+def make_network(density, mcst, area=(400, 400), gnb_grid=(4, 4)):
+    net = NetworkData()
+    net.channel = Channel(-100, area, (24, 40))
+    net.mcst = mcst
+    net.conns = dict()
+
+    x, y = scatter(*area, density)
+    net.ues = pd.DataFrame({'x': x, 'y': y})
+    net.ues['id'] = net.ues.index
+    net.ues['gain'] = 0.
+    net.ues['demand'] = 1.5
+    net.ues['max_power'] = 30.
+
+    x, y = grid(*area, *gnb_grid)
+    net.gnbs = pd.DataFrame({'x': x, 'y': y})
+    net.gnbs['id'] = net.gnbs.index
+    net.gnbs['gain'] = 10.
+
+    op = (
+        DistanceCalc() &
+        DistanceWeight(1) &
+        FreeSpacePathloss() &
+        CalcMaxSnr() &
+        MinSnrFilter()
+    )
+    op.execute(net)
+    return net
+
+
+def greedy_gap(densities, mcst):
+    ## the greedy heuristic against the exact MILP, on the sizes where both finish
+    print(f'{"density":>8} {"UEs":>6} {"greedy (s)":>11} {"milp (s)":>9} {"gap":>8}')
+    for density in densities:
+        net = make_network(density, mcst)
+        greedy = GreedyOptimize()
+        exact = Optimize(backend=HighsBackend(log_output=False), greedy_start=False)
+
+        start_time = time.perf_counter()
+        try:
+            greedy.execute(net)
+        except NoSolutionException:
+            greedy.objective_value = None
+        greedy_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        exact.execute(net)
+        exact_time = time.perf_counter() - start_time
+
+        gap = '-' if greedy.objective_value is None else \
+            f'{(greedy.objective_value - exact.objective_value) / exact.objective_value:.2%}'
+        print(f'{density:>8} {len(net.ues):>6} {greedy_time:>11.3f} {exact_time:>9.3f} {gap:>8}')
+
+
+if __name__ == '__main__':
+    np.random.seed(0)
+    densities = [0.0001, 0.00025, 0.0005, 0.001]
+    tables = {
+        'test': MCSTable(2, 0, 2, 0.9),
+        ## linear fit of the 15 level CQI table, see cqi_plot.py
+        'cqi': MCSTable(15, -7.744, 1.938, 0.879),
+    }
+
+    print(
+        f'{"backend":>8} {"mcs":>5} {"density":>8} {"UEs":>6} {"edges":>7} {"vars":>8} '
+        f'{"consts":>8} {"pruned":>8} {"build (s)":>10}'
+    )
+    for name, mcst in tables.items():
+        for density in densities:
+            net = make_network(density, mcst)
+            fconns = ConnectionFilter(net)
+
+            for backend in BACKENDS:
+                opt = Optimize(backend=backend)
+
+                start_time = time.perf_counter()
+                solver = opt.build_model(net, fconns)
+                build_time = time.perf_counter() - start_time
+
+                print(
+                    f'{backend:>8} {name:>5} {density:>8} {len(net.ues):>6} {len(fconns):>7} '
+                    f'{solver.num_vars:>8} {solver.num_constraints:>8} '
+                    f'{opt.form.pruned_vars:>8} {build_time:>10.3f}'
+                )
+                solver.end()
+                opt.close()
+
+    greedy_gap(densities[:2], tables['test'])
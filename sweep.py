@@ -0,0 +1,12 @@
+import sys
+import pandas as pd
+from model.sweep import Sweep
+
+
+if __name__ == '__main__':
+    ## python sweep.py grid.sweep.ini, rows are streamed to the output of its [runner]
+    spec = sys.argv[1] if len(sys.argv) > 1 else 'data/test.sweep.ini'
+    results = Sweep.read(spec).run()
+
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(results.groupby(['density', 'alpha'], dropna=False)[['objective', 'solve_time', 'variables']].mean())
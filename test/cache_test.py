@@ -0,0 +1,128 @@
+import os
+import time
+import unittest
+import tempfile
+from model.savenet import *
+from model.network import *
+from model.connop import *
+from model.optimize import *
+from model.milp import HighsBackend
+from model.cache import ResultCache, CachedOperation
+
+
+class TestResultCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.net = NetworkData()
+        cls.net.conns = dict()
+        np.random.seed(0)
+        Load('data/test', force_init=True).execute(cls.net)
+
+        ## a few UEs keep the MILP small
+        cls.net.ues = cls.net.ues.iloc[:6].copy()
+        op = (
+            DistanceCalc() &
+            DistanceWeight(1) &
+            FreeSpacePathloss() &
+            CalcMaxSnr() &
+            MinSnrFilter()
+        )
+        op.execute(cls.net)
+
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.cache = ResultCache(self.dir.name)
+
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+
+    def test_optimize_hit(self):
+        first = Optimize(backend=HighsBackend(log_output=False))
+        first.cached(self.cache).execute(self.net)
+        expected = {col: self.net.conns.pop(col).copy() for col in
+                    ('bandwidth', 'signal_power', 'x_traffic', 'y_traffic', 'mcs_idx')}
+
+        second = Optimize(backend=HighsBackend(log_output=False))
+        def build_model(net, fconns):
+            raise AssertionError('built a model on a cache hit')
+        second.build_model = build_model
+
+        cached = second.cached(self.cache)
+        cached.execute(self.net)
+        self.assertTrue(cached.hit)
+        self.assertEqual(second.objective_value, first.objective_value)
+        for col, values in expected.items():
+            self.assertEqual(self.net.conns[col].dtype, values.dtype)
+            np.testing.assert_array_equal(self.net.conns[col], values)
+
+
+    def test_absent_attribute(self):
+        ## without a greedy start greedy_objective is None, a hit gives it back as None
+        for _ in range(2):
+            op = Optimize(greedy_start=False, backend=HighsBackend(log_output=False))
+            cached = op.cached(self.cache)
+            cached.execute(self.net)
+        self.assertTrue(cached.hit)
+        self.assertIsNone(op.greedy_objective)
+        self.assertGreater(op.objective_value, 0)
+
+
+    def test_sequence_code(self):
+        ## a sequence is keyed on the code of the operations in it
+        seq = DistanceWeight(1) & Optimize(backend=HighsBackend(log_output=False))
+        key = self.cache.key(seq, self.net)
+        self.cache.versions[Optimize] = 'edited'
+        self.assertNotEqual(key, self.cache.key(seq, self.net))
+
+
+    def test_key(self):
+        op = Optimize(backend=HighsBackend(mip_gap=1e-2))
+        key = self.cache.key(op, self.net)
+        self.assertEqual(key, self.cache.key(Optimize(backend=HighsBackend(mip_gap=1e-2)), self.net))
+        self.assertNotEqual(key, self.cache.key(Optimize(backend=HighsBackend(mip_gap=1e-3)), self.net))
+        self.assertNotEqual(key, self.cache.key(Optimize(alpha=0.2, backend=HighsBackend(mip_gap=1e-2)), self.net))
+
+        ## inputs, required or only used
+        for col in ('weight', 'filter'):
+            values = self.net.conns[col]
+            try:
+                self.net.conns[col] = values.copy()
+                self.net.conns[col][0, 0] = not values[0, 0] if col == 'filter' else values[0, 0] + 1
+                self.assertNotEqual(key, self.cache.key(op, self.net))
+            finally:
+                self.net.conns[col] = values
+        self.assertEqual(key, self.cache.key(op, self.net))
+
+
+    def test_lru_eviction(self):
+        op = DistanceWeight(1)
+        files = []
+        for constant in range(3):
+            op.constant = constant
+            op.cached(self.cache).execute(self.net)
+            files.append(self.cache._file(self.cache.key(op, self.net)))
+            os.utime(files[-1], (time.time() + constant, time.time() + constant))
+        size = os.path.getsize(files[0])
+
+        ## a hit makes the oldest entry the newest
+        op.constant = 0
+        hit = op.cached(self.cache)
+        hit.execute(self.net)
+        self.assertTrue(hit.hit)
+        os.utime(files[0], (time.time() + 10, time.time() + 10))
+
+        self.cache.max_bytes = 2 * size
+        self.cache.evict()
+        self.assertEqual([os.path.exists(f) for f in files], [True, False, True])
+
+
+    def test_undeclared(self):
+        with self.assertRaises(TypeError):
+            CachedOperation(Operation())
+
+
+if __name__ == '__main__':
+    unittest.main()
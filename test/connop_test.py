@@ -0,0 +1,196 @@
+import unittest
+from model.savenet import *
+from model.optimize import *
+from model.network import *
+from model.connop import *
+from model.milp import Formulation
+
+
+def load_net(radius):
+    net = NetworkData()
+    net.conns = dict()
+    np.random.seed(0)
+    op = (
+        Load('data/test', force_init=True) &
+        DistanceCalc(radius) &
+        DistanceWeight(1) &
+        FreeSpacePathloss() &
+        CalcMaxSnr() &
+        MinSnrFilter()
+    )
+    op.execute(net)
+    return net
+
+
+class TestSparseConnections(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dense = load_net(None)
+        cls.dense_fconns = ConnectionFilter(cls.dense)
+
+
+    def test_unbounded_radius_same_as_dense(self):
+        net = load_net(1e9)
+        fconns = ConnectionFilter(net)
+        self.assertTrue(is_sparse(net.conns))
+        np.testing.assert_array_equal(fconns.bidx, self.dense_fconns.bidx)
+        np.testing.assert_array_equal(fconns.ueidx, self.dense_fconns.ueidx)
+
+        for col in ('distance', 'pathloss', 'weight', 'max_snr'):
+            np.testing.assert_array_equal(
+                fconns.take(net.conns[col]), self.dense_fconns.take(self.dense.conns[col]))
+
+        a = Formulation(net, fconns, 0.1, 1)
+        b = Formulation(self.dense, self.dense_fconns, 0.1, 1)
+        np.testing.assert_array_equal(a.lvl_m, b.lvl_m)
+        np.testing.assert_array_equal(a.e_loss, b.e_loss)
+
+        maxIdb, maxImW, count = Optimize().calc_max_interference(net, fconns)
+        denseIdb, denseImW, dense_count = Optimize().calc_max_interference(self.dense, self.dense_fconns)
+        self.assertEqual(count, dense_count)
+        self.assertEqual(maxIdb, denseIdb)
+        self.assertTrue(np.isclose(maxImW, denseImW, rtol=1e-12, atol=0))
+
+
+    def test_radius(self):
+        net = load_net(120)
+        dst = self.dense.conns['distance']
+        b, u = np.where(dst <= 120)
+
+        np.testing.assert_array_equal(net.conns[Cols.BID], b)
+        np.testing.assert_array_equal(net.conns[Cols.UEID], u)
+        np.testing.assert_array_equal(net.conns['distance'], dst[b, u])
+        np.testing.assert_array_equal(net.conns['filter'], self.dense.conns['filter'][b, u])
+
+
+    def test_scatter(self):
+        net = load_net(120)
+        fconns = ConnectionFilter(net)
+        values = np.arange(len(fconns), dtype=float)
+        column = fconns.scatter(values, net.conns['distance'].shape)
+
+        self.assertEqual(column.shape, net.conns['distance'].shape)
+        np.testing.assert_array_equal(fconns.take(column), values)
+        self.assertEqual(np.count_nonzero(column[~net.conns['filter']]), 0)
+
+
+class TestConnectionFilter(unittest.TestCase):
+    def test_cached(self):
+        net = load_net(None)
+        fconns = ConnectionFilter.of(net)
+        self.assertIs(ConnectionFilter.of(net), fconns)
+        self.assertFalse(hasattr(fconns, '__dict__'))
+        self.assertFalse(fconns.bidx.flags.writeable)
+
+        ## rebuilt on a new filter and on one changed in place
+        net.conns['filter'] = net.conns['filter'].copy()
+        self.assertIs(ConnectionFilter.of(net), fconns)
+        net.conns['filter'][0, :] = False
+        rebuilt = ConnectionFilter.of(net)
+        self.assertIsNot(rebuilt, fconns)
+        self.assertEqual(len(rebuilt), np.count_nonzero(net.conns['filter']))
+
+        ## and when the table is recomputed as sparse
+        (DistanceCalc(120) & FreeSpacePathloss() & CalcMaxSnr() & MinSnrFilter()).execute(net)
+        self.assertTrue(ConnectionFilter.of(net).sparse)
+
+
+    def test_adjacency(self):
+        for radius in (None, 120):
+            net = load_net(radius)
+            fconns = ConnectionFilter.of(net)
+            E = len(fconns)
+
+            np.testing.assert_array_equal(fconns.edge_id(fconns.bidx, fconns.ueidx), np.arange(E))
+            np.testing.assert_array_equal(fconns.gnb_degree, np.bincount(fconns.bidx, minlength=fconns.gnb_count))
+            np.testing.assert_array_equal(fconns.ue_degree, np.bincount(fconns.ueidx, minlength=fconns.ue_count))
+
+            b, u = np.meshgrid(np.arange(fconns.gnb_count), np.arange(fconns.ue_count), indexing='ij')
+            ids = fconns.edge_id(b, u)
+            self.assertEqual(np.count_nonzero(ids >= 0), E)
+            for e in range(0, E, 37):
+                self.assertEqual(ids[fconns.bidx[e], fconns.ueidx[e]], e)
+                self.assertIn(e, fconns.ue_edges(fconns.ueidx[e]))
+                self.assertIn(e, fconns.gnb_edges(fconns.bidx[e]))
+
+
+class TestFusedConnops(unittest.TestCase):
+    def run_pipeline(self, fusion, radius=None, chunk_size=None, outputs=None, dtypes=DtypePolicy()):
+        net = NetworkData()
+        net.conns = dict()
+        net.dtypes = dtypes
+        np.random.seed(0)
+        Load('data/test', force_init=True).execute(net)
+
+        op = (
+            DistanceCalc(radius) &
+            DistanceWeight(1) &
+            FreeSpacePathloss() &
+            CalcMaxSnr() &
+            MinSnrFilter()
+        )
+        if outputs is not None:
+            op.outputs(*outputs)
+
+        OpSequence.fusion = fusion
+        try:
+            plan = op.plan()
+        finally:
+            OpSequence.fusion = True
+        if chunk_size is not None:
+            plan[0].chunk_size = chunk_size
+        for step in plan:
+            step.execute(net)
+        return plan, net.conns
+
+
+    def assert_same_tables(self, a, b):
+        self.assertEqual(set(a), set(b))
+        for col in a:
+            self.assertEqual(a[col].dtype, b[col].dtype)
+            np.testing.assert_array_equal(a[col], b[col])
+
+
+    def test_bit_exact(self):
+        for radius in (None, 150):
+            plan, expected = self.run_pipeline(False, radius)
+            self.assertEqual(len(plan), 5)
+
+            for chunk_size in (None, 7, 100):
+                plan, conns = self.run_pipeline(True, radius, chunk_size)
+                self.assertEqual(len(plan), 1)
+                self.assertIsInstance(plan[0], FusedConnOperations)
+                self.assert_same_tables(conns, expected)
+
+
+    def test_bit_exact_compact(self):
+        for radius in (None, 150):
+            _, expected = self.run_pipeline(False, radius, dtypes=DtypePolicy.compact())
+            _, conns = self.run_pipeline(True, radius, 100, dtypes=DtypePolicy.compact())
+            self.assertEqual(expected['pathloss'].dtype, np.float32)
+            self.assert_same_tables(conns, expected)
+
+
+    def test_outputs(self):
+        _, expected = self.run_pipeline(False)
+        _, conns = self.run_pipeline(True, chunk_size=100, outputs=('filter', 'weight'))
+
+        self.assertEqual(set(conns), {'filter', 'weight'})
+        np.testing.assert_array_equal(conns['filter'], expected['filter'])
+        np.testing.assert_array_equal(conns['weight'], expected['weight'])
+
+
+    def test_missing_column(self):
+        net = NetworkData()
+        net.conns = dict()
+        np.random.seed(0)
+        Load('data/test', force_init=True).execute(net)
+        net.ues = net.ues.drop(columns='gain')
+
+        op = DistanceCalc() & FreeSpacePathloss() & CalcMaxSnr()
+        with self.assertRaises(RequiredColumnMissingException):
+            op.execute(net)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+from model.savenet import *
+from model.network import *
+from model.connop import *
+from model.optimize import *
+from model.milp import HighsBackend
+from model.decompose import DecomposedOptimize, tile_of
+from networks import make_network
+
+
+def highs():
+    return HighsBackend(log_output=False)
+
+
+class TestDecompose(unittest.TestCase):
+    def assert_feasible(self, net):
+        BW = net.channel.bandwidth[1] - net.channel.bandwidth[0]
+        B, x, y = (np.zeros((len(net.gnbs), len(net.ues))) for _ in range(3))
+        fconns = ConnectionFilter.of(net)
+        B[fconns.bidx, fconns.ueidx] = fconns.take(net.conns['bandwidth'])
+        x[fconns.bidx, fconns.ueidx] = fconns.take(net.conns['x_traffic'])
+        y[fconns.bidx, fconns.ueidx] = fconns.take(net.conns['y_traffic'])
+
+        self.assertTrue(np.all(x.sum(axis=0) >= net.ues['demand'].values - 1e-6))
+        self.assertTrue(np.all(B.sum(axis=1) <= BW + 1e-6))
+        self.assertTrue(np.all(B.sum(axis=0) <= BW + 1e-6))
+        ## any two links failing, the backups of the rest carry their traffic
+        for u in range(len(net.ues)):
+            links = fconns.bidx[fconns.ue_edges(u)]
+            for i, b1 in enumerate(links):
+                for b2 in links[i + 1:]:
+                    rest = y[:, u].sum() - y[b1, u] - y[b2, u]
+                    self.assertGreaterEqual(rest + 1e-6, x[b1, u] + x[b2, u])
+
+
+    def test_tiles(self):
+        net = make_network(20)
+        tiles = tile_of(net, (2, 3))
+        self.assertEqual(tiles.max(), 5)
+        x, y = net.ues['x'].values, net.ues['y'].values
+        np.testing.assert_array_equal(tiles, (x >= 300) * 3 + (y >= 200) + (y >= 400))
+
+
+    def test_against_monolithic(self):
+        for radius, demand in ((None, 1.5), (None, 2.5), (400, 2.5)):
+            net = make_network(20, radius=radius)
+            net.ues['demand'] = demand
+            exact = Optimize(backend=highs())
+            exact.execute(net)
+
+            op = DecomposedOptimize(tiles=(2, 2), backend=highs())
+            op.execute(net)
+            self.assert_feasible(net)
+            gap = (op.objective_value - exact.objective_value) / exact.objective_value
+            self.assertGreaterEqual(gap, -1e-6)
+            self.assertLess(gap, 0.01)
+
+
+    def test_workers(self):
+        net = make_network(20, seed=1)
+        DecomposedOptimize(tiles=(2, 2), backend=highs()).execute(net)
+        expected = {col: net.conns[col].copy() for col in ('bandwidth', 'x_traffic', 'mcs_idx')}
+
+        op = DecomposedOptimize(tiles=(2, 2), workers=2, backend=highs())
+        op.execute(net)
+        for col, values in expected.items():
+            np.testing.assert_allclose(net.conns[col], values, atol=1e-6)
+
+
+    def test_no_solution(self):
+        net = make_network(20)
+        net.ues['demand'] = 40.
+        with self.assertRaises(NoSolutionException):
+            DecomposedOptimize(tiles=(2, 2), rounds=2, backend=highs()).execute(net)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+from model.savenet import *
+from model.network import *
+from model.connop import *
+from model.optimize import *
+from model.milp import Formulation, DocplexBackend, HighsBackend
+from model.greedy import greedy_solution
+from networks import make_network
+
+
+def violations(form, solution, tol=1e-6):
+    ## the constraints of the formulation that the solution breaks, by name
+    fconns, BW = form.fconns, form.BW
+    le = form.lvl_edge
+    snr = np.bincount(le, weights=solution.bm * form.lvl_snr, minlength=form.E)
+    eff = np.bincount(le, weights=solution.bm * form.lvl_eff, minlength=form.E)
+    p1, p2 = fconns.ue_pairs()
+    Y = np.bincount(fconns.ueidx, weights=solution.y, minlength=fconns.ue_count)
+    t = solution.x + solution.y
+
+    excess = {
+        'one_level': np.abs(np.bincount(le, weights=solution.bm, minlength=form.E) - 1),
+        'signal': snr + form.e_loss - solution.signal_power,
+        'power': solution.signal_power - form.e_pow,
+        'capacity': t - eff * solution.bandwidth,
+        'ue_bandwidth': np.bincount(fconns.ueidx, weights=solution.bandwidth, minlength=fconns.ue_count) - BW,
+        'gnb_bandwidth': np.bincount(fconns.bidx, weights=solution.bandwidth, minlength=fconns.gnb_count) - BW,
+        'demand': form.u_demand - np.bincount(fconns.ueidx, weights=solution.x, minlength=fconns.ue_count),
+        'protection': t[p1] + t[p2] - Y[fconns.ueidx[p1]],
+        'negative': -np.concatenate([solution.x, solution.y, solution.bandwidth, solution.signal_power]),
+    }
+    return [name for name, values in excess.items() if np.max(values, initial=0) > tol]
+
+
+class TestGreedy(unittest.TestCase):
+    def test_feasible(self):
+        net = NetworkData()
+        net.conns = dict()
+        np.random.seed(0)
+        (
+            Load('data/test', force_init=True) &
+            DistanceCalc() &
+            DistanceWeight(1) &
+            FreeSpacePathloss() &
+            CalcMaxSnr() &
+            MinSnrFilter()
+        ).execute(net)
+
+        ## the MILP fills the gNBs at 1.5 here, the greedy split needs some room
+        for demand in (0.5, 1.0):
+            net.ues['demand'] = demand
+            form = Formulation(net, ConnectionFilter.of(net), 0.1, 1)
+            solution, served = greedy_solution(form)
+            self.assertTrue(served.all())
+            self.assertEqual(violations(form, solution), [])
+
+
+    def test_congested(self):
+        ## more demand than the gNBs can carry at any level
+        net = make_network(12)
+        net.ues['demand'] = 40.
+        form = Formulation(net, ConnectionFilter.of(net), 0.1, 1)
+        solution, served = greedy_solution(form)
+        self.assertFalse(served.all())
+
+        broken = violations(form, solution)
+        self.assertEqual(broken, ['demand'])
+        with self.assertRaises(NoSolutionException):
+            GreedyOptimize().execute(net)
+
+
+    def test_no_level_selected(self):
+        ## a solution without an MCS level on an edge is rejected, also under -O
+        net = make_network()
+        op = GreedyOptimize()
+        op.execute(net)
+        fconns = ConnectionFilter.of(net)
+        solution, _ = greedy_solution(op.form)
+        solution.bm[op.form.lvl_edge == 0] = 0
+        with self.assertRaisesRegex(ValueError, 'Not exactly one MCS'):
+            op.write_solution(net, fconns, solution)
+
+
+    def test_gap(self):
+        for seed in range(3):
+            net = make_network(seed=seed)
+            greedy = GreedyOptimize()
+            greedy.execute(net)
+            self.assertTrue(np.all(np.sum(net.conns['x_traffic'], axis=0) >= net.ues['demand'] - 1e-6))
+
+            exact = Optimize(backend=HighsBackend(log_output=False), greedy_start=False)
+            exact.execute(net)
+            gap = (greedy.objective_value - exact.objective_value) / exact.objective_value
+            self.assertGreaterEqual(gap, -1e-4)
+            self.assertLess(gap, 0.05)
+
+
+    def test_mip_start(self):
+        net = make_network()
+        op = Optimize(backend=DocplexBackend(log_output=False))
+        op.execute(net)
+        self.assertIsNotNone(op.greedy_objective)
+        self.assertGreaterEqual(op.start_gap, -1e-4)
+
+        without = Optimize(backend=DocplexBackend(log_output=False), greedy_start=False)
+        without.execute(net)
+        self.assertIsNone(without.start_gap)
+        self.assertAlmostEqual(op.objective_value, without.objective_value, delta=1e-4 * abs(op.objective_value))
+
+
+if __name__ == '__main__':
+    unittest.main()
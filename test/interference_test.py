@@ -0,0 +1,144 @@
+import unittest
+import numpy as np
+from model.savenet import *
+from model.network import *
+from model.connop import *
+from model.interference import *
+from model.spatial import SpatialIndex
+
+
+class TestInterfApprox(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.net = NetworkData()
+        op = (
+            Load('data/test', force_init=True) &
+            DistanceCalc() &
+            FreeSpacePathloss() &
+            CalcMaxSnr() &
+            MinSnrFilter()
+        )
+        op.execute(cls.net)
+
+
+    def test_batched_same_as_provider(self):
+        fconns = ConnectionFilter(self.net)
+
+        np.random.seed(0)
+        expected = list(InterfApproxProvider(self.net, fconns))
+        ## a budget of a few rows per block gives the same as whole gNBs
+        np.random.seed(0)
+        batched = list(BatchedInterfApproxProvider(self.net, fconns))
+        np.random.seed(0)
+        blocked = list(BatchedInterfApproxProvider(self.net, fconns, memory=3 * 41 * len(self.net.ues)))
+
+        self.assertEqual(len(expected), len(batched))
+        for a, b, c in zip(expected, batched, blocked):
+            np.testing.assert_array_equal(b.ues, c.ues)
+            np.testing.assert_array_equal(b.weights, c.weights)
+            self.assertEqual(a.e, b.e)
+            self.assertEqual(a.total_interferer_count, b.total_interferer_count)
+            self.assertEqual(a.selection_count, b.selection_count)
+            np.testing.assert_array_equal(a.ues, b.ues)
+            ## scalar and vectorized pow differ in the last bit
+            np.testing.assert_allclose(a.weights, b.weights, rtol=1e-12)
+            np.testing.assert_allclose(a._I, b._I, rtol=1e-12)
+            np.testing.assert_array_equal(a._sort_idx, b._sort_idx)
+            np.testing.assert_array_equal(a._aprx_idx, b._aprx_idx)
+
+
+    def test_spatial_provider(self):
+        fconns = ConnectionFilter(self.net)
+        ues = np.arange(len(self.net.ues))
+
+        for data in SpatialInterfApproxProvider(self.net, fconns):
+            dst = self.net.conns['distance'][data.b]
+            others = ues[ues != data.u]
+            nearest = others[np.argsort(dst[others])[:4]]
+
+            np.testing.assert_array_equal(data.ues[:4], nearest)
+            self.assertNotIn(data.u, data.ues)
+            ## without power variation the weights give back the exact sum
+            self.assertLess(data.error_for(np.ones(len(data._I))), 1e-12)
+
+
+    def test_spatial_provider_tail(self):
+        ## past the shells the rest of the UEs is one more shell
+        fconns = ConnectionFilter(self.net)
+        for data in SpatialInterfApproxProvider(self.net, fconns, exact=3, delta=2, shells=2):
+            self.assertLessEqual(data.selection_count, 3 + 2 + 1)
+            self.assertEqual(len(np.unique(data.ues)), len(data.ues))
+            self.assertNotIn(data.u, data.ues)
+            self.assertLess(data.error_for(np.ones(len(data._I))), 1e-12)
+
+
+    def test_spatial_provider_sparse(self):
+        net = NetworkData()
+        (Load('data/test', force_init=True) & DistanceCalc(150) & FreeSpacePathloss() &
+         CalcMaxSnr() & MinSnrFilter()).execute(net)
+        fconns = ConnectionFilter(net)
+        bid, ueid = net.conns[Cols.BID], net.conns[Cols.UEID]
+
+        with self.assertRaises(ValueError):
+            next(iter(BatchedInterfApproxProvider(net, fconns)))
+
+        count = 0
+        for data in SpatialInterfApproxProvider(net, fconns, exact=2, delta=3):
+            ## only the UEs in the table of the gNB interfere, each picked once
+            table = np.sort(ueid[bid == data.b])
+            self.assertEqual(data.total_interferer_count, len(table) - 1)
+            self.assertTrue(np.all(np.isin(data.ues, table)))
+            self.assertNotIn(data.u, data.ues)
+            self.assertEqual(len(np.unique(data.ues)), len(data.ues))
+            self.assertLess(data.error_for(np.ones(len(data._I))), 1e-12)
+            count += 1
+        self.assertEqual(count, len(fconns))
+
+
+    def test_monte_carlo_matches_error_for(self):
+        fconns = ConnectionFilter(self.net)
+        data = list(BatchedInterfApproxProvider(self.net, fconns, rng=np.random.default_rng(0)))
+        variations = [0.1, 0.5, 1]
+        mc = InterfMonteCarlo(variations, trials=3, seed=1, chunk_size=1)
+        errs = mc.errors(data)
+        self.assertEqual(errs.shape, (3, len(variations), len(data)))
+
+        ## one trial per chunk, the same draws replayed through the per connection error
+        I, _ = InterfMonteCarlo.stack(data)
+        seeds = np.random.SeedSequence(1).spawn(3)
+        R = np.concatenate([np.random.default_rng(s).random((1,) + I.shape) for s in seeds])
+        for t in range(3):
+            for j, var in enumerate(variations):
+                for i in range(0, len(data), 97):
+                    expected = data[i].error_for(1 + R[t, i] * var)
+                    self.assertAlmostEqual(errs[t, j, i], expected, places=12)
+
+
+    def test_monte_carlo_reproducible(self):
+        fconns = ConnectionFilter(self.net)
+        data = list(SpatialInterfApproxProvider(self.net, fconns, rng=np.random.default_rng(0)))
+        mc = InterfMonteCarlo(np.linspace(0.1, 1, 10), trials=4, seed=7)
+        results = mc.run(data)
+
+        self.assertEqual(len(results), 4 * 10 * len(data))
+        self.assertListEqual(list(results.columns), ['trial', 'variation', 'b', 'u', 'error'])
+        np.testing.assert_array_equal(results['error'], mc.run(data)['error'])
+
+        mc.workers = 2
+        np.testing.assert_array_equal(results['error'], mc.run(data)['error'])
+
+
+    def test_spatial_index(self):
+        index = SpatialIndex.of(self.net)
+        self.assertIs(index, SpatialIndex.of(self.net))
+
+        point = (self.net.gnbs['x'][0], self.net.gnbs['y'][0])
+        dst = self.net.conns['distance'][0]
+        _, near = index.nearest(point, 5)
+        np.testing.assert_array_equal(near, np.argsort(dst)[:5])
+        np.testing.assert_array_equal(
+            index.shell(point, 50, 100), np.flatnonzero((dst >= 50) & (dst < 100)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+from model.savenet import *
+from model.network import *
+from model.connop import *
+from model.optimize import Optimize
+from model.mobility import Mobility
+
+
+def chain(radius):
+    return (
+        DistanceCalc(radius) &
+        DistanceWeight(1) &
+        FreeSpacePathloss() &
+        CalcMaxSnr() &
+        MinSnrFilter()
+    )
+
+
+def load_net(radius):
+    net = NetworkData()
+    net.conns = dict()
+    np.random.seed(0)
+    (Load('data/test', force_init=True) & chain(radius)).execute(net)
+    return net
+
+
+class TestMobility(unittest.TestCase):
+    def step(self, net, rng, moves, joins, departures):
+        moved = rng.choice(len(net.ues), moves, replace=False)
+        net.ues.loc[moved, 'x'] = rng.uniform(0, net.channel.area[0], moves)
+        net.ues.loc[moved, 'y'] = rng.uniform(0, net.channel.area[1], moves)
+
+        count = len(net.ues)
+        joined = net.ues.iloc[rng.choice(count, joins)].copy()
+        joined['x'] = rng.uniform(0, net.channel.area[0], joins)
+        joined['id'] = np.arange(count, count + joins)
+        net.ues = pd.concat([net.ues, joined], ignore_index=True)
+
+        departed = rng.choice(count, departures, replace=False)
+        return moved, np.arange(count, count + joins), departed
+
+
+    def assert_recomputed(self, net, radius):
+        full = NetworkData()
+        full.conns = dict()
+        full.channel, full.mcst, full.gnbs, full.ues = net.channel, net.mcst, net.gnbs, net.ues.copy()
+        chain(radius).execute(full)
+
+        self.assertEqual(set(net.conns), set(full.conns))
+        for col, values in full.conns.items():
+            self.assertEqual(net.conns[col].dtype, values.dtype)
+            np.testing.assert_array_equal(net.conns[col], values)
+
+        ## the cached filter was updated, not rebuilt
+        fconns = net.__dict__['_fconns']
+        self.assertIs(ConnectionFilter.of(net), fconns)
+        expected = ConnectionFilter(full)
+        for name in ('bidx', 'ueidx', 'keys', 'gnb_ptr', 'gnb_degree', 'ue_order', 'ue_ptr', 'ue_degree'):
+            np.testing.assert_array_equal(getattr(fconns, name), getattr(expected, name), err_msg=name)
+        np.testing.assert_array_equal(fconns.take(net.conns['max_snr']), expected.take(full.conns['max_snr']))
+
+
+    def test_steps(self):
+        for radius in (None, 150):
+            net = load_net(radius)
+            rng = np.random.default_rng(1)
+            ConnectionFilter.of(net)
+            for moves, joins, departures in ((8, 0, 0), (4, 3, 0), (0, 0, 5), (10, 2, 3)):
+                moved, joined, departed = self.step(net, rng, moves, joins, departures)
+                Mobility(chain(radius), moved, joined, departed).execute(net)
+                np.testing.assert_array_equal(net.ues['id'], np.arange(len(net.ues)))
+                self.assert_recomputed(net, radius)
+
+
+    def test_stale_columns(self):
+        net = load_net(None)
+        net.conns['bandwidth'] = np.zeros_like(net.conns['distance'])
+        Mobility(chain(None), moved=[0]).execute(net)
+        self.assertNotIn('bandwidth', net.conns)
+
+
+    def test_invalid(self):
+        net = load_net(150)
+        with self.assertRaises(TypeError):
+            Mobility(chain(150) & Optimize())
+        with self.assertRaises(ValueError):
+            Mobility(FreeSpacePathloss() & CalcMaxSnr(), moved=[0]).execute(net)
+        with self.assertRaises(ValueError):
+            Mobility(chain(150), joined=[0]).execute(net)
+
+
+if __name__ == '__main__':
+    unittest.main()
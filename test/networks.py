@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+from model.network import *
+from model.connop import *
+from model.savenet import grid
+
+
+## networks shared by the test files, imported as networks: test/ is on their
+## path, but as a package it would be shadowed by the standard library's test
+
+
+def chain():
+    return DistanceCalc() & DistanceWeight(1) & FreeSpacePathloss() & CalcMaxSnr() & MinSnrFilter()
+
+
+def make_network(count=6, seed=0, radius=None):
+    ## six UEs under a 3x3 grid of gNBs are small enough for the community
+    ## edition of CPLEX, radius gives a sparse connection table
+    rng = np.random.default_rng(seed)
+    net = NetworkData()
+    net.conns = dict()
+    net.channel = Channel(-100, (600, 600), (24, 40))
+    net.mcst = MCSTable(2, 0, 2, 0.9)
+    net.ues = pd.DataFrame({
+        'id': np.arange(count), 'x': rng.uniform(0, 600, count), 'y': rng.uniform(0, 600, count),
+        'gain': 0., 'demand': 1.5, 'max_power': 26.})
+    x, y = grid(600, 600, 3, 3)
+    net.gnbs = pd.DataFrame({'id': np.arange(9), 'x': x, 'y': y, 'gain': 10.})
+    (DistanceCalc(radius) & DistanceWeight(1) & FreeSpacePathloss() & CalcMaxSnr() & MinSnrFilter()).execute(net)
+    return net
@@ -0,0 +1,149 @@
+import unittest
+import threading
+from model.savenet import *
+from model.network import *
+from model.connop import *
+from model.operations import *
+from model.optimize import Optimize
+
+
+class Spy(Operation):
+    def __init__(self, name, log, requires=(), produces=(), barrier=None):
+        self.name = name
+        self.log = log
+        self.required = {('conns', col) for col in requires}
+        self.produced = {('conns', col) for col in produces}
+        self.sync = barrier
+
+
+    def requirements(self):
+        return self.required
+
+
+    def products(self):
+        return self.produced
+
+
+    def execute(self, net):
+        if self.sync is not None:
+            self.sync.wait(timeout=5)
+        for _, col in self.produced:
+            net.conns[col] = np.ones(1)
+        self.log.append(self.name)
+
+
+class TestOpSequence(unittest.TestCase):
+    def setUp(self):
+        self.net = NetworkData()
+        self.net.conns = dict()
+        self.net.ues = pd.DataFrame({'x': [0.]})
+        self.net.gnbs = pd.DataFrame({'x': [0.]})
+
+
+    def test_declarations(self):
+        op = Optimize()
+        self.assertIn(('conns', 'weight'), op.requirements())
+        self.assertIn(('ues', 'demand'), op.requirements())
+        self.assertIn(('conns', 'filter'), op.usages())
+        self.assertIn(('conns', 'mcs_idx'), op.products())
+        self.assertEqual(MinSnrFilter().products(), {('conns', 'filter')})
+        self.assertIsNone(Operation().products())
+
+        seq = DistanceCalc() & FreeSpacePathloss() & CalcMaxSnr()
+        self.assertNotIn(('conns', 'distance'), seq.requirements())
+        self.assertIn(('ues', 'max_power'), seq.requirements())
+
+
+    def test_dependencies(self):
+        log = []
+        seq = OpSequence(
+            Spy('a', log, produces=['a']),
+            Spy('b', log, requires=['a'], produces=['b']),
+            Spy('c', log, requires=['a'], produces=['c']),
+            Spy('d', log, requires=['b', 'c'], produces=['d']),
+            Spy('e', log, produces=['a']),
+        )
+        self.assertEqual(seq.dependencies(), [set(), {0}, {0}, {1, 2}, {0, 1, 2}])
+
+
+    def test_parallel_branches(self):
+        log = []
+        sync = threading.Barrier(2)
+        seq = OpSequence(
+            Spy('a', log, produces=['a']),
+            Spy('b', log, requires=['a'], produces=['b'], barrier=sync),
+            Spy('c', log, requires=['a'], produces=['c'], barrier=sync),
+            Spy('d', log, requires=['b', 'c'], produces=['d']),
+        ).parallel(4)
+
+        ## b and c only pass the barrier when they run at the same time
+        seq.execute(self.net)
+        self.assertFalse(sync.broken)
+        self.assertEqual(log[0], 'a')
+        self.assertEqual(set(log[1:3]), {'b', 'c'})
+        self.assertEqual(log[3], 'd')
+
+
+    def test_dry_run(self):
+        log = []
+        seq = OpSequence(
+            Spy('a', log, produces=['a']),
+            Spy('b', log, requires=['a', 'missing'], produces=['b']),
+            Spy('expensive', log, requires=['b']),
+        )
+
+        missing = seq.dry_run(self.net)
+        self.assertEqual([(op.name, table, col) for op, table, col in missing], [('b', 'conns', 'missing')])
+        with self.assertRaises(RequiredColumnMissingException):
+            seq.execute(self.net)
+        self.assertEqual(log, [])
+
+        ## every missing column is in the one exception
+        seq = OpSequence(
+            Spy('a', log, requires=['first']),
+            Spy('b', log, requires=['second']),
+        )
+        with self.assertRaises(RequiredColumnMissingException) as raised:
+            seq.execute(self.net)
+        self.assertEqual([col for _, _, col in raised.exception.missing], ['first', 'second'])
+        self.assertIn('"second" of "conns"', str(raised.exception))
+
+
+    def test_load_products(self):
+        seq = Load('data/test', force_init=True) & DistanceCalc() & FreeSpacePathloss() & CalcMaxSnr()
+        self.assertEqual(seq.dry_run(NetworkData()), [])
+        self.assertIn(('ues', 'max_power'), Load('data/test', force_init=True).products())
+
+
+    def test_parallel_same_as_sequential(self):
+        def run(seq):
+            net = NetworkData()
+            net.conns = dict()
+            np.random.seed(0)
+            seq.execute(net)
+            return net.conns
+
+        def pipeline():
+            return (
+                Load('data/test', force_init=True) &
+                DistanceCalc() &
+                DistanceWeight(1) &
+                FreeSpacePathloss() &
+                CalcMaxSnr() &
+                MinSnrFilter()
+            )
+
+        OpSequence.fusion = False
+        try:
+            expected = run(pipeline())
+            conns = run(pipeline().parallel(4))
+        finally:
+            OpSequence.fusion = True
+
+        self.assertEqual(set(conns), set(expected))
+        for col in expected:
+            np.testing.assert_array_equal(conns[col], expected[col])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,9 +3,12 @@ from model.savenet import *
 from model.optimize import *
 from model.network import *
 from model.connop import *
+from model.milp import HighsBackend
 
 
 class TestOptimizer(unittest.TestCase):
+    backend = 'docplex'
+
     @classmethod
     def setUpClass(cls):
         cls.net = NetworkData()
@@ -16,7 +19,7 @@ class TestOptimizer(unittest.TestCase):
             FreeSpacePathloss() &
             CalcMaxSnr() &
             MinSnrFilter() &
-            Optimize()
+            Optimize(backend=cls.backend)
         )
         op.execute(cls.net)
 
@@ -65,3 +68,114 @@ class TestOptimizer(unittest.TestCase):
 
     def test_protection_constraints(self):
         self.assertTrue(True)
+
+
+class TestHighsOptimizer(TestOptimizer):
+    ## HiGHS needs minutes to close the default gap on data/test
+    backend = HighsBackend(mip_gap=1e-2)
+
+
+    def test_demand_constraints(self):
+        ## HiGHS meets the demand rows within its feasibility tolerance
+        sum_x = np.sum(
+            self.net.conns['x_traffic'],
+            axis=0
+        )
+
+        fullfilled = sum_x >= self.net.ues['demand']
+        fullfilled_eq = np.isclose(sum_x, self.net.ues['demand'])
+        self.assertTrue(
+            np.logical_or(fullfilled, fullfilled_eq).all(),
+            'Not all demands are fullfilled.')
+
+
+class TestLazyProtection(unittest.TestCase):
+    backend = 'docplex'
+
+    def test_same_optimum(self):
+        net = NetworkData()
+        op = (
+            Load('data/test', force_init=True) &
+            DistanceCalc() &
+            DistanceWeight(1) &
+            FreeSpacePathloss() &
+            CalcMaxSnr() &
+            MinSnrFilter()
+        )
+        op.execute(net)
+
+        eager = Optimize(backend=self.backend)
+        eager.execute(net)
+        lazy = Optimize(lazy_protection=True, backend=self.backend)
+        lazy.execute(net)
+
+        ## both solves stop at the default relative MIP gap
+        self.assertAlmostEqual(
+            eager.objective_value, lazy.objective_value, delta=1e-4 * abs(eager.objective_value),
+            msg='Lazy protection changed the optimum.')
+
+
+
+def max_interference_loop(net, fconns):
+    maxIdb = -np.inf
+    maxImW = 0
+    count = 0
+
+    u_pow = net.ues['max_power'].values
+    u_gain = net.ues['gain'].values
+    b_gain = net.gnbs['gain'].values
+
+    for b, u in fconns:
+        I = 0
+        for bp, up in fconns:
+            if u == up or b == bp:
+                continue
+            Idb = u_pow[up] - net.conns['pathloss'][b, up] + u_gain[up] + b_gain[b]
+            count += 1
+            if Idb > maxIdb:
+                maxIdb = Idb
+            I += 10 ** (Idb / 10)
+        if I > maxImW:
+            maxImW = I
+
+    return maxIdb, maxImW, count
+
+
+class TestMaxInterference(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.net = NetworkData()
+        op = (
+            Load('data/test', force_init=True) &
+            DistanceCalc() &
+            FreeSpacePathloss() &
+            CalcMaxSnr() &
+            MinSnrFilter()
+        )
+        op.execute(cls.net)
+
+
+    def assert_same_as_loop(self, chunk_size):
+        fconns = ConnectionFilter(self.net)
+        maxIdb, maxImW, count = Optimize().calc_max_interference(self.net, fconns, chunk_size)
+        loopIdb, loopImW, loop_count = max_interference_loop(self.net, fconns)
+
+        self.assertEqual(count, loop_count)
+        self.assertAlmostEqual(maxIdb, loopIdb, places=9)
+        self.assertTrue(np.isclose(maxImW, loopImW, rtol=1e-9, atol=0))
+
+
+    def test_same_as_loop(self):
+        self.assert_same_as_loop(2**22)
+        self.assert_same_as_loop(100)
+
+
+    def test_same_as_loop_filtered(self):
+        filter = self.net.conns['filter']
+        try:
+            rng = np.random.default_rng(0)
+            self.net.conns['filter'] = filter & (rng.random(filter.shape) < 0.3)
+            self.assert_same_as_loop(2**22)
+            self.assert_same_as_loop(100)
+        finally:
+            self.net.conns['filter'] = filter
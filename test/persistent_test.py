@@ -0,0 +1,85 @@
+import unittest
+from model.network import *
+from model.connop import *
+from model.optimize import *
+from model.milp import PersistentDocplexBackend, HighsBackend
+from model.mobility import Mobility
+from networks import make_network, chain
+
+
+class TestPersistentOptimizer(unittest.TestCase):
+    def assert_fresh_objective(self, net, op):
+        fresh = Optimize(backend=HighsBackend(log_output=False))
+        fresh.execute(net)
+        self.assertAlmostEqual(op.objective_value, fresh.objective_value, delta=1e-3 * abs(fresh.objective_value))
+
+
+    def test_demand_changes(self):
+        net = make_network()
+        backend = PersistentDocplexBackend(log_output=False)
+        op = Optimize(backend=backend)
+        op.execute(net)
+        model, variables = backend.model, backend.model.number_of_variables
+
+        for demand in (1.2, 1.8):
+            net.ues['demand'] = demand
+            op.execute(net)
+            self.assertIs(backend.model, model)
+            self.assertEqual(backend.model.number_of_variables, variables)
+            self.assertEqual(backend.retired, 0)
+            self.assert_fresh_objective(net, op)
+
+
+    def test_mobility(self):
+        net = make_network()
+        backend = PersistentDocplexBackend(log_output=False, compact_ratio=0.3)
+        op = Optimize(backend=backend)
+        op.execute(net)
+
+        rng = np.random.default_rng(0)
+        rebuilt = False
+        for _ in range(6):
+            model = backend.model
+            moved = rng.choice(len(net.ues), 2, replace=False)
+            net.ues.loc[moved, 'x'] = rng.uniform(0, 600, 2)
+            net.ues.loc[moved, 'y'] = rng.uniform(0, 600, 2)
+            Mobility(chain(), moved=moved).execute(net)
+            op.execute(net)
+            rebuilt |= backend.model is not model
+            self.assert_fresh_objective(net, op)
+
+            self.assertTrue(np.all(np.sum(net.conns['x_traffic'], axis=0) >= net.ues['demand'] - 1e-6))
+        self.assertTrue(rebuilt, 'The model was never compacted')
+
+
+    def test_by_name(self):
+        net = make_network()
+        op = Optimize(backend='persistent')
+        op.execute(net)
+        solver = op.solver
+        op.execute(net)
+        self.assertIs(op.solver, solver)
+
+        op.close()
+        self.assertIsNone(solver.model)
+        self.assertFalse(hasattr(op, 'solver'))
+
+
+    def test_close(self):
+        net = make_network()
+        with PersistentDocplexBackend(log_output=False) as backend:
+            op = Optimize(backend=backend)
+            op.execute(net)
+            ## an instance passed in is left to its owner
+            op.close()
+            self.assertIsNotNone(backend.model)
+        self.assertIsNone(backend.model)
+
+
+    def test_lazy_protection(self):
+        with self.assertRaises(ValueError):
+            Optimize(backend=PersistentDocplexBackend(log_output=False), lazy_protection=True).execute(make_network())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,10 @@
 import unittest
+import tempfile
+import shutil
+import importlib.util
+from model.savenet import *
+from model.network import *
+from model.connop import *
 
 
 class TestSaveNet(unittest.TestCase):
@@ -10,5 +16,292 @@ class TestSaveNet(unittest.TestCase):
         self.assertTrue(True)
 
 
+class TestDtypePolicy(unittest.TestCase):
+    def load_net(self, dtypes, radius=None):
+        net = NetworkData()
+        net.conns = dict()
+        net.dtypes = dtypes
+        np.random.seed(0)
+        op = (
+            Load('data/test', force_init=True) &
+            DistanceCalc(radius) &
+            DistanceWeight(1) &
+            FreeSpacePathloss() &
+            CalcMaxSnr() &
+            MinSnrFilter()
+        )
+        op.execute(net)
+        net.conns['mcs_idx'] = net.dtypes.cast('mcs_idx', net.conns['filter'])
+        return net
+
+
+    def test_compact_columns(self):
+        compact = self.load_net(DtypePolicy.compact(), 150)
+        full = self.load_net(DtypePolicy(), 150)
+
+        for col in ('distance', 'pathloss', 'weight', 'max_snr'):
+            self.assertEqual(compact.conns[col].dtype, np.float32)
+            np.testing.assert_allclose(compact.conns[col], full.conns[col], rtol=1e-5)
+        self.assertEqual(compact.conns['filter'].dtype, bool)
+        self.assertEqual(compact.conns['mcs_idx'].dtype, np.int8)
+        self.assertEqual(compact.conns[Cols.BID].dtype, np.int32)
+
+
+    def test_roundtrip(self):
+        for dtypes in (DtypePolicy(), DtypePolicy.compact()):
+            for radius in (None, 150):
+                net = self.load_net(dtypes, radius)
+                for format in ('npy', 'zip'):
+                    with tempfile.TemporaryDirectory() as path:
+                        Save('roundtrip', path=path + '/', format=format).execute(net)
+
+                        loaded = NetworkData()
+                        loaded.conns = dict()
+                        load = Load('roundtrip', path=path)
+                        if format == 'npy':
+                            load._load_dir(path + '/roundtrip.5gn', loaded)
+                        else:
+                            load._load_zip(path + '/roundtrip.5gn.zip', loaded)
+
+                        self.assertEqual(loaded.dtypes, dtypes)
+                        self.assertEqual(set(loaded.conns), set(net.conns))
+                        for col, values in net.conns.items():
+                            self.assertEqual(loaded.conns[col].dtype, values.dtype)
+                            np.testing.assert_array_equal(loaded.conns[col], values)
+
+
+    def test_mapped_columns(self):
+        net = self.load_net(DtypePolicy(), 150)
+        with tempfile.TemporaryDirectory() as path:
+            save = Save('mapped', path=path + '/')
+            save.execute(net)
+
+            load = save.to_load()
+            self.assertLessEqual({(Tables.CONN, col) for col in net.conns}, load.products())
+            self.assertIn((Tables.UE, 'demand'), load.products())
+
+            loaded = NetworkData()
+            loaded.conns = dict()
+            load._load_dir(path + '/mapped.5gn', loaded)
+            self.assertIsInstance(loaded.conns['pathloss'], np.memmap)
+            pd.testing.assert_frame_equal(loaded.ues, net.ues)
+
+            ## edits stay in memory, and saving over the mapped files works
+            loaded.conns['pathloss'][0] = -1
+            again = NetworkData()
+            again.conns = dict()
+            load._load_dir(path + '/mapped.5gn', again)
+            self.assertEqual(again.conns['pathloss'][0], net.conns['pathloss'][0])
+
+            save.execute(loaded)
+            load._load_dir(path + '/mapped.5gn', again)
+            self.assertEqual(again.conns['pathloss'][0], -1)
+
+    @unittest.skipUnless(importlib.util.find_spec('pyarrow'), 'needs pyarrow')
+    def test_parquet_tables(self):
+        net = self.load_net(DtypePolicy(), 150)
+        net.ues['id'] = net.ues['id'].astype(np.int32)
+        with tempfile.TemporaryDirectory() as path:
+            for compression in (None, 'zstd'):
+                Save('tables', path=path + '/', tables='parquet', compression=compression).execute(net)
+                self.assertTrue(os.path.exists(path + '/tables.5gn/ues.parquet'))
+                self.assertFalse(os.path.exists(path + '/tables.5gn/ues.csv'))
+
+                loaded = NetworkData()
+                loaded.conns = dict()
+                Load('tables', path=path)._load_dir(path + '/tables.5gn', loaded)
+                pd.testing.assert_frame_equal(loaded.ues, net.ues)
+                pd.testing.assert_frame_equal(loaded.gnbs, net.gnbs)
+
+            load = Load('tables', path=path, columns={Tables.UE: ('x', 'y', 'gain')})
+            self.assertEqual({c for t, c in load.products() if t == Tables.UE}, {'x', 'y', 'gain'})
+            projected = NetworkData()
+            projected.conns = dict()
+            load._load_dir(path + '/tables.5gn', projected)
+            self.assertEqual(list(projected.ues.columns), ['x', 'y', 'gain'])
+            self.assertEqual(list(projected.gnbs.columns), list(net.gnbs.columns))
+
+
+    def test_failed_save(self):
+        with self.assertRaises(ValueError):
+            Save('tables', tables='xlsx')
+        with self.assertRaises(ValueError):
+            Save('tables', format='tar')
+
+        net = self.load_net(DtypePolicy())
+        with tempfile.TemporaryDirectory() as path:
+            Save('tables', path=path + '/').execute(net)
+            ## a column that cannot be written stops the save, the old one stays
+            net.conns['no/such/dir'] = np.zeros(3)
+            with self.assertRaises(OSError):
+                Save('tables', path=path + '/').execute(net)
+            self.assertEqual(os.listdir(path), ['tables.5gn'])
+            self.assertNotIn('no/such/dir', Load('tables', path=path).products())
+
+
+    def test_csv_projection(self):
+        net = self.load_net(DtypePolicy())
+        with tempfile.TemporaryDirectory() as path:
+            Save('tables', path=path + '/', format='zip').execute(net)
+            loaded = NetworkData()
+            loaded.conns = dict()
+            Load('tables', path=path, columns={Tables.UE: ('x', 'y')})._load_zip(path + '/tables.5gn.zip', loaded)
+            self.assertEqual(list(loaded.ues.columns), ['x', 'y'])
+
+
+class TestScenarioCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = self.dir.name + '/'
+        shutil.copy('data/test.5gn.ini', self.path + 'scenario.5gn.ini')
+
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+
+    def run_load(self, seed=0):
+        net = NetworkData()
+        load = Load('scenario', path=self.path, seed=seed)
+        op = load & DistanceCalc() & FreeSpacePathloss()
+        op.execute(net)
+        return net, load
+
+
+    def test_reuse(self):
+        for format in ('npy', 'zip'):
+            first, load = self.run_load()
+            self.assertFalse(load.hit)
+            Save('scenario', path=self.path, format=format).execute(first)
+
+            net = NetworkData()
+            load = Load('scenario', path=self.path, seed=0)
+            self.assertIn((Tables.CONN, 'pathloss'), load.products())
+            load.execute(net)
+            self.assertTrue(load.hit)
+            self.assertEqual(net.scenario, first.scenario)
+            self.assertEqual(net.mcst, first.mcst)
+            pd.testing.assert_frame_equal(net.ues, first.ues)
+            np.testing.assert_array_equal(net.conns['pathloss'], first.conns['pathloss'])
+            shutil.rmtree(self.path + 'scenario.5gn', ignore_errors=True)
+
+
+    def test_seeded(self):
+        first, _ = self.run_load(seed=1)
+        second, _ = self.run_load(seed=1)
+        pd.testing.assert_frame_equal(first.ues, second.ues)
+        third, _ = self.run_load(seed=2)
+        self.assertFalse(np.array_equal(first.ues['x'], third.ues['x']))
+
+
+    def test_changed(self):
+        first, _ = self.run_load()
+        Save('scenario', path=self.path).execute(first)
+
+        load = Load('scenario', path=self.path, seed=1)
+        load.execute(NetworkData())
+        self.assertFalse(load.hit)
+
+        with open(self.path + 'scenario.5gn.ini', 'a') as file:
+            file.write('\n')
+        net = NetworkData()
+        load = Load('scenario', path=self.path, seed=0)
+        self.assertNotIn((Tables.CONN, 'pathloss'), load.products())
+        load.execute(net)
+        self.assertFalse(load.hit)
+        self.assertEqual(net.conns, {})
+
+
+class TestGenerators(unittest.TestCase):
+    INI = """
+[channel]
+noise = -100
+area = 2000x1000
+bandwidth = 24-40
+
+[mcs_table]
+levels = 2
+min_snr = 0
+spacing = 2
+efficiency = 0.9
+
+[gnbs]
+pos = hex:250x3
+gain = 10
+
+[ues]
+pos = cluster:20x100x30
+max_power = normal:23x1
+gain = 0
+demand = lognormal:1.5x0.5
+"""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = self.dir.name + '/'
+        with open(self.path + 'gen.5gn.ini', 'w') as file:
+            file.write(self.INI)
+
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+
+    def load(self, seed):
+        net = NetworkData()
+        Load('gen', path=self.path, seed=seed).execute(net)
+        return net
+
+
+    def test_seeded(self):
+        first, second, other = self.load(3), self.load(3), self.load(4)
+        pd.testing.assert_frame_equal(first.ues, second.ues)
+        pd.testing.assert_frame_equal(first.gnbs, second.gnbs)
+        self.assertFalse(first.ues['x'].equals(other.ues['x']))
+
+
+    def test_layouts(self):
+        net = self.load(0)
+        ues, gnbs = net.ues, net.gnbs
+        self.assertTrue(((ues['x'] >= 0) & (ues['x'] < 2000) & (ues['y'] >= 0) & (ues['y'] < 1000)).all())
+        np.testing.assert_array_equal(ues['id'], np.arange(len(ues)))
+        self.assertGreater(ues['demand'].std(), 0)
+        self.assertTrue((ues['demand'] > 0).all())
+
+        ## three sectors per site, at the same position
+        self.assertEqual(len(gnbs) % 3, 0)
+        sites = gnbs[['x', 'y']].drop_duplicates()
+        self.assertEqual(len(sites) * 3, len(gnbs))
+        self.assertEqual(sorted(gnbs['azimuth'].unique()), [0., 120., 240.])
+        dst = np.hypot(*(sites.values[:, None] - sites.values[None]).transpose(2, 0, 1))
+        np.fill_diagonal(dst, np.inf)
+        np.testing.assert_allclose(dst.min(axis=1), 250)
+
+
+    def test_stream(self):
+        net = self.load(5)
+        load = Load('gen', path=self.path, seed=5)
+        whole = list(load.stream(Tables.UE, chunk_size=len(net.ues)))
+        self.assertEqual(len(whole), 1)
+        pd.testing.assert_frame_equal(whole[0].reset_index(drop=True), net.ues)
+
+        ## the rows do not depend on the chunks they come in
+        for chunk_size in (1, 7, 300, 5000):
+            chunks = list(load.stream(Tables.UE, chunk_size=chunk_size))
+            self.assertTrue(all(len(chunk) <= chunk_size for chunk in chunks))
+            pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), net.ues)
+
+        save_chunks(load.stream(Tables.B, chunk_size=7), self.path + 'gnbs.csv')
+        pd.testing.assert_frame_equal(pd.read_csv(self.path + 'gnbs.csv'), net.gnbs)
+
+
+    def test_block_draws(self):
+        ## any split of the draws gives the same values, other arguments never get them
+        column = Draws(0, block=16).column('c')
+        values = np.concatenate([column.uniform(0, 1, n) for n in (5, 40, 1, 30)])
+        np.testing.assert_array_equal(values, Draws(0, block=16).column('c').uniform(0, 1, 76))
+        self.assertTrue(np.all(column.uniform(10, 11, 20) >= 10))
+
+
 if __name__ == '__main__':
     unittest.main()
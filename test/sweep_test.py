@@ -0,0 +1,104 @@
+import unittest
+import os
+import tempfile
+import shutil
+import configparser
+from model.network import *
+from model.sweep import Sweep, parse_values, with_density, GRID, METRICS
+
+
+class TestSweep(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+    def sweep(self, **kwargs):
+        return Sweep(
+            ['data/test'], seeds=(0, 1), alphas=(0.1, 0.2), densities=(0.0001,), backend='highs',
+            output=os.path.join(self.dir, 'sweep.csv'), workdir=self.dir, **kwargs)
+
+
+    def test_parse_values(self):
+        self.assertEqual(parse_values('0-3, 7', int), [0, 1, 2, 3, 7])
+        self.assertEqual(parse_values('0.1,0.25', float), [0.1, 0.25])
+        self.assertEqual(parse_values('', float), [None])
+
+
+    def test_density(self):
+        config = configparser.ConfigParser()
+        config.read('data/test.5gn.ini')
+        with_density(config, 0.001)
+        self.assertEqual(config['ues']['pos'], 'scatter:0.001')
+
+        config['ues']['pos'] = 'cluster:10x16x20'
+        with_density(config, 0.002)
+        ## 400 x 400 m at 0.002 is 320 UEs, 20 hotspots of 16
+        self.assertEqual(config['ues']['pos'], 'cluster:20x16x20')
+
+        config['ues']['pos'] = 'grid:4x4'
+        with self.assertRaises(ValueError):
+            with_density(config, 0.001)
+
+
+    def test_results(self):
+        results = self.sweep().run()
+        self.assertEqual(list(results.columns), list(GRID + METRICS))
+        self.assertEqual(len(results), 4)
+        self.assertTrue(np.all(results['ues'] == 16))
+        self.assertTrue(np.all(results['objective'] > 0))
+        self.assertTrue(np.all(results['variables'] > 0))
+        for hist, edges in zip(results['mcs_hist'], results['edges']):
+            self.assertEqual(sum(int(count) for count in hist.split()), edges)
+
+        ## higher alpha costs more on the same positions
+        by_alpha = results.set_index(['seed', 'alpha'])['objective']
+        for seed in (0, 1):
+            self.assertLess(by_alpha[seed, 0.1], by_alpha[seed, 0.2])
+
+        streamed = pd.read_csv(os.path.join(self.dir, 'sweep.csv'))
+        self.assertEqual(len(streamed), 4)
+
+
+    def test_workers(self):
+        sequential = self.sweep().run()
+        parallel = self.sweep(workers=2, memory=4096).run()
+        key = ['seed', 'alpha']
+        np.testing.assert_allclose(
+            parallel.sort_values(key)['objective'].values,
+            sequential.sort_values(key)['objective'].values, rtol=1e-6)
+
+
+    def test_errors(self):
+        ## a run that fails is a row, the others still run
+        sweep = Sweep(['data/test'], seeds=(0,), alphas=('bad', 0.1), densities=(0.0001,),
+                      backend='highs', output=None, workdir=self.dir, memory=4096)
+        results = sweep.run().set_index('alpha')
+        self.assertTrue(results.loc['bad', 'status'].startswith('error: '))
+        self.assertGreater(results.loc[0.1, 'objective'], 0)
+
+
+    def test_read(self):
+        spec = os.path.join(self.dir, 'grid.sweep.ini')
+        with open(spec, 'w') as file:
+            file.write('[grid]\nscenario = data/test\nseed = 0-2\nalpha = 0.1, 0.3\n\n'
+                       '[runner]\nbackend = docplex\nworkers = 4\nmemory = 1024\n')
+        sweep = Sweep.read(spec)
+        self.assertEqual(len(sweep.runs()), 6)
+        self.assertEqual(sweep.workers, 4)
+        self.assertEqual(sweep.threads, max(1, (os.cpu_count() or 1) // 4))
+        self.assertEqual(sweep.memory, 1024)
+
+
+    def test_threads(self):
+        ## HiGHS cannot be held to a thread count, so it gets none
+        self.assertIsNone(self.sweep(workers=2).threads)
+        with self.assertRaises(ValueError):
+            self.sweep(workers=2, threads=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import io
+import os
+import json
+import unittest
+import tempfile
+import contextlib
+from model.savenet import *
+from model.network import *
+from model.connop import *
+from model.optimize import *
+from model.milp import HighsBackend
+from model.trace import Tracer
+
+
+class TestTracer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.net = NetworkData()
+        cls.net.conns = dict()
+        np.random.seed(0)
+        Load('data/test', force_init=True).execute(cls.net)
+        cls.net.ues = cls.net.ues.iloc[:6].copy()
+
+
+    def chain(self):
+        return (
+            DistanceCalc() &
+            DistanceWeight(1) &
+            FreeSpacePathloss() &
+            CalcMaxSnr() &
+            MinSnrFilter() &
+            Optimize(backend=HighsBackend(log_output=False))
+        )
+
+
+    def test_spans(self):
+        op = self.chain()
+        with Tracer() as tracer:
+            op.execute(self.net)
+
+        ops = tracer.spans('operation')
+        self.assertEqual([e['name'] for e in ops], [type(step).__name__ for step in op.plan()])
+        for e in ops:
+            self.assertGreaterEqual(e['dur'], 0)
+            self.assertGreaterEqual(e['args']['peak_memory'], 0)
+
+        optimize = ops[-1]
+        self.assertIn('conns.max_snr', optimize['args']['inputs'])
+        self.assertIn('conns.bandwidth', optimize['args']['outputs'])
+
+        phases = {e['name']: e for e in tracer.spans('phase')}
+        self.assertLessEqual({'max_interference', 'build', 'solve', 'extract'}, set(phases))
+        self.assertGreater(phases['build']['args']['variables'], 0)
+        self.assertGreater(phases['build']['args']['constraints'], 0)
+        for e in phases.values():
+            self.assertGreaterEqual(e['ts'], optimize['ts'])
+            self.assertLessEqual(e['ts'] + e['dur'], optimize['ts'] + optimize['dur'])
+
+
+    def test_exports(self):
+        with Tracer() as tracer:
+            self.chain().execute(self.net)
+
+        with tempfile.TemporaryDirectory() as dir:
+            tracer.save_json(os.path.join(dir, 'trace.json'))
+            tracer.save_chrome(os.path.join(dir, 'trace.chrome.json'))
+            with open(os.path.join(dir, 'trace.json')) as f:
+                events = json.load(f)
+            with open(os.path.join(dir, 'trace.chrome.json')) as f:
+                chrome = json.load(f)
+
+        self.assertEqual(len(events), len(tracer.events))
+        self.assertEqual(len(chrome['traceEvents']), len(events))
+        for e in chrome['traceEvents']:
+            self.assertIn(e['ph'], ('X', 'i'))
+            self.assertIn('ts', e)
+            if e['ph'] == 'X':
+                self.assertIn('cpu_us', e['args'])
+
+
+    def test_silent(self):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            self.chain().execute(self.net)
+        self.assertEqual(out.getvalue(), '')
+
+
+if __name__ == '__main__':
+    unittest.main()